@@ -19,7 +19,7 @@ from pyon.core.exception import ContainerConfigError, BadRequest, NotFound
 from pyon.ion.endpoint import ProcessRPCServer
 from pyon.ion.conversation import ConversationRPCServer
 from pyon.ion.stream import StreamPublisher, StreamSubscriber
-from pyon.ion.process import IonProcessThreadManager, IonProcessError
+from pyon.ion.process import IonProcessThreadManager, IonProcessError, shutdown_process_pool
 from pyon.net.messaging import IDPool
 from pyon.ion.service import BaseService
 from pyon.util.containers import DotDict, for_name, named_any, dict_merge, get_safe, is_valid_identifier
@@ -99,6 +99,7 @@ class ProcManager(object):
 
         # TODO: Have a choice of shutdown behaviors for waiting on children, timeouts, etc
         self.proc_sup.shutdown(CFG.cc.timeout.shutdown)
+        shutdown_process_pool()
 
         if self.procs:
             log.warn("ProcManager procs not empty: %s", self.procs)
@@ -130,7 +130,7 @@ def svc_defs(svcs=None, op=None):
     from pyon.core.bootstrap import get_service_registry
 
     if not getattr(svcs, '__iter__', False) and op is not None:
-        svcdef = get_service_registry().services[svcs]
+        svcdef = get_service_registry().get_service_by_name(svcs)
         print "Service definition for: %s (version %s) operation %s" % (svcs, svcdef.version or 'ND', op)
         print "".join([str(o) for o in svcdef.operations if o.name == op])
         return svcdef
@@ -139,7 +139,7 @@ def svc_defs(svcs=None, op=None):
         if not getattr(svcs, '__iter__', False):
             svcs = (svcs,)
         for svcname in svcs:
-            svcdef = get_service_registry().services[svcname]
+            svcdef = get_service_registry().get_service_by_name(svcname)
             svcops = "\n     ".join(sorted([o.name for o in svcdef.operations]))
             print "Service definition for: %s (version %s)" % (svcname, svcdef.version or 'ND')
             print "ops: %s" % (svcops)
@@ -149,6 +149,7 @@ def svc_defs(svcs=None, op=None):
         print "List of defined services"
         print "------------------------"
 
+        get_service_registry().load_all_services()
         for svcname in sorted(get_service_registry().services.keys()):
             svcdef = get_service_registry().services[svcname]
             print "%s %s" % (svcname, svcdef.version)
@@ -175,6 +175,8 @@ class ContainerSnapshot(object):
         gov_ctrl = self.container.governance_controller
         snap_result = gov_ctrl._get_policy_snapshot()
         snap_result["update_log"] = gov_ctrl._policy_update_log
+        if gov_ctrl.policy_decision_point_manager is not None:
+            snap_result["decision_cache"] = gov_ctrl.policy_decision_point_manager.get_decision_cache_stats()
 
         return snap_result
 
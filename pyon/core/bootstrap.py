@@ -170,22 +170,34 @@ def bootstrap_pyon(logging_config_override=None, pyon_cfg=None):
     set_config(pyon_cfg)
     log.debug("pyon: CFG set to %s", CFG)
 
+    # SNAPSHOT. Precompiled registry contents, if enabled and valid for the current interface files.
+    # The snapshot is built with the interfaces (generate_interfaces), never written at runtime
+    from pyon.core import registry_snapshot
+    snapshot_enabled = CFG.get_safe("system.registry_snapshot.enabled", True)
+    snapshot_path = CFG.get_safe("system.registry_snapshot.path", registry_snapshot.DEFAULT_SNAPSHOT_PATH)
+    snapshot = registry_snapshot.load_snapshot(snapshot_path) if snapshot_enabled else None
+    log.debug("pyon: registry snapshot %s", "loaded" if snapshot else "not used")
+
     # OBJECTS. Object and message definitions.
     from pyon.core.registry import IonObjectRegistry
     global _obj_registry
-    _obj_registry = IonObjectRegistry()
+    _obj_registry = IonObjectRegistry(snapshot)
 
     # SERVICES. Service definitions
-    # TODO: change the following to read service definitions from directory and import selectively
+    # TODO: change the following to read service definitions from directory
     from pyon.ion.service import IonServiceRegistry
     global _service_registry
     _service_registry = IonServiceRegistry()
-    _service_registry.load_service_mods('interface/services')
-    _service_registry.build_service_map()
+    if CFG.get_safe("system.lazy_service_registry", True):
+        # Service modules are imported on first use
+        _service_registry.index_service_mods('interface/services', snapshot)
+    else:
+        _service_registry.load_service_mods('interface/services')
+        _service_registry.build_service_map()
 
     # RESOURCES. Load and initialize definitions
     from pyon.ion import resource
-    resource.load_definitions()
+    resource.load_definitions(snapshot)
 
     # Set initialized flag
     pyon_initialized = True
@@ -100,9 +100,15 @@ def find_roles_by_actor(actor_id=None):
     if actor_id is None or not len(actor_id):
         raise BadRequest("The actor_id parameter is missing")
 
+    gov_controller = bootstrap.container_instance.governance_controller
+    role_cache = gov_controller.actor_role_cache
+    if role_cache is not None:
+        role_dict = role_cache.get(actor_id)
+        if role_dict is not None:
+            return dict((org_name, list(roles)) for org_name, roles in role_dict.iteritems())
+
     role_dict = dict()
 
-    gov_controller = bootstrap.container_instance.governance_controller
     role_list,_ = gov_controller.rr.find_objects(actor_id, PRED.hasRole, RT.UserRole)
 
     for role in role_list:
@@ -118,6 +124,8 @@ def find_roles_by_actor(actor_id=None):
 
     role_dict[gov_controller.system_root_org_name].append(ORG_MEMBER_ROLE)
 
+    if role_cache is not None:
+        role_cache.put(actor_id, dict((org_name, list(roles)) for org_name, roles in role_dict.iteritems()))
 
     return role_dict
 
@@ -205,7 +213,13 @@ def get_valid_resource_commitments(resource_id=None, actor_id=None):
 
     try:
         gov_controller = bootstrap.container_instance.governance_controller
-        commitments,_ = gov_controller.rr.find_objects(resource_id, PRED.hasCommitment, RT.Commitment)
+        # All commitments of the resource are cached; expiration and actor are checked below on each call
+        commitment_cache = gov_controller.commitment_cache
+        commitments = commitment_cache.get(resource_id) if commitment_cache is not None else None
+        if commitments is None:
+            commitments,_ = gov_controller.rr.find_objects(resource_id, PRED.hasCommitment, RT.Commitment)
+            if commitment_cache is not None:
+                commitment_cache.put(resource_id, commitments)
         if not commitments:
             return None
 
@@ -5,6 +5,7 @@ __author__ = 'Stephen P. Henrie'
 
 
 import os
+import time
 from pyon.core.governance.governance_interceptor import BaseInternalGovernanceInterceptor
 from pyon.core.governance.governance_dispatcher import GovernanceDispatcher
 from pyon.util.log import log
@@ -12,7 +13,7 @@ from pyon.ion.conversation import MSG_TYPE, MSG_TYPE_MASKS
 from parsing.base_parser import ANTLRScribbleParser
 from core.transition import TransitionFactory
 from core.local_type import LocalType
-from core.fsm import FSM, ExceptionFSM
+from core.fsm import FSM, FSMTemplate, ExceptionFSM
 from core.conversation_context import ConversationContext
 
 class ConversationProvider(object):
@@ -20,6 +21,11 @@ class ConversationProvider(object):
     def get_protocol_mapping(cls, op):
         return {'request': op}
 
+# Time (ms) a conversation context is kept if the message has no reply-by header
+DEFAULT_CONVERSATION_TTL = 60000
+# Minimum time (ms) between sweeps for stale conversation contexts
+EVICTION_INTERVAL = 5000
+
 # The current interceptor can monitor only one conversation at a time for a given principal
 class ConversationMonitorInterceptor(BaseInternalGovernanceInterceptor):
     def __init__(self):
@@ -28,7 +34,15 @@ class ConversationMonitorInterceptor(BaseInternalGovernanceInterceptor):
         #map principal to conversation_context
         self.conversation_context = {}
         self.parsed_conversation_protocols = {}
+        # map role spec to compiled FSMTemplate (None if the protocol cannot be compiled)
+        self.protocol_templates = {}
         self.parser = ANTLRScribbleParser()
+        self.conversation_ttl = DEFAULT_CONVERSATION_TTL
+        self._next_eviction = 0
+
+    def configure(self, config):
+        if "conversation_ttl" in config:
+            self.conversation_ttl = int(config["conversation_ttl"])
 
     def _initialize_conversation_for_monitoring(self):
         #self.conversations_for_monitoring = {'bank':{'buy_bonds':'bank/local/BuyBonds_Bank.srt',
@@ -106,15 +120,52 @@ class ConversationMonitorInterceptor(BaseInternalGovernanceInterceptor):
         return ConversationContext(builder, cid, [self_principal, target_principal], mapping)
     '''
 
-    def _initialize_conversation_context(self, cid, role_spec, self_principal, target_principal, op):
+    def _initialize_conversation_context(self, cid, role_spec, self_principal, target_principal, op, expires=None):
 
         #Cache the parsing of static protocol specifications
         if not self.parsed_conversation_protocols.has_key(self_principal):
             self.parsed_conversation_protocols[self_principal] = self.parser.parse(os.path.join(self.spec_path,role_spec))
 
-        builder = self.parser.walk(self.parsed_conversation_protocols[self_principal])
         mapping = ConversationProvider.get_protocol_mapping(op)
-        return ConversationContext(builder, cid, [self_principal, target_principal], mapping)
+        template = self._get_protocol_template(self_principal, role_spec)
+        if template is not None:
+            return ConversationContext(None, cid, [self_principal, target_principal], mapping,
+                                       template=template, expires=expires)
+
+        builder = self.parser.walk(self.parsed_conversation_protocols[self_principal])
+        return ConversationContext(builder, cid, [self_principal, target_principal], mapping, expires=expires)
+
+    def _get_protocol_template(self, self_principal, role_spec):
+        """
+        Returns the compiled FSMTemplate for given protocol spec, walking the parse tree only once.
+        Returns None for protocols that cannot be compiled (e.g. with parallel branches).
+        """
+        if role_spec not in self.protocol_templates:
+            builder = self.parser.walk(self.parsed_conversation_protocols[self_principal])
+            try:
+                self.protocol_templates[role_spec] = FSMTemplate(builder.main_fsm.fsm, builder.roles)
+            except ExceptionFSM as ex:
+                log.debug("Cannot compile conversation protocol %s: %s", role_spec, ex)
+                self.protocol_templates[role_spec] = None
+        return self.protocol_templates[role_spec]
+
+    def _get_conversation_expiry(self, invocation, now):
+        reply_by = invocation.get_header_value('reply-by', None)
+        try:
+            return int(reply_by)
+        except (TypeError, ValueError):
+            return now + self.conversation_ttl
+
+    def _evict_stale_contexts(self, now):
+        """Removes conversation contexts past their reply-by time, e.g. for timed out RPC requests"""
+        if now < self._next_eviction:
+            return
+        self._next_eviction = now + EVICTION_INTERVAL
+        stale_keys = [key for key, context in self.conversation_context.iteritems() if context.is_expired(now)]
+        for key in stale_keys:
+            del self.conversation_context[key]
+        if stale_keys:
+            log.debug("Evicted %s stale conversation contexts", len(stale_keys))
 
 
     def _get_control_conv_msg(self, invocation):
@@ -128,6 +179,8 @@ class ConversationMonitorInterceptor(BaseInternalGovernanceInterceptor):
         cid = invocation.get_header_value('conv-id', 0)
         conv_seq = invocation.get_header_value('conv-seq', 0)
         conversation_key = self._get_conversation_context_key(self_principal,  invocation)
+        now = int(time.time() * 1000)
+        self._evict_stale_contexts(now)
 
         # INITIALIZE FSM
         if ((conv_seq == 1 and self._should_be_monitored(invocation, self_principal, operation)) and
@@ -139,7 +192,8 @@ class ConversationMonitorInterceptor(BaseInternalGovernanceInterceptor):
             else:
                 conversation_context = self._initialize_conversation_context(cid, role_spec,
                                                                         self_principal, target_principal,
-                                                                        operation)
+                                                                        operation,
+                                                                        self._get_conversation_expiry(invocation, now))
                 if conversation_context: self.conversation_context[conversation_key] = conversation_context
 
         # CHECK
@@ -5,18 +5,29 @@ __author__ = 'Rumyana Neykova'
 
 
 class ConversationContext(object):
-    def __init__(self, builder, conv_id, principals, op_mapping):
+    def __init__(self, builder, conv_id, principals, op_mapping, template=None, expires=None):
         self.builder = builder
-        self.builder.main_fsm.fsm.reset()
-        self.unset_roles = iter(self.builder.roles)
-        self.builder.main_fsm.fsm.instantiate_generics(op_mapping)
+        if template is not None:
+            # Cheap per conversation cursor over a precompiled FSM
+            self.fsm = template.instantiate(op_mapping)
+            self.unset_roles = iter(template.roles)
+        else:
+            self.fsm = self.builder.main_fsm.fsm
+            self.fsm.reset()
+            self.unset_roles = iter(self.builder.roles)
+            self.fsm.instantiate_generics(op_mapping)
         # principal -> role
         self.role_mapper = {}
         self.conv_id = conv_id
+        # Time (ms) after which the conversation is considered stale
+        self.expires = expires
         #[self.set_default_role_mapping(principal) for principal in principals]
 
     def get_fsm(self):
-        return self.builder.main_fsm.fsm
+        return self.fsm
+
+    def is_expired(self, now):
+        return self.expires is not None and now >= self.expires
 
     def get_conversation_id(self):
         return self.conv_id
@@ -377,3 +377,105 @@ class FSM:
         return "<transition_table:%s;memory: %s>" %(self.state_transitions, self.memory.__repr__())
     def __repr__(self):
         return "<transition_table:%s;memory: %s>" %(self.state_transitions, self.memory.__repr__())
+
+
+class FSMTemplate(object):
+    """
+    Compiled, table-driven form of a fully built FSM for a protocol specification.
+    The template is immutable and shared; instantiate() returns a small FSMCursor per conversation.
+    Only FSMs without parallel branches (memory) can be compiled; assertion actions are not evaluated.
+    """
+
+    def __init__(self, fsm, roles=None):
+        if any(fsm.memory.itervalues()):
+            raise ExceptionFSM('Cannot compile FSM with parallel branches')
+        self.roles = list(roles or [])
+        self.initial_state = fsm.initial_state
+        self.final_state = fsm.final_state
+        self.end_states = frozenset(fsm.end_states)
+        self.interrupt_trigger = str(fsm.interrupt_transition) if fsm.interrupt_transition is not None else None
+        self.interrupt_start_state = fsm.interrupt_start_state
+        self.any_transitions = dict((state, trans[2]) for state, trans in fsm.state_transitions_any.iteritems())
+        self.default_state = fsm.default_transition[2] if fsm.default_transition is not None else None
+
+        # Follow EMPTY transitions once here instead of on every message
+        empty_next = dict((state, trans[2]) for (symbol, state), trans in fsm.state_transitions.iteritems()
+                          if symbol == fsm.EMPTY_TRANSITION)
+        states = set(state for (symbol, state) in fsm.state_transitions) | set(empty_next.itervalues())
+        states.add(self.initial_state)
+        self.resolved_states = {}
+        self.end_state_check = {}
+        for state in states:
+            self.resolved_states[state] = self._follow_empty(empty_next, state)
+            self.end_state_check[state] = self._follow_empty(empty_next, state, self.end_states) in self.end_states
+
+        # Map (trigger, state) -> next_state. Generic triggers are kept separately for instantiation
+        self.transitions = {}
+        self.generic_triggers = {}
+        for (symbol, state), trans in fsm.state_transitions.iteritems():
+            if symbol == fsm.EMPTY_TRANSITION:
+                continue
+            self.transitions[(symbol, state)] = trans[2]
+            for generic in fsm.generics:
+                if '_%s_' % generic in symbol:
+                    self.generic_triggers[symbol] = (DefaultTransition.create_from_string(symbol), generic)
+                    break
+
+    @staticmethod
+    def _follow_empty(empty_next, state, stop_states=()):
+        visited = set()
+        while state in empty_next and state not in stop_states and state not in visited:
+            visited.add(state)
+            state = empty_next[state]
+        return state
+
+    def instantiate(self, op_mapping=None):
+        """Returns a new FSMCursor in the initial state with generic triggers bound per op_mapping"""
+        aliases = {}
+        op_mapping = op_mapping or {}
+        for symbol, (transition, generic) in self.generic_triggers.iteritems():
+            if generic in op_mapping:
+                new_transition = DefaultTransition(transition.lt_type, op_mapping[generic], transition.role)
+                aliases[new_transition.get_trigger()] = symbol
+            else:
+                aliases[symbol] = symbol
+        return FSMCursor(self, aliases)
+
+
+class FSMCursor(object):
+    """
+    Per conversation state of an FSMTemplate. Has the process/test_for_end_state interface of FSM
+    as used by the conversation monitor.
+    """
+    __slots__ = ('template', 'aliases', 'current_state')
+
+    def __init__(self, template, aliases=None):
+        self.template = template
+        self.aliases = aliases or {}
+        self.current_state = template.initial_state
+
+    def reset(self):
+        self.current_state = self.template.initial_state
+
+    def process(self, input_transition, payload=None):
+        template = self.template
+        if self.current_state == template.final_state:
+            raise ExceptionFSM('What are you sending?The communication has finished.')
+
+        trigger = str(input_transition)
+        if template.interrupt_trigger is not None and trigger == template.interrupt_trigger:
+            self.current_state = template.interrupt_start_state
+
+        state = template.resolved_states.get(self.current_state, self.current_state)
+        symbol = self.aliases.get(trigger, None)
+        if symbol is None and trigger not in template.generic_triggers:
+            symbol = trigger
+        next_state = template.transitions.get((symbol, state), None)
+        if next_state is None:
+            next_state = template.any_transitions.get(state, template.default_state)
+        if next_state is None:
+            raise ExceptionFSM('Transition is undefined: (%s, %s).' % (trigger, str(state)))
+        self.current_state = next_state
+
+    def test_for_end_state(self, state):
+        return self.template.end_state_check.get(state, state in self.template.end_states)
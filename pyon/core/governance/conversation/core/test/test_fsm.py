@@ -1,7 +1,8 @@
 __author__ = 'rn710'
 import unittest
 from pyon.core.governance.conversation.core.fsm import FSM
-from pyon.core.governance.conversation.core.fsm import ExceptionFSM
+from pyon.core.governance.conversation.core.fsm import ExceptionFSM, FSMTemplate
+from pyon.core.governance.conversation.core.conversation_context import ConversationContext
 from collections import deque
 from pyon.util.unit_test import PyonTestCase
 from pyon.util.log import log
@@ -87,6 +88,66 @@ class TestFSM(PyonTestCase):
         log.debug("test_get_normal_transition_when_there_is_no_match_but_such_transition_exist:%s", fsm.memory)
         self.assertEqual(fsm.memory, {2:[]})
         self.assertEqual(next_state, 2)
+
+    def get_rpc_fsm(self):
+        fsm = FSM(1)
+        fsm.add_transition('RESV_request_requester', 1, 2)
+        fsm.add_transition(fsm.EMPTY_TRANSITION, 2, 3)
+        fsm.add_transition('SEND_accept_requester', 3, 4)
+        fsm.add_transition('SEND_inform_requester', 4, 5)
+        fsm.add_transition('SEND_failure_requester', 4, 5)
+        fsm.add_transition('SEND_reject_requester', 3, 5)
+        return fsm
+
+    def test_template(self):
+        template = FSMTemplate(self.get_rpc_fsm(), ['requester', 'provider'])
+        self.assertEqual(template.roles, ['requester', 'provider'])
+
+        # Cursors follow the same transitions as the instantiated FSM
+        sequences = [['RESV_my_op_requester', 'SEND_accept_requester', 'SEND_inform_requester'],
+                     ['RESV_my_op_requester', 'SEND_reject_requester'],
+                     ['RESV_my_op_requester', 'SEND_inform_requester'],
+                     ['RESV_request_requester'],
+                     ['RESV_other_op_requester']]
+        for events in sequences:
+            fsm = self.get_rpc_fsm()
+            fsm.instantiate_generics({'request': 'my_op'})
+            cursor = template.instantiate({'request': 'my_op'})
+            for event in events:
+                fsm_error = cursor_error = None
+                try:
+                    fsm.process(event)
+                except ExceptionFSM as ex:
+                    fsm_error = ex.value
+                try:
+                    cursor.process(event)
+                except ExceptionFSM as ex:
+                    cursor_error = ex.value
+                self.assertEqual(cursor_error, fsm_error)
+                if fsm_error:
+                    break
+                self.assertEqual(cursor.current_state, fsm.current_state)
+                self.assertEqual(cursor.test_for_end_state(cursor.current_state),
+                                 fsm.test_for_end_state(fsm.current_state))
+
+        # Cursors are independent of each other
+        cursor1 = template.instantiate({'request': 'op1'})
+        cursor2 = template.instantiate({'request': 'op2'})
+        cursor1.process('RESV_op1_requester')
+        self.assertEqual(cursor1.current_state, 2)
+        self.assertEqual(cursor2.current_state, 1)
+        self.assertRaises(ExceptionFSM, cursor2.process, 'RESV_op1_requester')
+
+        context = ConversationContext(None, 'conv1', ['p1', 'p2'], {'request': 'op1'}, template=template, expires=1000)
+        self.assertEqual(context.get_fsm().current_state, 1)
+        self.assertEqual(context.get_role_by_principal('p1'), 'requester')
+        self.assertFalse(context.is_expired(999))
+        self.assertTrue(context.is_expired(1000))
+
+        # Parallel branches are not supported
+        fsm = FSM(1)
+        fsm.add_fsm_to_memory(1, self.get_test_fsm())
+        self.assertRaises(ExceptionFSM, FSMTemplate, fsm)
 """
 def test_nested_transition_for_first_time(self):
     # Test set_up
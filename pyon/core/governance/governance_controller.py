@@ -16,10 +16,17 @@ from pyon.ion.event import EventSubscriber
 from pyon.core.exception import NotFound, Unauthorized
 from pyon.container.procs import SERVICE_PROCESS_TYPE, AGENT_PROCESS_TYPE
 from pyon.util.containers import get_ion_ts, DictDiffer
+from pyon.util.cache import LRUTTLCache
 
 from interface.services.coi.ipolicy_management_service import PolicyManagementServiceProcessClient
 from interface.services.coi.iresource_registry_service import ResourceRegistryServiceProcessClient
 
+# OrgEvent types that change the roles of an actor or the commitments on a resource
+ROLE_EVENT_TYPES = {"UserRoleGrantedEvent", "UserRoleRevokedEvent",
+                    "OrgMembershipGrantedEvent", "OrgMembershipCancelledEvent"}
+COMMITMENT_EVENT_TYPES = {"ResourceCommitmentCreatedEvent", "ResourceCommitmentReleasedEvent"}
+
+
 class GovernanceController(object):
     """
     This is a singleton object which handles governance functionality in the container.
@@ -31,6 +38,9 @@ class GovernanceController(object):
         self.enabled = False
         self.interceptor_by_name_dict = dict()
         self.interceptor_order = []
+        # Bound interceptor methods in call order, compiled from interceptor_order
+        self._incoming_interceptors = []
+        self._outgoing_interceptors = []
         self.policy_decision_point_manager = None
         self.governance_dispatcher = None
 
@@ -45,6 +55,17 @@ class GovernanceController(object):
         self._policy_update_log = []
         self._policy_snapshot = None
 
+        # Optional caches of actor roles by actor id and commitments by resource id, invalidated by Org events
+        cache_cfg = CFG.get_safe("container.governance.actor_cache") or {}
+        self.actor_role_cache = None
+        self.commitment_cache = None
+        if cache_cfg.get("enabled", False):
+            cache_size = int(cache_cfg.get("size", 5000))
+            cache_ttl = float(cache_cfg.get("ttl", 300.0))
+            self.actor_role_cache = LRUTTLCache(max_size=cache_size, ttl=cache_ttl)
+            self.commitment_cache = LRUTTLCache(max_size=cache_size, ttl=cache_ttl)
+        self.org_event_subscriber = None
+
     def start(self):
 
         log.debug("GovernanceController starting ...")
@@ -68,6 +89,10 @@ class GovernanceController(object):
         self.system_actor_id = None
         self.system_actor_user_header = None
 
+        if self.actor_role_cache is not None:
+            self.org_event_subscriber = EventSubscriber(event_type="OrgEvent", callback=self.org_event_callback)
+            self.org_event_subscriber.start()
+
         if self.enabled:
 
             config = CFG.get_safe('interceptor.interceptors.governance.config')
@@ -105,16 +130,25 @@ class GovernanceController(object):
                 module = __import__(modpath, fromlist=[classname])
                 classobj = getattr(module, classname)
                 classinst = classobj()
+                classinst.configure(interceptor_def.get("config", None) or {})
 
                 # Put in by_name_dict for possible re-use
                 self.interceptor_by_name_dict[name] = classinst
 
+        interceptor_list = [self.interceptor_by_name_dict[int_name] for int_name in self.interceptor_order]
+        self._incoming_interceptors = [class_inst.incoming for class_inst in interceptor_list]
+        self._outgoing_interceptors = [class_inst.outgoing for class_inst in reversed(interceptor_list)]
+
     def stop(self):
         log.debug("GovernanceController stopping ...")
 
         if self.policy_event_subscriber is not None:
             self.policy_event_subscriber.stop()
 
+        if self.org_event_subscriber is not None:
+            self.org_event_subscriber.stop()
+            self.org_event_subscriber = None
+
 
     @property
     def is_container_org_boundary(self):
@@ -175,7 +209,7 @@ class GovernanceController(object):
         @param invocation:
         @return:
         """
-        self.process_message(invocation, self.interceptor_order,'incoming' )
+        self._process_interceptors(invocation, self._incoming_interceptors)
         return self.governance_dispatcher.handle_incoming_message(invocation)
 
     def process_outgoing_message(self,invocation):
@@ -184,7 +218,7 @@ class GovernanceController(object):
         @param invocation:
         @return:
         """
-        self.process_message(invocation, reversed(self.interceptor_order),'outgoing')
+        self._process_interceptors(invocation, self._outgoing_interceptors)
         return self.governance_dispatcher.handle_outgoing_message(invocation)
 
     def process_message(self,invocation,interceptor_list, method):
@@ -197,13 +231,20 @@ class GovernanceController(object):
         @param method:
         @return:
         """
-        for int_name in interceptor_list:
-            class_inst = self.interceptor_by_name_dict[int_name]
-            getattr(class_inst, method)(invocation)
+        funcs = [getattr(self.interceptor_by_name_dict[int_name], method) for int_name in interceptor_list]
+        return self._process_interceptors(invocation, funcs)
+
+    def _process_interceptors(self, invocation, funcs):
+        """
+        Calls the given bound interceptor methods in order until one of them rejects the message
+        """
+        annotations = invocation.message_annotations
+        for func in funcs:
+            func(invocation)
 
             #Stop processing message if an issue with the message was found by an interceptor.
-            if ( invocation.message_annotations.has_key(GovernanceDispatcher.CONVERSATION__STATUS_ANNOTATION) and invocation.message_annotations[GovernanceDispatcher.CONVERSATION__STATUS_ANNOTATION] == GovernanceDispatcher.STATUS_REJECT) or\
-               ( invocation.message_annotations.has_key(GovernanceDispatcher.POLICY__STATUS_ANNOTATION) and invocation.message_annotations[GovernanceDispatcher.POLICY__STATUS_ANNOTATION] == GovernanceDispatcher.STATUS_REJECT) :
+            if annotations.get(GovernanceDispatcher.CONVERSATION__STATUS_ANNOTATION) == GovernanceDispatcher.STATUS_REJECT or \
+                    annotations.get(GovernanceDispatcher.POLICY__STATUS_ANNOTATION) == GovernanceDispatcher.STATUS_REJECT:
                 break
 
         return invocation
@@ -273,6 +314,31 @@ class GovernanceController(object):
             self.update_common_service_access_policy()
 
 
+    def org_event_callback(self, org_event, *args, **kwargs):
+        """
+        The OrgEvent handler. Invalidates cached actor roles and resource commitments
+        """
+        if org_event.type_ in ROLE_EVENT_TYPES:
+            actor_id = getattr(org_event, "actor_id", None)
+            log.debug("Actor roles changed for actor %s", actor_id)
+            if actor_id:
+                self.actor_role_cache.pop(actor_id)
+            else:
+                self.actor_role_cache.clear()
+        elif org_event.type_ in COMMITMENT_EVENT_TYPES:
+            # Commitments are associated with the resource and the Org; changes are rare
+            log.debug("Resource commitments changed in Org %s", org_event.origin)
+            self.commitment_cache.clear()
+
+    def get_cache_stats(self):
+        """
+        Returns hit/miss statistics of the actor role and commitment caches or None if disabled.
+        """
+        if self.actor_role_cache is None:
+            return None
+        return dict(actor_roles=self.actor_role_cache.get_stats(),
+                    commitments=self.commitment_cache.get_stats())
+
     def reset_policy_cache(self):
         """
         The function to empty and reload the container's policy caches
@@ -298,6 +364,9 @@ class GovernanceController(object):
     def _reset_container_policy_caches(self):
         self.policy_decision_point_manager.clear_policy_cache()
         self.unregister_all_process_policy_preconditions()
+        if self.actor_role_cache is not None:
+            self.actor_role_cache.clear()
+            self.commitment_cache.clear()
 
     def _get_policy_snapshot(self):
         policy_snap = {}
@@ -40,6 +40,9 @@ class GovernanceInterceptor(BaseInternalGovernanceInterceptor):
 
         log.debug("GovernanceInterceptor enabled: %s" % str(self.enabled))
 
+    def is_noop(self, path):
+        return not getattr(self, "enabled", True)
+
 
     def outgoing(self,invocation):
 
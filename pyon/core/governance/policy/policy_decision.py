@@ -6,6 +6,7 @@ __author__ = 'Stephen P. Henrie'
 
 
 from os import path
+import re
 from StringIO import StringIO
 
 from ndg.xacml.parsers.etree.factory import ReaderFactory
@@ -23,11 +24,12 @@ from ndg.xacml.core.context.action import Action
 from ndg.xacml.core.context.environment import Environment
 from ndg.xacml.core.context.pdp import PDP
 from ndg.xacml.core.context.result import Decision
-from pyon.core.bootstrap import IonObject
+from pyon.core.bootstrap import IonObject, CFG
 from pyon.core.exception import NotFound
 from pyon.core.governance import ION_MANAGER
 from pyon.core.registry import is_ion_object, message_classes, get_class_decorator_value
 from pyon.core.governance.governance_dispatcher import GovernanceDispatcher
+from pyon.util.cache import LRUTTLCache
 
 from pyon.util.log import log
 
@@ -43,6 +45,13 @@ RECEIVER_TYPE = XACML_1_0_PREFIX + 'resource:receiver-type'
 ACTION_VERB = XACML_1_0_PREFIX + 'action:action-verb'
 ACTION_PARAMETERS = XACML_1_0_PREFIX + 'action:param-dict'
 
+# Request attributes that decisions can be cached by. Policies referencing any other attribute
+# (e.g. the message parameter dict) or using attribute selectors are always evaluated.
+CACHEABLE_ATTRIBUTES = frozenset([SENDER_ID, Identifiers.Subject.SUBJECT_ID, ROLE_ATTRIBUTE_ID,
+                                  Identifiers.Resource.RESOURCE_ID, RECEIVER_TYPE,
+                                  Identifiers.Action.ACTION_ID, ACTION_VERB])
+ATTRIBUTE_ID_RE = re.compile(r"""AttributeId\s*=\s*["']([^"']+)["']""")
+
 DICT_TYPE_URI = AttributeValue.IDENTIFIER_PREFIX + 'dict'
 OBJECT_TYPE_URI = AttributeValue.IDENTIFIER_PREFIX + 'object'
 
@@ -59,8 +68,17 @@ class PolicyDecisionPointManager(object):
     def __init__(self, governance_controller):
         self.resource_policy_decision_point = dict()
         self.service_policy_decision_point = dict()
+        # Maps PDP to the set of request attribute ids its policy references, or None if not cacheable
+        self.pdp_cache_attributes = dict()
+
+        cache_cfg = CFG.get_safe("container.governance.decision_cache") or {}
+        self.decision_cache = None
+        if cache_cfg.get("enabled", True):
+            self.decision_cache = LRUTTLCache(max_size=int(cache_cfg.get("size", 10000)),
+                                              ttl=float(cache_cfg.get("ttl", 0)))
 
         self.empty_pdp = PDP.fromPolicySource(path.join(THIS_DIR, XACML_EMPTY_POLICY_FILENAME), ReaderFactory)
+        self.pdp_cache_attributes[self.empty_pdp] = frozenset()
         self.load_common_service_policy_rules('')
 
         self.governance_controller = governance_controller
@@ -175,11 +193,34 @@ class PolicyDecisionPointManager(object):
     def list_service_policies(self):
         return self.service_policy_decision_point.keys()
 
+    def _create_pdp(self, policy_text):
+        pdp = PDP.fromPolicySource(StringIO(policy_text), ReaderFactory)
+        self.pdp_cache_attributes[pdp] = self._get_cache_attributes(policy_text)
+        self.flush_decision_cache()
+        return pdp
+
+    def _remove_pdp(self, pdp):
+        self.pdp_cache_attributes.pop(pdp, None)
+        self.flush_decision_cache()
+
+    def _get_cache_attributes(self, policy_text):
+        """
+        Returns the set of request attribute ids referenced by the given policy text, or None if decisions
+        for this policy cannot be cached because they depend on other request content.
+        """
+        if "AttributeSelector" in policy_text:
+            return None
+        attribute_ids = frozenset(ATTRIBUTE_ID_RE.findall(policy_text))
+        if not attribute_ids.issubset(CACHEABLE_ATTRIBUTES):
+            return None
+        return attribute_ids
+
     def load_common_service_policy_rules(self, rules_text):
 
         self.common_service_rules = rules_text
-        input_source = StringIO(self.create_policy_from_rules(COMMON_SERVICE_POLICY_RULES, rules_text))
-        self.load_common_service_pdp = PDP.fromPolicySource(input_source, ReaderFactory)
+        if getattr(self, "load_common_service_pdp", None) is not None:
+            self._remove_pdp(self.load_common_service_pdp)
+        self.load_common_service_pdp = self._create_pdp(self.create_policy_from_rules(COMMON_SERVICE_POLICY_RULES, rules_text))
 
     def load_service_policy_rules(self, service_name, rules_text):
 
@@ -192,8 +233,7 @@ class PolicyDecisionPointManager(object):
         service_rule_set = self.common_service_rules + rules_text
 
         #Simply create a new PDP object for the service
-        input_source = StringIO(self.create_policy_from_rules(service_name, service_rule_set))
-        self.service_policy_decision_point[service_name] = PDP.fromPolicySource(input_source, ReaderFactory)
+        self.service_policy_decision_point[service_name] = self._create_pdp(self.create_policy_from_rules(service_name, service_rule_set))
 
     def load_resource_policy_rules(self, resource_key, rules_text):
 
@@ -206,24 +246,39 @@ class PolicyDecisionPointManager(object):
         self.clear_resource_policy(resource_key)
 
         #Simply create a new PDP object for the service
-        input_source = StringIO(self.create_resource_policy_from_rules(resource_key, rules_text))
-        self.resource_policy_decision_point[resource_key] = PDP.fromPolicySource(input_source, ReaderFactory)
+        self.resource_policy_decision_point[resource_key] = self._create_pdp(self.create_resource_policy_from_rules(resource_key, rules_text))
 
     #Remove any policy indexed by the resource_key
     def clear_resource_policy(self, resource_key):
         if self.resource_policy_decision_point.has_key(resource_key):
-            del self.resource_policy_decision_point[resource_key]
+            self._remove_pdp(self.resource_policy_decision_point.pop(resource_key))
 
     #Remove any policy indexed by the service_name
     def clear_service_policy(self, service_name):
         if self.service_policy_decision_point.has_key(service_name):
-            del self.service_policy_decision_point[service_name]
+            self._remove_pdp(self.service_policy_decision_point.pop(service_name))
 
     #Remove all policies
     def clear_policy_cache(self):
+        for pdp in self.resource_policy_decision_point.values() + self.service_policy_decision_point.values():
+            self.pdp_cache_attributes.pop(pdp, None)
         self.resource_policy_decision_point.clear()
         self.service_policy_decision_point.clear()
         self.load_common_service_policy_rules('')
+        self.flush_decision_cache()
+
+    #Remove all cached decisions. Called whenever a PDP is added or removed
+    def flush_decision_cache(self):
+        if self.decision_cache is not None:
+            self.decision_cache.clear()
+
+    def get_decision_cache_stats(self):
+        """
+        Returns hit/miss statistics of the policy decision cache or None if the cache is disabled.
+        """
+        if self.decision_cache is None:
+            return None
+        return self.decision_cache.get_stats()
 
 
     def create_attribute(self, attrib_class, attrib_id, val):
@@ -266,23 +321,13 @@ class PolicyDecisionPointManager(object):
         if attribute is not None:
             subject.attributes.append(attribute)
 
-    def _create_request_from_message(self, invocation, receiver, receiver_type='service'):
-
-        sender, sender_type = invocation.get_message_sender()
-        op = invocation.get_header_value('op', 'Unknown')
-        ion_actor_id = invocation.get_header_value('ion-actor-id', 'anonymous')
+    def _get_request_roles(self, invocation, endpoint_process):
+        """
+        Returns the lists of actor roles (one list per Org) that apply to the request
+        """
         actor_roles = invocation.get_header_value('ion-actor-roles', {})
-        message_format = invocation.get_header_value('format', '')
-
-        #log.debug("Checking XACML Request: receiver_type: %s, sender: %s, receiver:%s, op:%s,  ion_actor_id:%s, ion_actor_roles:%s", receiver_type, sender, receiver, op, ion_actor_id, actor_roles)
-
-        request = Request()
-        subject = Subject()
-        subject.attributes.append(self.create_string_attribute(SENDER_ID, sender))
-        subject.attributes.append(self.create_string_attribute(Identifiers.Subject.SUBJECT_ID, ion_actor_id))
 
         #Get the Org name associated with the endpoint process
-        endpoint_process = invocation.get_arg_value('process', None)
         if endpoint_process is not None and hasattr(endpoint_process,'org_governance_name'):
             org_governance_name = endpoint_process.org_governance_name
         else:
@@ -290,22 +335,52 @@ class PolicyDecisionPointManager(object):
 
         #If this process is not associated wiht the root Org, then iterate over the roles associated with the user only for
         #the Org that this process is associated with otherwise include all roles and create attributes for each
+        request_roles = []
         if org_governance_name == self.governance_controller.system_root_org_name:
             #log.debug("Including roles for all Orgs")
             #If the process Org name is the same for the System Root Org, then include all of them to be safe
             for org in actor_roles:
-                self.create_org_role_attribute(actor_roles[org],subject)
+                request_roles.append(actor_roles[org])
         else:
             if actor_roles.has_key(org_governance_name):
                 log.debug("Org Roles (%s): %s" , org_governance_name, ' '.join(actor_roles[org_governance_name]))
-                self.create_org_role_attribute(actor_roles[org_governance_name],subject)
+                request_roles.append(actor_roles[org_governance_name])
 
             #Handle the special case for the ION system actor
             if actor_roles.has_key(self.governance_controller.system_root_org_name):
                 if ION_MANAGER in actor_roles[self.governance_controller.system_root_org_name]:
                     log.debug("Including ION_MANAGER role")
-                    self.create_org_role_attribute([ION_MANAGER],subject)
+                    request_roles.append([ION_MANAGER])
+
+        return request_roles
+
+    def _get_operation_verb(self, invocation):
+        #Check to see if there is a OperationVerb decorator specifying a Verb used with policy
+        message_format = invocation.get_header_value('format', '')
+        if is_ion_object(message_format):
+            try:
+                msg_class = message_classes[message_format]
+                return get_class_decorator_value(msg_class,'OperationVerb')
+            except NotFound:
+                pass
+        return None
+
+    def _create_request_from_message(self, invocation, receiver, receiver_type='service'):
 
+        sender, sender_type = invocation.get_message_sender()
+        op = invocation.get_header_value('op', 'Unknown')
+        ion_actor_id = invocation.get_header_value('ion-actor-id', 'anonymous')
+
+        #log.debug("Checking XACML Request: receiver_type: %s, sender: %s, receiver:%s, op:%s,  ion_actor_id:%s", receiver_type, sender, receiver, op, ion_actor_id)
+
+        request = Request()
+        subject = Subject()
+        subject.attributes.append(self.create_string_attribute(SENDER_ID, sender))
+        subject.attributes.append(self.create_string_attribute(Identifiers.Subject.SUBJECT_ID, ion_actor_id))
+
+        endpoint_process = invocation.get_arg_value('process', None)
+        for roles in self._get_request_roles(invocation, endpoint_process):
+            self.create_org_role_attribute(roles, subject)
 
         request.subjects.append(subject)
 
@@ -318,17 +393,9 @@ class PolicyDecisionPointManager(object):
         request.action = Action()
         request.action.attributes.append(self.create_string_attribute(Identifiers.Action.ACTION_ID, op))
 
-        #Check to see if there is a OperationVerb decorator specifying a Verb used with policy
-        if is_ion_object(message_format):
-            try:
-                msg_class = message_classes[message_format]
-                operation_verb = get_class_decorator_value(msg_class,'OperationVerb')
-                if operation_verb is not None:
-                    request.action.attributes.append(self.create_string_attribute(ACTION_VERB, operation_verb))
-
-            except NotFound:
-
-                pass
+        operation_verb = self._get_operation_verb(invocation)
+        if operation_verb is not None:
+            request.action.attributes.append(self.create_string_attribute(ACTION_VERB, operation_verb))
 
         #Create generic attributes for each of the primitive message parameter types to be available in XACML rules
 
@@ -340,6 +407,34 @@ class PolicyDecisionPointManager(object):
 
         return request
 
+    def _get_decision_cache_key(self, invocation, pdp, receiver, receiver_type):
+        """
+        Returns a key for the decision cache built from the request attributes the PDP's policy
+        references, or None if the decision cannot be cached.
+        """
+        if self.decision_cache is None:
+            return None
+        cache_attributes = self.pdp_cache_attributes.get(pdp, None)
+        if cache_attributes is None:
+            return None
+
+        key = [receiver_type, receiver]
+        if SENDER_ID in cache_attributes:
+            key.append(invocation.get_message_sender()[0])
+        if Identifiers.Subject.SUBJECT_ID in cache_attributes:
+            key.append(invocation.get_header_value('ion-actor-id', 'anonymous'))
+        if ROLE_ATTRIBUTE_ID in cache_attributes:
+            endpoint_process = invocation.get_arg_value('process', None)
+            roles = set()
+            for org_roles in self._get_request_roles(invocation, endpoint_process):
+                roles.update(org_roles)
+            key.append(tuple(sorted(roles)))
+        if Identifiers.Action.ACTION_ID in cache_attributes:
+            key.append(invocation.get_header_value('op', 'Unknown'))
+        if ACTION_VERB in cache_attributes:
+            key.append(self._get_operation_verb(invocation))
+        return tuple(key)
+
     def check_agent_request_policies(self, invocation):
 
         process = invocation.get_arg_value('process')
@@ -372,46 +467,51 @@ class PolicyDecisionPointManager(object):
         if not receiver:
             raise NotFound('No receiver for this message')
 
-        requestCtx = self._create_request_from_message(invocation, receiver, receiver_type)
-
         pdp = self.get_service_pdp(receiver)
 
         if pdp is None:
             return Decision.NOT_APPLICABLE
 
-        return self._evaluate_pdp(invocation, pdp, requestCtx)
+        return self._evaluate_pdp(invocation, pdp, receiver, receiver_type)
 
     def check_resource_request_policies(self, invocation, resource_id):
 
         if not resource_id:
             raise NotFound('The resource_id is not set')
 
-        requestCtx = self._create_request_from_message(invocation, resource_id, 'resource')
-
         pdp = self.get_resource_pdp(resource_id)
 
         if pdp is None:
             return Decision.NOT_APPLICABLE
 
-        return self._evaluate_pdp(invocation, pdp, requestCtx)
+        return self._evaluate_pdp(invocation, pdp, resource_id, 'resource')
 
-    def _evaluate_pdp(self, invocation, pdp, requestCtx):
+    def _evaluate_pdp(self, invocation, pdp, receiver, receiver_type):
 
-        try:
-            response = pdp.evaluate(requestCtx)
-        except Exception, e:
-            log.error("Error evaluating policies: %s" % e.message)
-            return Decision.NOT_APPLICABLE
+        cache_key = self._get_decision_cache_key(invocation, pdp, receiver, receiver_type)
+        decision = self.decision_cache.get(cache_key) if cache_key is not None else None
 
-        if response is None:
-            log.debug('response from PDP contains nothing, so not authorized')
-            return Decision.DENY
+        if decision is None:
+            requestCtx = self._create_request_from_message(invocation, receiver, receiver_type)
+            try:
+                response = pdp.evaluate(requestCtx)
+            except Exception, e:
+                log.error("Error evaluating policies: %s" % e.message)
+                return Decision.NOT_APPLICABLE
+
+            if response is None:
+                log.debug('response from PDP contains nothing, so not authorized')
+                decision = Decision.DENY
+            else:
+                for result in response.results:
+                    if result.decision == Decision.DENY:
+                        break
+                decision = result.decision
+
+            if cache_key is not None:
+                self.decision_cache.put(cache_key, decision)
 
         if invocation.message_annotations.has_key(GovernanceDispatcher.POLICY__STATUS_REASON_ANNOTATION):
             return Decision.DENY
 
-        for result in response.results:
-            if result.decision == Decision.DENY:
-                break
-
-        return result.decision
+        return decision
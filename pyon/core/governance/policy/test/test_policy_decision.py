@@ -334,3 +334,57 @@ class PolicyDecisionUnitTest(PyonTestCase):
         pdpm.load_resource_policy_rules(resource_id, self.permit_ION_MANAGER_rule)
         response = pdpm.check_agent_request_policies(invocation)
         self.assertEqual(response.value, "Permit")
+
+    def test_decision_cache(self):
+        gc = Mock()
+        gc.system_root_org_name = 'sys_org_name'
+        service_key = 'service_key'
+        pdpm = PolicyDecisionPointManager(gc)
+        self.assertIsNotNone(pdpm.decision_cache)
+
+        invocation = Mock()
+        invocation.message_annotations = {}
+        invocation.message = {'argument1': 0}
+        invocation.headers = {'op': 'op', 'ion-actor-id': 'ion-actor-id', 'ion-actor-roles': {'sys_org_name': ['ION_MANAGER']}}
+        invocation.get_message_receiver.return_value = service_key
+        invocation.get_message_sender.return_value = ['Unknown', 'Unknown']
+        invocation.get_header_value.side_effect = lambda key, default: invocation.headers.get(key, default)
+        process = Mock()
+        process.org_governance_name = 'org_name'
+        invocation.get_arg_value.side_effect = lambda key, default: {'process': process}.get(key, default)
+
+        pdpm.load_service_policy_rules(service_key, self.permit_ION_MANAGER_rule)
+        pdp = pdpm.get_service_pdp(service_key)
+        self.assertEqual(pdpm.pdp_cache_attributes[pdp], frozenset(['urn:oasis:names:tc:xacml:1.0:subject:subject-role-id']))
+
+        # Same roles give the cached decision
+        self.assertEqual(pdpm.check_service_request_policies(invocation).value, "Permit")
+        self.assertEqual(pdpm.check_service_request_policies(invocation).value, "Permit")
+        stats = pdpm.get_decision_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+
+        # Attributes not referenced by the policy are not part of the key
+        invocation.headers['op'] = 'other_op'
+        self.assertEqual(pdpm.check_service_request_policies(invocation).value, "Permit")
+        self.assertEqual(pdpm.get_decision_cache_stats()['hits'], 2)
+
+        invocation.headers['ion-actor-roles'] = {'org_name': ['ion-actor-roles']}
+        self.assertEqual(pdpm.check_service_request_policies(invocation).value, "NotApplicable")
+        self.assertEqual(pdpm.get_decision_cache_stats()['size'], 2)
+
+        # Changing policies flushes the cache
+        pdpm.load_service_policy_rules(service_key, self.deny_ION_MANAGER_rule)
+        self.assertEqual(pdpm.get_decision_cache_stats()['size'], 0)
+        invocation.headers['ion-actor-roles'] = {'sys_org_name': ['ION_MANAGER']}
+        self.assertEqual(pdpm.check_service_request_policies(invocation).value, "Deny")
+
+        # Policies evaluating the message are never cached
+        pdpm.load_service_policy_rules(service_key, self.deny_message_parameter_rule)
+        self.assertIsNone(pdpm.pdp_cache_attributes[pdpm.get_service_pdp(service_key)])
+        invocation.headers['op'] = 'op'
+        self.assertEqual(pdpm.check_service_request_policies(invocation).value, "Deny")
+        self.assertEqual(pdpm.get_decision_cache_stats()['size'], 0)
+
+        pdpm.clear_policy_cache()
+        self.assertEqual(pdpm.get_decision_cache_stats()['size'], 0)
+        self.assertNotIn(pdp, pdpm.pdp_cache_attributes)
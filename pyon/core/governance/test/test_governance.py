@@ -5,7 +5,7 @@ __author__ = 'Stephen P. Henrie'
 
 
 from pyon.util.unit_test import PyonTestCase
-from mock import Mock
+from mock import Mock, patch
 from nose.plugins.attrib import attr
 from pyon.core.governance.governance_controller import GovernanceController
 from pyon.core.exception import Unauthorized, BadRequest, Inconsistent
@@ -17,6 +17,8 @@ from pyon.core.governance import ORG_MANAGER_ROLE, ORG_MEMBER_ROLE, ION_MANAGER,
 from pyon.core.governance import find_roles_by_actor, get_actor_header, get_system_actor_header, get_role_message_headers, get_valid_resource_commitments
 from interface.services.examples.hello.ihello_service  import HelloServiceProcessClient
 from pyon.util.context import LocalContextMixin
+from pyon.util.cache import LRUTTLCache
+from pyon.util.containers import get_ion_ts_millis
 
 class UnitTestService(BaseService):
     name = 'UnitTestService'
@@ -96,7 +98,8 @@ class GovernanceUnitTest(PyonTestCase):
         intlist = {'conversation', 'information', 'policy'}
         config = {'interceptor_order': intlist,
                   'governance_interceptors':
-                  {'conversation': {'class': 'pyon.core.governance.conversation.conversation_monitor_interceptor.ConversationMonitorInterceptor'},
+                  {'conversation': {'class': 'pyon.core.governance.conversation.conversation_monitor_interceptor.ConversationMonitorInterceptor',
+                                    'config': {'conversation_ttl': 30000}},
                    'information': {'class': 'pyon.core.governance.information.information_model_interceptor.InformationModelInterceptor'},
                    'policy': {'class': 'pyon.core.governance.policy.policy_interceptor.PolicyInterceptor'}}}
 
@@ -105,6 +108,7 @@ class GovernanceUnitTest(PyonTestCase):
         self.assertEquals(self.governance_controller.interceptor_order, intlist)
         self.assertEquals(len(self.governance_controller.interceptor_by_name_dict),
                           len(config['governance_interceptors']))
+        self.assertEquals(self.governance_controller.interceptor_by_name_dict['conversation'].conversation_ttl, 30000)
 
     # TODO - Need to fill this method out
     def test_process_message(self):
@@ -312,6 +316,61 @@ class GovernanceUnitTest(PyonTestCase):
         pdp.load_service_policy_rules.assert_called_with(service_policy_event.service_name, policy_rules)
 
 
+    def test_actor_cache(self):
+        gc = self.governance_controller
+        gc.actor_role_cache = LRUTTLCache(max_size=10)
+        gc.commitment_cache = LRUTTLCache(max_size=10)
+        gc._system_root_org_name = 'ION'
+
+        role = Mock()
+        role.org_governance_name = 'Org1'
+        role.governance_name = 'OPERATOR'
+        commitment = Mock()
+        commitment.consumer = 'actor1'
+        commitment.expiration = 0
+        rr = Mock()
+        rr.find_objects.side_effect = lambda res_id, pred, res_type: ([role], None) if pred == PRED.hasRole else ([commitment], None)
+        gc.container.resource_registry = rr
+
+        container = Mock()
+        container.governance_controller = gc
+        with patch('pyon.core.governance.bootstrap.container_instance', container):
+            expected_roles = {'Org1': ['OPERATOR'], 'ION': [ORG_MEMBER_ROLE]}
+            self.assertEqual(find_roles_by_actor('actor1'), expected_roles)
+            roles = find_roles_by_actor('actor1')
+            self.assertEqual(roles, expected_roles)
+            self.assertEqual(rr.find_objects.call_count, 1)
+
+            # Returned role dicts can be modified without affecting the cache
+            roles['ION'].append(ION_MANAGER)
+            self.assertEqual(find_roles_by_actor('actor1'), expected_roles)
+
+            self.assertEqual(get_valid_resource_commitments('res1', 'actor1'), [commitment])
+            self.assertEqual(get_valid_resource_commitments('res1', 'actor2'), None)
+            self.assertEqual(rr.find_objects.call_count, 2)
+
+            # Expiration is checked on cached commitments
+            commitment.expiration = get_ion_ts_millis() - 1000
+            self.assertEqual(get_valid_resource_commitments('res1', 'actor1'), None)
+            commitment.expiration = 0
+
+            # Org events invalidate
+            event = Mock()
+            event.type_ = 'UserRoleGrantedEvent'
+            event.actor_id = 'actor1'
+            gc.org_event_callback(event)
+            find_roles_by_actor('actor1')
+            self.assertEqual(rr.find_objects.call_count, 3)
+
+            event.type_ = 'ResourceCommitmentReleasedEvent'
+            gc.org_event_callback(event)
+            get_valid_resource_commitments('res1', 'actor1')
+            self.assertEqual(rr.find_objects.call_count, 4)
+
+        stats = gc.get_cache_stats()
+        self.assertEqual(stats['actor_roles']['hits'], 2)
+        self.assertEqual(stats['commitments']['hits'], 2)
+
     def test_governance_header_values(self):
 
         process = Mock()
@@ -27,6 +27,15 @@ class EncodeTypes(object):
     DTYPE = 'd'
     SLICE = 'i'
     NPVAL = 'n'
+    NPARRAY_RAW = 'b'
+
+
+# Headers negotiating the numpy array encoding. Every message encoded here advertises that its sender can
+# decode raw arrays (ACCEPT). Raw arrays are only sent in messages that carry NPARRAY_HEADER=raw, which
+# an RPC response copies from the request's ACCEPT header, or if raw encoding is forced by config.
+NPARRAY_ACCEPT_HEADER = 'accept-nparray'
+NPARRAY_HEADER = 'nparray'
+NPARRAY_RAW = 'raw'
 
 
 # Global lazy load reference to the Pyon object registry (we be set on first use, not on load).
@@ -49,15 +58,8 @@ def decode_ion(obj):
         if obj_registry is None:
             obj_registry = get_obj_registry()
 
-        ion_obj = obj_registry.new(obj["type_"])
-        for k, v in obj.iteritems():
-            # unicode translate to utf8
-            # Note: This is not recursive within dicts/list or any other types
-            if isinstance(v, unicode):
-                v = v.encode('utf8')
-            if k != "type_":
-                setattr(ion_obj, k, v)
-        return ion_obj
+        # Per type compiled decoder, creates the object directly from the dict if it has all fields
+        return obj_registry.get_decoder(obj["type_"])(obj)
 
     if 't' not in obj:
         return obj
@@ -67,6 +69,10 @@ def decode_ion(obj):
     if objt == EncodeTypes.LIST:
         return list(obj['o'])
 
+    elif objt == EncodeTypes.NPARRAY_RAW:
+        # Note: The array shares the message buffer and is read-only. Copy it if you need to modify it.
+        return np.frombuffer(obj['o'], dtype=np.dtype(obj['d'])).reshape(obj['s'])
+
     elif objt == EncodeTypes.NPARRAY:
         return np.array(obj['o'], dtype=np.dtype(obj['d']))
 
@@ -132,13 +138,28 @@ def encode_ion(obj):
     raise TypeError('Unknown type "%s" in user specified encoder: "%s"' % (type(obj), obj))
 
 
+def encode_ion_raw(obj):
+    """
+    msgpack object hook as encode_ion, but encoding numpy arrays as their raw memory buffer
+    together with dtype and shape instead of as nested lists of Python values.
+    Only peers that have decode_ion with EncodeTypes.NPARRAY_RAW support can decode this.
+    """
+    if isinstance(obj, np.ndarray) and not obj.dtype.hasobject and obj.dtype.fields is None:
+        return {'t': EncodeTypes.NPARRAY_RAW, 'o': np.ascontiguousarray(obj).tostring(), 'd': obj.dtype.str, 's': obj.shape}
+
+    return encode_ion(obj)
+
+
 class EncodeInterceptor(Interceptor):
 
     def __init__(self):
         self.max_message_size = sys.maxint  # Will be set appropriately from interceptor config
+        self.nparray_encoding = 'negotiate'
 
     def configure(self, config):
         self.max_message_size = get_safe(config, 'max_message_size', 20000000)
+        # One of: list (legacy encoding only), negotiate (raw if the receiver accepts it), raw (always raw)
+        self.nparray_encoding = get_safe(config, 'nparray_encoding', 'negotiate')
         log.debug("EncodeInterceptor enabled")
 
     def outgoing(self, invocation):
@@ -151,9 +172,15 @@ class EncodeInterceptor(Interceptor):
                 if isinstance(v, DotDict):
                     setattr(payload, k, v.as_dict())
 
+        encoder = encode_ion
+        if self.nparray_encoding != 'list':
+            if self.nparray_encoding == 'raw' or invocation.headers.get(NPARRAY_HEADER) == NPARRAY_RAW:
+                encoder = encode_ion_raw
+            invocation.headers[NPARRAY_ACCEPT_HEADER] = NPARRAY_RAW
+
         # Msgpack the content to binary str - does nested IonObject encoding
         try:
-            invocation.message = msgpack.packb(payload, default=encode_ion)
+            invocation.message = msgpack.packb(payload, default=encoder)
         except Exception:
             log.error("Illegal type in IonObject attributes: %s", payload)
             raise BadRequest("Illegal type in IonObject attributes")
@@ -2,6 +2,12 @@
 
 __author__ = 'Dave Foster <dfoster@asascience.com>, Thomas R. Lennan'
 
+import time
+
+from ooi.timer import Accumulator
+
+# Per interceptor timing, if enabled for the interceptor stacks
+stats = Accumulator(persist=True)
 
 
 class Invocation(object):
@@ -103,8 +109,72 @@ class Interceptor(object):
     def incoming(self, invocation):
         pass
 
+    def is_noop(self, path):
+        """
+        Returns True if this interceptor, as configured, returns the invocation unchanged for
+        given path (Invocation.PATH_IN or PATH_OUT). No-op interceptors are left out of compiled chains.
+        """
+        return False
+
+
+def _process_chain(funcs):
+    """Returns a callable applying the given interceptor functions in order"""
+    if not funcs:
+        return lambda invocation: invocation
+    if len(funcs) == 1:
+        return funcs[0]
+
+    def process_chain(invocation):
+        for func in funcs:
+            invocation = func(invocation)
+        return invocation
+    return process_chain
+
+
+def _timed_func(func, stat_key):
+    def timed_func(invocation):
+        start_time = time.time()
+        try:
+            return func(invocation)
+        finally:
+            stats.add_value(stat_key, time.time() - start_time)
+    return timed_func
+
+
+class InterceptorChain(list):
+    """
+    A list of interceptors (a stack) with a precompiled callable per path that calls the bound
+    interceptor methods in order, skipping no-op interceptors. With timing enabled, the time spent
+    in each interceptor is recorded in the interceptor Accumulator by name and path.
+    Call compile() again after an interceptor's configuration changed.
+    """
+    def __init__(self, interceptors=None, names=None, timing=False):
+        list.__init__(self, interceptors or [])
+        self.names = names or [type(interceptor).__name__ for interceptor in self]
+        self.timing = timing
+        self.compile()
+
+    def compile(self):
+        self._chains = {}
+        for path in (Invocation.PATH_IN, Invocation.PATH_OUT):
+            funcs = []
+            for name, interceptor in zip(self.names, self):
+                if interceptor.is_noop(path):
+                    continue
+                func = getattr(interceptor, path)
+                if self.timing:
+                    func = _timed_func(func, "%s.%s" % (name, path))
+                funcs.append(func)
+            self._chains[path] = _process_chain(tuple(funcs))
+
+    def process(self, invocation):
+        return self._chains[invocation.path](invocation)
+
 
 def process_interceptors(interceptors, invocation):
+    if type(interceptors) is InterceptorChain:
+        return interceptors._chains[invocation.path](invocation)
+
     for interceptor in interceptors:
         func = getattr(interceptor, invocation.path)
         invocation = func(invocation)
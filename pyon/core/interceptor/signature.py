@@ -21,14 +21,25 @@ class DictSorter(IonObjectSerializationBase):
 
 
 class SignatureInterceptor(Interceptor):
+    """
+    Signs outgoing and verifies incoming messages with the container certificate.
+    Place this interceptor after encode in the outgoing and before encode in the incoming stack:
+    the signature is then computed over a digest of the msgpack bytes as sent, with no walk of the message.
+    Messages that are not yet encoded are signed over the string form of the key-sorted message.
+    """
     def __init__(self, *args, **kwargs):
         Interceptor.__init__(self)
         self._dict_sorter = DictSorter()
         self.auth = authentication.Authentication()
 
+    def _get_signing_input(self, message):
+        if isinstance(message, str):
+            return message
+        return str(self._dict_sorter.serialize(message))
+
     def outgoing(self, invocation):
-        msg = str(self._dict_sorter.serialize(invocation.message))
         if self.auth.authentication_enabled():
+            msg = self._get_signing_input(invocation.message)
             signer = 'no-signer'
             if Container.instance is not None:
                 signer = Container.instance.id
@@ -39,11 +50,11 @@ class SignatureInterceptor(Interceptor):
         return invocation
 
     def incoming(self, invocation):
-        msg = str(self._dict_sorter.serialize(invocation.message))
         if self.auth.authentication_enabled():
             headers = invocation.headers
             if not 'signature' in headers or not 'signer' in headers or not 'certificate' in headers:
                 raise BadRequest("Digital signature missing from request")
+            msg = self._get_signing_input(invocation.message)
             status, cause = self.auth.verify_message(msg, headers['certificate'], headers['signature'])
             if status != 'Valid':
                 raise BadRequest("Digital signature invalid. Cause %s" % cause)
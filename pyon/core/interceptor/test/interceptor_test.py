@@ -7,12 +7,14 @@
 '''
 
 import unittest
+from mock import Mock, patch
 from nose.plugins.attrib import attr
 
 from pyon.util.unit_test import PyonTestCase
-from pyon.core.interceptor.encode import EncodeInterceptor
+from pyon.core.interceptor.encode import EncodeInterceptor, NPARRAY_HEADER, NPARRAY_ACCEPT_HEADER, NPARRAY_RAW
 from pyon.core.interceptor.validate import ValidateInterceptor
-from pyon.core.interceptor.interceptor import Invocation
+from pyon.core.interceptor.interceptor import Invocation, Interceptor, InterceptorChain, process_interceptors
+from pyon.core.interceptor import interceptor
 from pyon.public import IonObject, DotDict, BadRequest
 
 try:
@@ -65,6 +67,117 @@ class InterceptorTest(PyonTestCase):
         for d in c:
             self.assertTrue((a==d).all())
 
+    @unittest.skipIf(not _have_numpy,'No numpy')
+    def test_numpy_raw_encode(self):
+        a = np.arange(24, dtype='>i4').reshape((2, 3, 4))[:, 1:, :]     # non-contiguous, big endian
+        invoke = Invocation(headers={NPARRAY_HEADER: NPARRAY_RAW})
+        invoke.message = {'arr': a, 'objarr': np.array([{'a': 1}], dtype='object')}
+        encode = EncodeInterceptor()
+
+        mangled = encode.outgoing(invoke)
+        self.assertEquals(mangled.headers[NPARRAY_ACCEPT_HEADER], NPARRAY_RAW)
+        # raw buffer of the array is in the message, no list encoding
+        self.assertIn(np.ascontiguousarray(a).tostring(), mangled.message)
+
+        received = encode.incoming(mangled)
+        b = received.message['arr']
+        self.assertEquals(b.dtype, a.dtype)
+        self.assertEquals(b.shape, a.shape)
+        self.assertTrue((a==b).all())
+        self.assertEquals(received.message['objarr'][0], {'a': 1})
+
+    @unittest.skipIf(not _have_numpy,'No numpy')
+    def test_numpy_encode_negotiation(self):
+        a = np.arange(10, dtype='float64')
+        raw_buf = a.tostring()
+        encode = EncodeInterceptor()
+
+        # receiver not known to accept raw arrays
+        invoke = Invocation(message=a)
+        self.assertNotIn(raw_buf, encode.outgoing(invoke).message)
+
+        encode.configure({'nparray_encoding': 'raw'})
+        invoke = Invocation(message=a)
+        self.assertIn(raw_buf, encode.outgoing(invoke).message)
+
+        encode.configure({'nparray_encoding': 'list'})
+        invoke = Invocation(message=a, headers={NPARRAY_HEADER: NPARRAY_RAW})
+        mangled = encode.outgoing(invoke)
+        self.assertNotIn(raw_buf, mangled.message)
+        self.assertNotIn(NPARRAY_ACCEPT_HEADER, mangled.headers)
+
+    def test_signature(self):
+        from pyon.core.interceptor.signature import SignatureInterceptor
+        with patch('pyon.core.interceptor.signature.authentication.Authentication') as auth_cls:
+            auth = auth_cls.return_value
+            auth.authentication_enabled.return_value = True
+            auth.sign_message.return_value = 'sig'
+            auth.get_container_cert.return_value = 'cert'
+            auth.verify_message.return_value = ('Valid', 'OK')
+            signature = SignatureInterceptor()
+        signature._dict_sorter = Mock()
+
+        # Encoded messages are signed as sent, without walking the message
+        invoke = EncodeInterceptor().outgoing(Invocation(message={'b': 1, 'a': [1, 2]}))
+        encoded = invoke.message
+        signature.outgoing(invoke)
+        auth.sign_message.assert_called_once_with(encoded)
+        self.assertEqual(invoke.headers['signature'], 'sig')
+        self.assertEqual(invoke.headers['certificate'], 'cert')
+
+        signature.incoming(invoke)
+        auth.verify_message.assert_called_once_with(encoded, 'cert', 'sig')
+        self.assertFalse(signature._dict_sorter.serialize.called)
+
+        auth.verify_message.return_value = ('Invalid', 'Signature failed verification')
+        self.assertRaises(BadRequest, signature.incoming, invoke)
+        del invoke.headers['signature']
+        self.assertRaises(BadRequest, signature.incoming, invoke)
+
+    def test_interceptor_chain(self):
+        class AppendInterceptor(Interceptor):
+            def __init__(self, name):
+                self.name = name
+            def outgoing(self, invocation):
+                invocation.message.append("out_" + self.name)
+                return invocation
+            def incoming(self, invocation):
+                invocation.message.append("in_" + self.name)
+                return invocation
+
+        validate = ValidateInterceptor()
+        validate.configure({"enabled": False})
+        validate.incoming = Mock()
+        validate.outgoing = Mock()
+        chain = InterceptorChain([AppendInterceptor("a"), validate, AppendInterceptor("b")], ["a", "validate", "b"])
+        self.assertEqual(len(chain), 3)
+
+        # No-op interceptors are not called
+        invoke = process_interceptors(chain, Invocation(path=Invocation.PATH_IN, message=[]))
+        self.assertEqual(invoke.message, ["in_a", "in_b"])
+        invoke = process_interceptors(chain, Invocation(path=Invocation.PATH_OUT, message=[]))
+        self.assertEqual(invoke.message, ["out_a", "out_b"])
+        self.assertFalse(validate.incoming.called)
+        self.assertFalse(validate.outgoing.called)
+
+        validate.enabled = True
+        chain.compile()
+        process_interceptors(chain, Invocation(path=Invocation.PATH_IN, message=[]))
+        self.assertEqual(validate.incoming.call_count, 1)
+        self.assertFalse(validate.outgoing.called)
+
+        # Same result as an interceptor list
+        self.assertEqual(process_interceptors(list(chain), Invocation(path=Invocation.PATH_OUT, message=[])).message,
+                         process_interceptors(chain, Invocation(path=Invocation.PATH_OUT, message=[])).message)
+        self.assertEqual(process_interceptors(InterceptorChain(), Invocation(path=Invocation.PATH_IN, message=[])).message, [])
+
+        # Per interceptor timing
+        with patch.object(interceptor, 'stats') as stats:
+            chain = InterceptorChain([AppendInterceptor("a"), AppendInterceptor("b")], ["a", "b"], timing=True)
+            invoke = process_interceptors(chain, Invocation(path=Invocation.PATH_IN, message=[]))
+            self.assertEqual(invoke.message, ["in_a", "in_b"])
+            self.assertEqual([c[0][0] for c in stats.add_value.call_args_list], ["a.incoming", "b.incoming"])
+
     def test_set(self):
         a = {1,2}
         invoke = Invocation()
@@ -17,7 +17,7 @@ import random
 from msgpack import packb, unpackb
 import hashlib
 
-from pyon.core.interceptor.encode import encode_ion, decode_ion
+from pyon.core.interceptor.encode import encode_ion, encode_ion_raw, decode_ion
 
 
 def sha1(buf):
@@ -121,6 +121,14 @@ class NumpyMsgPackTestCase(unittest.TestCase, PackRunBase ):
         PackRunBase.__init__(self,*args, **kwargs)
 
 
+class NumpyRawMsgPackTestCase(unittest.TestCase, PackRunBase ):
+
+    def __init__(self,*args, **kwargs):
+        unittest.TestCase.__init__(self,*args, **kwargs)
+        PackRunBase.__init__(self,*args, **kwargs)
+        self._encoder = encode_ion_raw
+
+
 
 if __name__ == '__main__':
 
@@ -156,6 +156,10 @@ ${methods}
     def ${name}(${args}, headers=None, timeout=None):
         ${methoddocstring}
         return self.request(IonObject('${req_in_obj_name}', **{$req_in_obj_args}), op='${name}', headers=headers, timeout=timeout)
+
+    def ${name}_async(${args}, headers=None, timeout=None):
+        """Non-blocking version of ${name}. Returns an AsyncResult, see RPCClient.request_async."""
+        return self.request_async(IonObject('${req_in_obj_name}', **{$req_in_obj_args}), op='${name}', headers=headers, timeout=timeout)
 ''',
     'obj_arg': "'${name}': ${name} or ${default}",
     'obj_arg_no_def': "'${name}': ${name}",
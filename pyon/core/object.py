@@ -62,6 +62,17 @@ class IonObjectBase(object):
         """
         Compare fields to the schema and raise AttributeError if mismatched.
         Named _validate instead of validate because the data may have a field named "validate".
+        Uses a validator function compiled once per class, see compile_validator.
+        """
+        validator = _validators.get(type(self), None)
+        if validator is None:
+            validator = get_validator(type(self))
+        validator(self)
+
+    def _validate_schema(self):
+        """
+        Same as _validate, but interprets the schema on every call.
+        Used for classes where a validator cannot be compiled.
         """
         fields, schema = self.__dict__, self._schema
 
@@ -138,9 +149,9 @@ class IonObjectBase(object):
                 # Check enum types
                 from pyon.core.registry import enum_classes
                 if isinstance(field_val, int) and schema_val['type'] in enum_classes:
-                    if field_val not in enum_classes(schema_val['type'])._str_map:
+                    if field_val not in enum_classes[schema_val['type']]._str_map:
                         raise AttributeError('Invalid enum value "%d" for field "%s.%s", should be between 1 and %d' %
-                                     (fields[key], type(self).__name__, key, len(enum_classes(schema_val['type'])._str_map)))
+                                     (fields[key], type(self).__name__, key, len(enum_classes[schema_val['type']]._str_map)))
                     else:
                         continue
 
@@ -353,6 +364,192 @@ class IonObjectBase(object):
 class IonMessageObjectBase(IonObjectBase):
     pass
 
+
+# -----------------------------------------------------------------------------
+# Compiled validators
+
+_validators = {}        # class -> validator function
+
+# Schema types for which the type check can use the type object instead of the type name
+_BASIC_TYPES = {'str', 'unicode', 'int', 'long', 'float', 'bool', 'list', 'tuple', 'set', 'dict', 'OrderedDict'}
+# Schema types that cannot contain IonObjects
+_SCALAR_TYPES = {'str', 'unicode', 'int', 'long', 'float', 'bool', 'NoneType'}
+
+
+def get_validator(clzz):
+    """
+    Returns the validator function for an IonObject class, compiling it on first use.
+    Falls back to the interpreting IonObjectBase._validate_schema if the schema cannot be compiled.
+    """
+    validator = _validators.get(clzz, None)
+    if validator is None:
+        try:
+            validator = compile_validator(clzz)
+        except Exception:
+            log.warn("Cannot compile validator for %s", clzz.__name__, exc_info=True)
+            validator = clzz._validate_schema
+        _validators[clzz] = validator
+    return validator
+
+
+def _validate_children(field_val):
+    """Validates IonObjects in a field value of non-collection schema type"""
+    if isinstance(field_val, IonObjectBase):
+        field_val._validate()
+    elif isinstance(field_val, Mapping):
+        for subkey in field_val:
+            subval = field_val[subkey]
+            if isinstance(subval, IonObjectBase):
+                subval._validate()
+    elif isinstance(field_val, Iterable):
+        for subval in field_val:
+            if isinstance(subval, IonObjectBase):
+                subval._validate()
+
+
+def _parse_range(range_str, conv):
+    parts = range_str.split(',')
+    return conv(parts[0].strip()), conv(parts[-1].strip())
+
+
+def compile_validator(clzz):
+    """
+    Generates a validator function for an IonObject class with the same checks as
+    IonObjectBase._validate_schema, written out as straight-line code per schema field.
+    Type names, enum values, patterns, value ranges and lengths are resolved once here.
+    """
+    from pyon.core.registry import enum_classes
+
+    schema = clzz._schema
+    cls_name = clzz.__name__
+    consts = dict(IonObjectBase=IonObjectBase, OrderedDict=OrderedDict, log=log, _validate_children=_validate_children,
+                  ALLOWED_FIELDS=frozenset(schema) | BUILT_IN_ATTRS)
+
+    def const(value):
+        name = "c%s" % len(consts)
+        consts[name] = value
+        return name
+
+    def esc(value):
+        return str(value).replace("%", "%%")
+
+    code = ["def validate(obj):",
+            "    fields = obj.__dict__",
+            "    if not fields.viewkeys() <= ALLOWED_FIELDS:",
+            "        raise AttributeError('Fields found that are not in the schema: %r' % "
+            "(list(fields.viewkeys() - ALLOWED_FIELDS)))"]
+
+    for key, schema_val in schema.iteritems():
+        if 'Required' in schema_val.get('decorators', {}):
+            code.append("    if fields.get(%r) is None:" % key)
+            code.append("        raise AttributeError(%r)" % ('Required value "%s" not set' % key))
+
+    for key, schema_val in schema.iteritems():
+        typ = schema_val['type']
+        decorators = schema_val.get('decorators', {})
+        if typ == 'NoneType':
+            continue
+        field_name = "%s.%s" % (cls_name, key)
+
+        code.append("    if %r in fields:" % key)
+        code.append("        v = fields[%r]" % key)
+        if typ in ('float', 'long'):
+            code.append("        if isinstance(v, int):")
+            code.append("            v = fields[%r] = %s(v)" % (key, typ))
+        elif typ == 'OrderedDict':
+            code.append("        if type(v) is dict:")
+            code.append("            v = fields[%r] = OrderedDict(v)" % key)
+
+        # Type mismatch cases that are allowed or checked otherwise
+        if typ in _BASIC_TYPES:
+            code.append("        if type(v) is not %s:" % typ)
+        else:
+            code.append("        if type(v).__name__ != %r:" % typ)
+        code.append("            if v is None:")
+        code.append("                pass")
+        if typ == 'str':
+            code.append("            elif type(v) is unicode:")
+            code.append("                pass")
+        if typ == 'OrderedDict':
+            code.append("            elif isinstance(v, IonObjectBase):")
+            code.append("                pass")
+        code.append("            elif obj.check_inheritance_chain(type(v), %r):" % typ)
+        code.append("                pass")
+        if typ in enum_classes:
+            str_map = enum_classes[typ]._str_map
+            code.append("            elif isinstance(v, int):")
+            code.append("                if v not in %s:" % const(frozenset(str_map)))
+            code.append("                    raise AttributeError(%s %% v)" % const(
+                'Invalid enum value "%%d" for field "%s", should be between 1 and %d' % (esc(field_name), len(str_map))))
+        if typ == 'list':
+            code.append("            elif type(v) is tuple:")
+            code.append("                pass")
+        if typ == 'dict':
+            code.append("            elif isinstance(v, IonObjectBase):")
+            code.append("                log.warn(%r)" % ('TODO: Please convert generic dict attribute type to abstract '
+                                                          'type for field "%s"' % field_name))
+        if typ == 'str' and 'ContentType' in decorators:
+            code.append("            else:")
+            code.append("                obj.check_content(%r, v, %r)" % (key, decorators['ContentType']))
+        else:
+            code.append("            else:")
+            code.append("                raise AttributeError(%s %% (type(v),))" % const(
+                'Invalid type "%%s" for field "%s", should be "%s"' % (esc(field_name), esc(typ))))
+
+        # Checks for values of the schema type
+        checks = []
+        if typ == 'str' and 'ValuePattern' in decorators:
+            pattern = decorators['ValuePattern']
+            checks.append("if not %s(v):" % const(re.compile(pattern).match))
+            checks.append("    raise AttributeError(%s %% (v,))" % const(
+                'Invalid value pattern %%s for field "%s", should match regular expression %s' % (
+                    esc(field_name), esc(pattern))))
+        if typ in ('int', 'float', 'long') and 'ValueRange' in decorators:
+            value_range = decorators['ValueRange']
+            try:
+                min_val, max_val = _parse_range(value_range, eval)
+                checks.append("if v < %s or v > %s:" % (const(min_val), const(max_val)))
+                checks.append("    raise AttributeError(%s %% (v,))" % const(
+                    'Invalid value %%s for field "%s", should be between %d and %d' % (esc(field_name), min_val, max_val)))
+            except Exception:
+                checks.append("obj.check_numeric_value_range(%r, v, %r)" % (key, value_range))
+        if 'ContentType' in decorators:
+            if typ == 'list':
+                checks.append("obj.check_collection_content(%r, v, %r)" % (key, decorators['ContentType']))
+            elif typ in ('dict', 'OrderedDict'):
+                checks.append("obj.check_collection_content(%r, v.values(), %r)" % (key, decorators['ContentType']))
+            else:
+                checks.append("obj.check_content(%r, v, %r)" % (key, decorators['ContentType']))
+        if 'ContentCount' in decorators and typ in ('list', 'dict', 'OrderedDict'):
+            length = decorators['ContentCount']
+            try:
+                min_len, max_len = _parse_range(length, int)
+                checks.append("if len(v) < %d or len(v) > %d:" % (min_len, max_len))
+                checks.append("    raise AttributeError(%r)" % ('Invalid value length for collection field "%s", '
+                                                            'should be between %d and %d' % (field_name, min_len, max_len)))
+            except Exception:
+                checks.append("obj.check_collection_length(%r, v, %r)" % (key, length))
+
+        # Validation of contained IonObjects
+        if typ in ('dict', 'OrderedDict'):
+            checks.append("for sv in v.itervalues():")
+            checks.append("    if isinstance(sv, IonObjectBase):")
+            checks.append("        sv._validate()")
+        elif typ in ('list', 'tuple', 'set'):
+            checks.append("for sv in v:")
+            checks.append("    if isinstance(sv, IonObjectBase):")
+            checks.append("        sv._validate()")
+        elif typ not in _SCALAR_TYPES:
+            checks.append("_validate_children(v)")
+
+        if checks:
+            code.append("        else:")
+            code.extend("            " + line for line in checks)
+
+    source = "\n".join(code) + "\n"
+    exec compile(source, "<validator %s>" % cls_name, "exec") in consts
+    return consts["validate"]
+
 def walk(o, cb, modify_key_value = 'value'):
     """
     Utility method to do recursive walking of a possible iterable (inc dicts) and do inline transformations.
@@ -6,7 +6,7 @@ import inspect
 from copy import deepcopy
 
 from pyon.core.exception import NotFound
-from pyon.core.object import walk
+from pyon.core.object import walk, BUILT_IN_ATTRS
 
 import interface.objects
 import interface.messages
@@ -15,6 +15,7 @@ import interface.messages
 enum_classes = {}
 model_classes = {}
 message_classes = {}
+extends_map = {}        # type name -> list of type names that extend it, see getextends
 
 
 def getextends(type):
@@ -23,6 +24,8 @@ def getextends(type):
     @param type (str) Object type
     @retval List of object types that are extended by given type
     """
+    if type in extends_map:
+        return list(extends_map[type])
     ret = []
     base_clzz = model_classes[type]
     for name in model_classes:
@@ -33,6 +36,20 @@ def getextends(type):
     return ret
 
 
+def get_extends_map():
+    """
+    Returns a dict mapping each object type to the result of getextends, computed in one pass over all types.
+    """
+    type_names = dict((clzz, name) for name, clzz in model_classes.iteritems())
+    extends = {}
+    for name, clzz in model_classes.iteritems():
+        for base in inspect.getmro(clzz):
+            base_name = type_names.get(base, None)
+            if base_name:
+                extends.setdefault(base_name, []).append(name)
+    return extends
+
+
 def issubtype(obj_type, base_type):
     obj_cls = model_classes.get(obj_type, None)
     base_cls = model_classes.get(base_type, None)
@@ -125,20 +142,38 @@ class IonObjectRegistry(object):
 
     validate_setattr = False
 
-    def __init__(self):
-        classes = inspect.getmembers(interface.objects, inspect.isclass)
-        for name, clzz in classes:
-            if clzz.__bases__[0].__name__ == "IonEnum":
-                enum_classes[name] = clzz
-            else:
-                model_classes[name] = clzz
-        classes = inspect.getmembers(interface.messages, inspect.isclass)
-        for name, clzz in classes:
-            message_classes[name] = clzz
+    def __init__(self, snapshot=None):
+        """
+        @param snapshot  A registry snapshot dict (see pyon.core.registry_snapshot) with the type names and
+                         extends hierarchy, avoiding the inspection of all classes
+        """
+        if snapshot:
+            for name in snapshot["model_classes"]:
+                model_classes[name] = getattr(interface.objects, name)
+            for name in snapshot["enum_classes"]:
+                enum_classes[name] = getattr(interface.objects, name)
+            for name in snapshot["message_classes"]:
+                message_classes[name] = getattr(interface.messages, name)
+            extends_map.clear()
+            extends_map.update(snapshot["extends"])
+        else:
+            classes = inspect.getmembers(interface.objects, inspect.isclass)
+            for name, clzz in classes:
+                if clzz.__bases__[0].__name__ == "IonEnum":
+                    enum_classes[name] = clzz
+                else:
+                    model_classes[name] = clzz
+            classes = inspect.getmembers(interface.messages, inspect.isclass)
+            for name, clzz in classes:
+                message_classes[name] = clzz
+            extends_map.clear()
+            extends_map.update(get_extends_map())
 
         from pyon.core.bootstrap import CFG
         self.validate_setattr = CFG.get_safe('container.objects.validate.setattr', False)
 
+        self._decoders = {}     # type name -> compiled decoder function, see get_decoder
+
     def new(self, _def, _dict=None, **kwargs):
         """Instantiates an IonObject based on given object type name and initial values.
         Note: This is called for the IonObject() instantiation but not for the ObjType() instantiation.
@@ -188,3 +223,50 @@ class IonObjectRegistry(object):
             obj = clzz(**kwargs)
 
         return obj
+
+    def get_decoder(self, _def):
+        """Returns a decoder function for given object type name that creates an IonObject from a
+        dict of field values, such as a decoded message. Decoders are compiled once per type.
+        @param _def    Name of object type
+        """
+        decoder = self._decoders.get(_def, None)
+        if decoder is None:
+            decoder = self._compile_decoder(_def)
+            self._decoders[_def] = decoder
+        return decoder
+
+    def _compile_decoder(self, _def):
+        """Creates the decoder function for an object type. If the given dict has exactly the fields of
+        the type's schema (plus built-in attributes), the instance is created without running __init__
+        (which builds defaults for all fields) and the dict becomes the instance __dict__, bypassing
+        __setattr__. Otherwise the decoder falls back to new() and setattr per field.
+        """
+        clzz = model_classes.get(_def, None) or message_classes.get(_def, None)
+        if clzz is None and _def not in enum_classes:
+            raise NotFound("No matching class found for name %s" % _def)
+
+        schema_fields = frozenset(clzz._schema) if clzz is not None else None
+        allowed_fields = schema_fields | BUILT_IN_ATTRS if clzz is not None else None
+        new_instance = object.__new__
+        registry_new = self.new
+
+        def decode_obj(obj_dict):
+            # unicode translate to utf8
+            # Note: This is not recursive within dicts/list or any other types
+            for k, v in obj_dict.iteritems():
+                if isinstance(v, unicode):
+                    obj_dict[k] = v.encode('utf8')
+
+            obj_fields = obj_dict.viewkeys()
+            if schema_fields is not None and schema_fields <= obj_fields <= allowed_fields:
+                ion_obj = new_instance(clzz)
+                ion_obj.__dict__ = obj_dict
+                return ion_obj
+
+            ion_obj = registry_new(_def)
+            for k, v in obj_dict.iteritems():
+                if k != "type_":
+                    setattr(ion_obj, k, v)
+            return ion_obj
+
+        return decode_obj
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Precompiled snapshot of the object, resource and service registries for faster container startup"""
+
+import hashlib
+import json
+import os
+import time
+
+from pyon.util.log import log
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_PATH = "interface/registry_snapshot.json"
+SERVICE_PATH = "interface/services"
+# Files the snapshot contents are derived from (in addition to the service modules)
+SOURCE_FILES = ["interface/objects.py", "interface/messages.py",
+                "res/config/associations.yml", "res/config/resource_lifecycle.yml"]
+
+
+def get_source_hash(service_path=SERVICE_PATH):
+    """
+    Returns a SHA1 hex digest over the contents of the generated interface modules and definition files.
+    A snapshot is only valid for the same hash.
+    """
+    digest = hashlib.sha1("version=%s" % SNAPSHOT_VERSION)
+    source_files = list(SOURCE_FILES)
+    for dirpath, dirnames, filenames in os.walk(service_path):
+        dirnames.sort()
+        source_files.extend(os.path.join(dirpath, fn) for fn in sorted(filenames) if fn.endswith(".py"))
+    for fn in source_files:
+        digest.update(fn)
+        if os.path.exists(fn):
+            with open(fn, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def create_snapshot(service_registry, source_hash=None):
+    """
+    Returns a snapshot dict of the currently loaded registries: object type names, the extends hierarchy,
+    association and lifecycle definitions and the service map (service name to module and class names).
+    """
+    from pyon.core import registry
+    from pyon.ion import resource
+
+    services = {}
+    for svc_name, svc_def in service_registry.services.iteritems():
+        svc_entry = {}
+        for key in ("base", "client", "simple_client", "interface"):
+            cls = getattr(svc_def, key, None)
+            if cls is not None:
+                svc_entry[key] = cls.__name__
+        base = getattr(svc_def, "base", None)
+        if base is not None:
+            svc_entry["module"] = base.__module__
+        services[svc_name] = svc_entry
+    for svc_name, mod_qual in service_registry.service_index.iteritems():
+        services.setdefault(svc_name, dict(module=mod_qual))
+
+    snapshot = dict(version=SNAPSHOT_VERSION,
+                    hash=source_hash or get_source_hash(),
+                    model_classes=sorted(registry.model_classes),
+                    enum_classes=sorted(registry.enum_classes),
+                    message_classes=sorted(registry.message_classes),
+                    extends=registry.get_extends_map(),
+                    predicates=resource.Predicates.values(),
+                    compound_associations=dict(resource.CompoundAssociations),
+                    resource_lifecycle=resource.ResourceLifecycleDefs,
+                    services=services)
+    return snapshot
+
+
+def _to_str(obj):
+    """Recursively converts unicode strings from JSON to UTF-8 str, as used by the definitions loaded from YAML"""
+    if isinstance(obj, unicode):
+        return obj.encode("utf8")
+    elif isinstance(obj, list):
+        return [_to_str(v) for v in obj]
+    elif isinstance(obj, dict):
+        return dict((_to_str(k), _to_str(v)) for k, v in obj.iteritems())
+    return obj
+
+
+def load_snapshot(path=DEFAULT_SNAPSHOT_PATH, source_hash=None):
+    """
+    Returns the snapshot dict from given file or None if the file does not exist, cannot be read or
+    does not match the current source hash.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            snapshot = _to_str(json.load(f))
+    except Exception as ex:
+        log.warn("Cannot read registry snapshot %s: %s", path, ex)
+        return None
+
+    source_hash = source_hash or get_source_hash()
+    if snapshot.get("version", None) != SNAPSHOT_VERSION or snapshot.get("hash", None) != source_hash:
+        log.info("Registry snapshot %s is outdated", path)
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot, path=DEFAULT_SNAPSHOT_PATH):
+    """
+    Writes the snapshot dict to given file, replacing it atomically. Failures are logged only.
+    """
+    try:
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.rename(tmp_path, path)
+        log.debug("Saved registry snapshot to %s", path)
+    except Exception as ex:
+        log.warn("Cannot write registry snapshot %s: %s", path, ex)
+
+
+def build_snapshot_file(path=DEFAULT_SNAPSHOT_PATH):
+    """
+    Loads all registries the way bootstrap_pyon does without snapshot and writes the snapshot file.
+    Called after interface generation so that containers can start from the snapshot.
+    """
+    start_time = time.time()
+    from pyon.core import bootstrap
+    from pyon.core.registry import IonObjectRegistry
+    from pyon.ion.service import IonServiceRegistry
+    from pyon.ion import resource
+
+    if bootstrap.get_obj_registry() is None:
+        bootstrap._obj_registry = IonObjectRegistry()
+    service_registry = IonServiceRegistry()
+    service_registry.load_service_mods(SERVICE_PATH)
+    service_registry.build_service_map()
+    resource.load_definitions()
+
+    save_snapshot(create_snapshot(service_registry), path)
+    log.info("Built registry snapshot %s in %.2f s", path, time.time() - start_time)
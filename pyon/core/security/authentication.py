@@ -17,6 +17,7 @@ from M2Crypto import EVP, X509
 
 from pyon.core.bootstrap import CFG
 from pyon.container.cc import Container
+from pyon.util.cache import LRUTTLCache
 from pyon.util.log import log
 
 #XXX @note What is this?
@@ -41,6 +42,8 @@ class Authentication(object):
         self.cont_key = None
         self.root_cert = None
         self.white_list = []
+        # Certificates that passed validation -> (public key, end of validity)
+        self._verified_certs = LRUTTLCache(max_size=int(CFG.get_safe('authentication.cert_cache_size', 100)))
 
         # Look for certificates and keys in "the usual places"
         certstore_path = self.certstore = CFG.get_safe('authentication.certstore', CERTSTORE_PATH)
@@ -73,6 +76,7 @@ class Authentication(object):
     def add_to_white_list(self, root_cert_string):
         log.debug("Adding certificate <%s> to white list" % root_cert_string)
         self.white_list.append(root_cert_string)
+        self._verified_certs.clear()
 
     def get_container_cert(self):
         return self.cont_cert
@@ -117,16 +121,21 @@ class Authentication(object):
         """
 
         # Check validity of certificate
-        status, cause = self.is_certificate_valid(cert_string)
-        if status != "Valid":
-            log.debug("Message <%s> signed with invalid certificate <%s>. Cause <%s>" % (str(message), cert_string, cause))
-            return status, cause
+        pubkey = self._get_verified_pubkey(cert_string)
+        if pubkey is None:
+            status, cause = self.is_certificate_valid(cert_string)
+            if status != "Valid":
+                log.debug("Message signed with invalid certificate <%s>. Cause <%s>", cert_string, cause)
+                return status, cause
+
+            x509 = X509.load_cert_string(cert_string)
+            pubkey = x509.get_pubkey()
+            not_valid_after = datetime.datetime.strptime(str(x509.get_not_after()), "%b %d %H:%M:%S %Y %Z")
+            self._verified_certs.put(cert_string, (pubkey, not_valid_after))
 
         hash = hashlib.sha1(message).hexdigest()
 
         # Check validity of signature
-        x509 = X509.load_cert_string(cert_string)
-        pubkey = x509.get_pubkey()
         pubkey.verify_init()
         pubkey.verify_update(hash)
         outcome = pubkey.verify_final(signed_message)
@@ -135,6 +144,19 @@ class Authentication(object):
         else:
             return 'Invalid', 'Signature failed verification'
 
+    def _get_verified_pubkey(self, cert_string):
+        """
+        Returns the public key of a previously validated certificate or None if not cached or no longer valid
+        """
+        entry = self._verified_certs.get(cert_string)
+        if entry is None:
+            return None
+        pubkey, not_valid_after = entry
+        if datetime.datetime.utcnow() > not_valid_after:
+            self._verified_certs.pop(cert_string)
+            return None
+        return pubkey
+
     def decode_certificate_string(self, cert_string):
         """
         Return a Dict of all known attributes for the certificate
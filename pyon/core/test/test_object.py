@@ -8,6 +8,7 @@ from pyon.core.registry import IonObjectRegistry
 from pyon.core.bootstrap import IonObject
 from pyon.core.object import IonObjectSerializer, IonObjectDeserializer
 from pyon.core.bootstrap import get_obj_registry
+from pyon.core.exception import NotFound
 from pyon.util.int_test import IonIntegrationTestCase
 from nose.plugins.attrib import attr
 import unittest
@@ -53,6 +54,30 @@ class ObjectTest(IonIntegrationTestCase):
         obj.abstract_val = user_info
         obj._validate
 
+    def test_get_decoder(self):
+        decoder = self.registry.get_decoder('SampleObject')
+        self.assertIs(self.registry.get_decoder('SampleObject'), decoder)
+
+        # All fields present: the dict becomes the object state
+        obj_dict = self.registry.new('SampleObject', name=u'monkey').__dict__.copy()
+        obj_dict['name'] = u'monkey'
+        obj = decoder(obj_dict)
+        self.assertEqual(type(obj).__name__, 'SampleObject')
+        self.assertIs(obj.__dict__, obj_dict)
+        self.assertEqual(obj.name, 'monkey')
+        self.assertIsInstance(obj.name, str)
+        obj._validate()
+
+        # Missing fields get their defaults
+        obj = decoder({'type_': 'SampleObject', 'name': 'monkey'})
+        self.assertEqual(obj.name, 'monkey')
+        self.assertEqual(obj.time, "1341269890404")
+
+        # Unknown fields still go through setattr validation
+        self.assertRaises(AttributeError, decoder, dict(obj.__dict__, extra_field=5))
+
+        self.assertRaises(NotFound, self.registry.get_decoder, 'NoSuchObject')
+
     def test_persisted_version(self):
 
         # create an initial version of SampleResource
@@ -422,6 +447,38 @@ class ObjectTest(IonIntegrationTestCase):
         # Should work
         obj._validate
 
+    def test_compiled_validator(self):
+        from pyon.core.object import compile_validator, get_validator
+
+        base_args = {"list1": [1], "list2": ["One element"], "dict1": {"key1": 1}, "dict2": {"key1": 1},
+                     "an_important_value": "good value", "us_phone_number": "555-555-5555"}
+        variants = [{}, {"an_important_value": None}, {"list1": ["Not numeric"]}, {"list2": []}, {"dict2": {}},
+                    {"unsigned_short_int": -1}, {"unsigned_short_int": 256}, {"a_float": 10.11},
+                    {"us_phone_number": "5555555555"}, {"us_phone_number": u"555-555-5555"}, {"list1": (1, 2)}]
+
+        obj = IonObject('Deco_Example', base_args)
+        self.assertIs(get_validator(type(obj)), get_validator(type(obj)))
+        self.assertTrue(callable(compile_validator(type(obj))))
+
+        # Compiled and interpreted validation must agree on outcome and value conversions
+        for variant in variants:
+            results = []
+            for validate_method in ("_validate", "_validate_schema"):
+                args = dict(base_args)
+                args.update(variant)
+                obj = IonObject('Deco_Example', args)
+                try:
+                    getattr(obj, validate_method)()
+                    results.append(("OK", obj.__dict__))
+                except AttributeError as ae:
+                    results.append(("ERR", str(ae)))
+            self.assertEquals(results[0], results[1], "Mismatch for %s" % variant)
+
+        obj = self.registry.new('SampleObject', name="sample")
+        obj._validate()
+        obj.name = 1
+        self.assertRaises(AttributeError, obj._validate)
+
     @unittest.skip("no more recursive encoding on set")
     def test_recursive_encoding(self):
         obj = self.registry.new('SampleObject')
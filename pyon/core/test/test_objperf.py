@@ -185,6 +185,18 @@ class ObjectPerfTest(IonUnitTestCase):
         with time_it("recursive_utf8encode1"):
             recursive_encode1(o2)
 
+    def test_validate(self):
+        objs = [IonObject("DataProduct", name="TestObject %s" % i, description="Description %s" % i)
+                for i in xrange(20000)]
+
+        with time_it("validate schema (interpreted)"):
+            for obj in objs:
+                obj._validate_schema()
+
+        with time_it("validate (compiled)"):
+            for obj in objs:
+                obj._validate()
+
 def count_objs(obj):
     counters = {}
     def _count(obj):
@@ -317,3 +329,53 @@ class MessagingPerfTest(IonUnitTestCase):
 
         count_objs(test_obj1)
         time_serialize(test_obj1, "dict of ion nested validated", has_ion=True)
+
+    def test_perf_signature(self):
+        from pyon.core.interceptor.interceptor import Invocation
+        from pyon.core.interceptor.encode import EncodeInterceptor
+        from pyon.core.interceptor.signature import DictSorter
+        import hashlib
+
+        # About 1MB message payload of nested dicts and lists
+        message = create_test_object(3, 44, do_list=True, do_dict=True)
+        encode = EncodeInterceptor()
+        invocation = encode.outgoing(Invocation(message=message))
+        log.info("Signature input message size: %s bytes", len(invocation.message))
+
+        with time_it("signature input, sorted message str (previous)"):
+            sign_input = str(DictSorter().serialize(message))
+            hashlib.sha1(sign_input).hexdigest()
+
+        with time_it("signature input, encoded bytes"):
+            hashlib.sha1(invocation.message).hexdigest()
+
+    def test_perf_nparray(self):
+        import numpy as np
+        from pyon.core.interceptor.interceptor import Invocation
+        from pyon.core.interceptor.encode import EncodeInterceptor, NPARRAY_HEADER, NPARRAY_RAW
+
+        # Granule sized payload: 1M samples of a few parameters
+        granule = {'time': np.arange(1000000, dtype='float64'),
+                   'temp': np.random.uniform(0, 30, 1000000).astype('float32'),
+                   'qc': np.zeros(1000000, dtype='int8')}
+
+        encode = EncodeInterceptor()
+        timings = {}
+        for nparray_encoding in ('list', 'raw'):
+            invocation = Invocation(message=granule, headers={NPARRAY_HEADER: NPARRAY_RAW})
+            encode.configure({'nparray_encoding': nparray_encoding})
+
+            t1 = time.time()
+            with time_it("nparray granule %s, encode" % nparray_encoding):
+                encode.outgoing(invocation)
+            log.info("  len(msg): %s", len(invocation.message))
+
+            with time_it("nparray granule %s, decode" % nparray_encoding):
+                encode.incoming(invocation)
+            timings[nparray_encoding] = time.time() - t1
+
+            for k, v in granule.iteritems():
+                self.assertTrue((invocation.message[k] == v).all())
+
+        log.info("nparray granule speedup raw vs list: %.1fx", timings['list'] / timings['raw'])
+        self.assertLess(timings['raw'], timings['list'])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import inspect
+import os
+import shutil
+import tempfile
+import time
+from nose.plugins.attrib import attr
+
+from pyon.core import registry
+from pyon.core.bootstrap import get_service_registry
+from pyon.core.registry import IonObjectRegistry, get_extends_map, model_classes
+from pyon.core.registry_snapshot import create_snapshot, save_snapshot, load_snapshot
+from pyon.ion import resource
+from pyon.ion.resource import RT, PRED, LCS
+from pyon.util.log import log
+from pyon.util.unit_test import IonUnitTestCase
+
+
+@attr('UNIT')
+class RegistrySnapshotTest(IonUnitTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_extends_map(self):
+        extends = get_extends_map()
+        for type_name in ("IonObjectBase", "Resource", "ActorIdentity"):
+            base_cls = model_classes[type_name]
+            expected = [name for name, cls in model_classes.iteritems() if base_cls in inspect.getmro(cls)]
+            self.assertEquals(sorted(extends[type_name]), sorted(expected))
+        self.assertIn("Resource", extends["Resource"])
+        self.assertNotIn("IonObjectBase", extends["Resource"])
+
+    def test_snapshot(self):
+        snapshot = create_snapshot(get_service_registry())
+        self.assertIn("resource_registry", snapshot["services"])
+        self.assertTrue(snapshot["services"]["resource_registry"]["module"].startswith("interface.services"))
+
+        path = os.path.join(self.tmp_dir, "snapshot.json")
+        save_snapshot(snapshot, path)
+        self.assertEquals(load_snapshot(path, source_hash="0"), None)
+        self.assertEquals(load_snapshot(os.path.join(self.tmp_dir, "none.json")), None)
+
+        loaded = load_snapshot(path, source_hash=snapshot["hash"])
+        self.assertEquals(loaded["model_classes"], snapshot["model_classes"])
+        self.assertIs(type(loaded["model_classes"][0]), str)
+
+        # Registries initialized from the snapshot have the same contents
+        rt_before, pred_before, lcs_before = dict(RT), dict(PRED), dict(LCS)
+        IonObjectRegistry(loaded)
+        resource.load_definitions(loaded)
+        self.assertEquals(dict(RT), rt_before)
+        self.assertEquals(dict(PRED), pred_before)
+        self.assertEquals(dict(LCS), lcs_before)
+        self.assertEquals(sorted(registry.getextends("Resource")), sorted(snapshot["extends"]["Resource"]))
+
+    def test_startup_time(self):
+        path = os.path.join(self.tmp_dir, "snapshot.json")
+        save_snapshot(create_snapshot(get_service_registry()), path)
+
+        t1 = time.time()
+        IonObjectRegistry()
+        resource.load_definitions()
+        t2 = time.time()
+        snapshot = load_snapshot(path)
+        IonObjectRegistry(snapshot)
+        resource.load_definitions(snapshot)
+        t3 = time.time()
+        self.assertIsNotNone(snapshot)
+
+        log.info("Registry startup time: without snapshot %1.4f s, with snapshot %1.4f s", t2 - t1, t3 - t2)
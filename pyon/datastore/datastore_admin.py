@@ -4,13 +4,113 @@
 
 import json
 import datetime
+import gevent
+import gzip
+import hashlib
 import os
 import os.path
+import time
 
 from pyon.core.exception import BadRequest, NotFound
 from pyon.datastore.datastore_common import DatastoreFactory
 from pyon.public import log
 
+COMPACTDUMP_READ_SIZE = 1024*1024
+
+DUMP_SHARD_ROWS = 100000                # Max objects per dump shard
+DUMP_SHARD_SIZE = 128*1024*1024         # Max uncompressed bytes per dump shard
+DUMP_MANIFEST_SUFFIX = "_manifest.json"
+# Load phases of object types that must be loaded after others (see OBJ_TYPE_PRECED in Postgres datastore)
+DUMP_LOAD_PHASES = {"Association": 2, "DirEntry": 3}
+LOAD_POOL_SIZE = 4
+
+
+def iter_compact_dump(fp, read_size=COMPACTDUMP_READ_SIZE):
+    """
+    Generator yielding the objects of a COMPACTDUMP file (["COMPACTDUMP", [obj, ...]]) one by one,
+    parsing the file incrementally so that only one read chunk and one object are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = fp.read(read_size)
+    # Skip prefix up to the start of the object list
+    while "COMPACTDUMP" not in buf or buf.find("[", buf.find("COMPACTDUMP")) == -1:
+        data = fp.read(read_size)
+        if not data:
+            raise BadRequest("Not a COMPACTDUMP file")
+        buf += data
+    start = buf.find("[", buf.find("COMPACTDUMP"))
+    pos = start + 1
+
+    while True:
+        # Skip separators between objects
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                break
+            buf, pos = fp.read(read_size), 0
+            if not buf:
+                raise BadRequest("Unexpected end of COMPACTDUMP file")
+        if buf[pos] == "]":
+            return
+
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                break
+            except ValueError:
+                data = fp.read(read_size)
+                if not data:
+                    raise
+                buf, pos = buf[pos:] + data, 0
+        yield obj
+        pos = end
+
+
+def iter_dump_shard(filename, rows=None, sha1=None):
+    """
+    Generator yielding the objects of a gzip compressed line-delimited JSON dump shard.
+    If rows or sha1 (of the uncompressed content) are given, raises BadRequest after the last object
+    if the shard does not match.
+    """
+    digest = hashlib.sha1()
+    num_rows = 0
+    with gzip.open(filename, "rb") as f:
+        for line in f:
+            digest.update(line)
+            num_rows += 1
+            yield json.loads(line)
+    if (rows is not None and num_rows != rows) or (sha1 and digest.hexdigest() != sha1):
+        raise BadRequest("Dump shard %s does not match manifest" % filename)
+
+
+class DumpShardWriter(object):
+    """
+    Writes objects to a gzip compressed line-delimited JSON file, keeping row count and checksum
+    for the dump manifest.
+    """
+
+    def __init__(self, filename, phase=1):
+        self.filename = filename
+        self.phase = phase
+        self.rows = 0
+        self.size = 0
+        self._digest = hashlib.sha1()
+        self._file = gzip.open(filename, "wb")
+
+    def write(self, obj):
+        line = json.dumps(obj) + "\n"
+        self._file.write(line)
+        self._digest.update(line)
+        self.rows += 1
+        self.size += len(line)
+
+    def close(self):
+        """Closes the file and returns its manifest entry"""
+        self._file.close()
+        return dict(file=os.path.basename(self.filename), rows=self.rows, phase=self.phase,
+                    sha1=self._digest.hexdigest())
+
 
 class DatastoreAdmin(object):
 
@@ -29,14 +129,16 @@ class DatastoreAdmin(object):
             return None
         return ("%s_%s" % (self.sysname, ds_name)).lower()
 
-    def dump_datastore(self, path=None, ds_name=None, clear_dir=True):
+    def dump_datastore(self, path=None, ds_name=None, clear_dir=True, sharded=False, shard_rows=DUMP_SHARD_ROWS):
         """
         Dumps CouchDB datastores into a directory as YML files.
         @param ds_name Logical name (such as "resources") of an ION datastore
         @param path Directory to put dumped datastores into (defaults to
                     "res/preload/local/dump_[timestamp]")
         @param clear_dir if True, delete contents of datastore dump dirs
-        @param compact if True, saves all objects in one big YML file
+        @param sharded if True, streams objects into gzip compressed line-delimited JSON shards of at most
+                    shard_rows objects plus a manifest with row counts and checksums, in constant memory.
+                    Otherwise saves all objects in one big COMPACTDUMP JSON file
         """
         if not path:
             dtstr = datetime.datetime.today().strftime('%Y%m%d_%H%M%S')
@@ -44,16 +146,16 @@ class DatastoreAdmin(object):
         if ds_name:
             ds = DatastoreFactory.get_datastore(datastore_name=ds_name, config=self.config, scope=self.sysname)
             if ds.datastore_exists(ds_name):
-                self._dump_datastore(path, ds_name, clear_dir)
+                self._dump_datastore(path, ds_name, clear_dir, sharded, shard_rows)
             else:
                 log.warn("Datastore does not exist")
             ds.close()
         else:
             ds_list = ['resources', 'objects', 'state', 'events']
             for dsn in ds_list:
-                self._dump_datastore(path, dsn, clear_dir)
+                self._dump_datastore(path, dsn, clear_dir, sharded, shard_rows)
 
-    def _dump_datastore(self, outpath_base, ds_name, clear_dir=True):
+    def _dump_datastore(self, outpath_base, ds_name, clear_dir=True, sharded=False, shard_rows=DUMP_SHARD_ROWS):
         ds = DatastoreFactory.get_datastore(datastore_name=ds_name, config=self.config, scope=self.sysname)
         try:
             if not ds.datastore_exists(ds_name):
@@ -69,6 +171,10 @@ class DatastoreAdmin(object):
             if clear_dir:
                 [os.remove(os.path.join(outpath, f)) for f in os.listdir(outpath)]
 
+            if sharded:
+                self._dump_datastore_sharded(ds, outpath, ds_name, shard_rows)
+                return
+
             objs = ds.find_docs_by_view("_all_docs", None, id_only=False)
             compact_obj = [obj for obj_id, obj_key, obj in objs]
             compact_obj= ["COMPACTDUMP", compact_obj]
@@ -80,9 +186,46 @@ class DatastoreAdmin(object):
         finally:
             ds.close()
 
-    def load_datastore(self, path=None, ds_name=None, ignore_errors=True):
+    def _dump_datastore_sharded(self, ds, outpath, ds_name, shard_rows=DUMP_SHARD_ROWS):
+        """
+        Writes all objects of a datastore into dump shards and a manifest. Objects are streamed from a
+        server-side cursor where supported. A new shard is started when a shard is full or objects
+        of a different load phase follow, so that shards of the same phase can be loaded in parallel.
+        """
+        if hasattr(ds, "iter_all_docs"):
+            rows = ds.iter_all_docs(id_only=False)
+        else:
+            rows = ds.find_docs_by_view("_all_docs", None, id_only=False)
+
+        start_time = time.time()
+        shards = []
+        writer = None
+        try:
+            for obj_id, obj_key, obj in rows:
+                phase = DUMP_LOAD_PHASES.get(obj.get("type_", None), 1)
+                if writer is None or writer.phase != phase or writer.rows >= shard_rows or writer.size >= DUMP_SHARD_SIZE:
+                    if writer:
+                        shards.append(writer.close())
+                        log.info("DatastoreAdmin: Dumping %s: %s shards", ds_name, len(shards))
+                    writer = DumpShardWriter("%s/%s_%04d.json.gz" % (outpath, ds_name, len(shards)), phase)
+                writer.write(obj)
+        finally:
+            if writer:
+                shards.append(writer.close())
+
+        manifest = dict(format="JSONLINES_GZ", datastore=ds_name, created=datetime.datetime.utcnow().isoformat(),
+                        rows=sum(shard["rows"] for shard in shards), shards=shards)
+        with open("%s/%s%s" % (outpath, ds_name, DUMP_MANIFEST_SUFFIX), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        log.info("Wrote %s objects in %s shards to %s in %.1f s" % (manifest["rows"], len(shards), outpath,
+                                                                     time.time() - start_time))
+
+    def load_datastore(self, path=None, ds_name=None, ignore_errors=True, parallel=True):
         """
         Loads data from files into a datastore
+        @param parallel  if True, loads independent datastores and dump shards of the same load phase
+                         concurrently in separate threads (only where the datastore supports bulk COPY loading)
         """
         path = path or "res/preload/default"
         if not os.path.exists(path):
@@ -91,45 +234,120 @@ class DatastoreAdmin(object):
         if not os.path.isdir(path):
             log.error("Path is not a directory: %s" % path)
 
-        if ds_name:
-            # Here we expect path to contain YML files for given datastore
-            log.info("DatastoreLoader: LOAD datastore=%s" % ds_name)
-            self._load_datastore(path, ds_name, ignore_errors)
-        else:
-            # Here we expect path to have subdirs that are named according to logical
-            # datastores, e.g. "resources"
-            log.info("DatastoreLoader: LOAD ALL DATASTORES")
-            for fn in os.listdir(path):
-                fp = os.path.join(path, fn)
-                if not os.path.exists(path):
-                    log.warn("Item %s is not a directory" % fp)
+        from pyon.util.async import ThreadPool
+        pool = ThreadPool(LOAD_POOL_SIZE) if parallel else None
+        try:
+            if ds_name:
+                # Here we expect path to contain YML files for given datastore
+                log.info("DatastoreLoader: LOAD datastore=%s" % ds_name)
+                self._load_datastore(path, ds_name, ignore_errors, pool)
+            else:
+                # Here we expect path to have subdirs that are named according to logical
+                # datastores, e.g. "resources"
+                log.info("DatastoreLoader: LOAD ALL DATASTORES")
+                ds_paths = []
+                for fn in os.listdir(path):
+                    fp = os.path.join(path, fn)
+                    if not os.path.isdir(fp):
+                        log.warn("Item %s is not a directory" % fp)
+                        continue
+                    ds_paths.append((fp, fn))
+
+                if pool:
+                    # Datastores are loaded in greenlets, only the COPY loading runs in the pool threads,
+                    # using separate blocking connections
+                    gls = [gevent.spawn(self._load_datastore, fp, fn, ignore_errors, pool) for fp, fn in ds_paths]
+                    gevent.joinall(gls, raise_error=True)
+                else:
+                    for fp, fn in ds_paths:
+                        self._load_datastore(fp, fn, ignore_errors)
+        finally:
+            if pool:
+                pool.close()
+
+    def _iter_load_objects(self, path, ignore_errors=True):
+        """
+        Generator yielding the objects of all JSON files in path without _rev, streaming COMPACTDUMP files.
+        """
+        for fn in sorted(os.listdir(path)):
+            fp = os.path.join(path, fn)
+            if fn.endswith(DUMP_MANIFEST_SUFFIX):
+                continue
+            try:
+                if fn.endswith(".json.gz"):
+                    for obj in iter_dump_shard(fp):
+                        obj.pop("_rev", None)
+                        yield obj
                     continue
-                self._load_datastore(fp, fn, ignore_errors)
+                with open(fp, 'r') as f:
+                    if "COMPACTDUMP" in f.read(64):
+                        f.seek(0)
+                        objects = iter_compact_dump(f)
+                    else:
+                        f.seek(0)
+                        objects = [json.load(f)]
+                    for obj in objects:
+                        obj.pop("_rev", None)
+                        yield obj
+            except Exception as ex:
+                if ignore_errors:
+                    log.warn("load error id=%s err=%s" % (fn, str(ex)))
+                else:
+                    raise ex
+
+    def _read_manifest(self, path):
+        for fn in os.listdir(path):
+            if fn.endswith(DUMP_MANIFEST_SUFFIX):
+                with open(os.path.join(path, fn), 'r') as f:
+                    return json.load(f)
+
+    def _copy_load_datastore(self, ds, path, ds_name, ignore_errors=True, pool=None):
+        """
+        Streams objects from files into a datastore supporting bulk COPY loading, logging progress.
+        Sharded dumps are loaded shard by shard in load phase order, shards of a phase in parallel if
+        a thread pool is given. Each shard is loaded in its own transaction.
+        """
+        start_time = time.time()
+
+        def log_progress(num_loaded):
+            log.info("DatastoreLoader: Loading %s: %s objects (%.0f/s)", ds_name, num_loaded,
+                     num_loaded / max(time.time() - start_time, 0.001))
 
-    def _load_datastore(self, path=None, ds_name=None, ignore_errors=True):
-        ds = DatastoreFactory.get_datastore(datastore_name=ds_name, config=self.config, scope=self.sysname)
         try:
-            objects = []
-            for fn in os.listdir(path):
-                fp = os.path.join(path, fn)
-                try:
-                    with open(fp, 'r') as f:
-                        json_text = f.read()
-                    obj = json.loads(json_text)
-                    if obj and type(obj) is list and obj[0] == "COMPACTDUMP":
-                        objects.extend(obj[1])
-                    else:
-                        objects.append(obj)
-                except Exception as ex:
-                    if ignore_errors:
-                        log.warn("load error id=%s err=%s" % (fn, str(ex)))
+            manifest = self._read_manifest(path)
+            if manifest:
+                num_loaded = 0
+                for phase in sorted(set(shard["phase"] for shard in manifest["shards"])):
+                    shard_docs = [iter_dump_shard(os.path.join(path, shard["file"]), shard["rows"], shard["sha1"])
+                                  for shard in manifest["shards"] if shard["phase"] == phase]
+                    if pool:
+                        results = [pool.apply_async(ds.load_docs_copy, docs) for docs in shard_docs]
+                        num_loaded += sum(res.get() for res in results)
                     else:
-                        raise ex
+                        num_loaded += sum(ds.load_docs_copy(docs) for docs in shard_docs)
+                    log_progress(num_loaded)
+            elif pool:
+                num_loaded = pool.apply(ds.load_docs_copy, self._iter_load_objects(path, ignore_errors),
+                                        progress_cb=log_progress)
+            else:
+                num_loaded = ds.load_docs_copy(self._iter_load_objects(path, ignore_errors), progress_cb=log_progress)
+            log.info("DatastoreLoader: Loaded %s objects into %s in %.1f s", num_loaded, ds_name,
+                     time.time() - start_time)
+        except Exception as ex:
+            if ignore_errors:
+                log.warn("load error err=%s" % (str(ex)))
+            else:
+                raise ex
+
+    def _load_datastore(self, path=None, ds_name=None, ignore_errors=True, pool=None):
+        ds = DatastoreFactory.get_datastore(datastore_name=ds_name, config=self.config, scope=self.sysname)
+        try:
+            if hasattr(ds, "load_docs_copy"):
+                self._copy_load_datastore(ds, path, ds_name, ignore_errors, pool)
+                return
 
+            objects = list(self._iter_load_objects(path, ignore_errors))
             if objects:
-                for obj in objects:
-                    if "_rev" in obj:
-                        del obj["_rev"]
                 try:
                     res = ds.create_doc_mult(objects)
                     log.info("DatastoreLoader: Loaded %s objects into %s" % (len(res), ds_name))
@@ -6,6 +6,8 @@ __author__ = 'Michael Meisinger'
 
 import getpass
 import os.path
+import tempfile
+from cStringIO import StringIO
 from uuid import uuid4
 # Note: standard json is faster than simplejson for dumps
 # See https://confluence.oceanobservatories.org/display/CIDev/Container+Messaging+Performance
@@ -23,7 +25,8 @@ from ooi.logging import log
 from pyon.core.exception import BadRequest, Conflict, NotFound, Inconsistent
 from pyon.datastore.datastore_common import DataStore
 from pyon.datastore.datastore_query import DQ
-from pyon.datastore.postgresql.pg_util import PostgresConnectionPool, StatementBuilder, psycopg2_connect, TracingCursor
+from pyon.datastore.postgresql.pg_util import PostgresConnectionPool, StatementBuilder, psycopg2_connect, TracingCursor, \
+    blocking_mode
 from pyon.util.containers import create_basic_identifier, parse_ion_ts
 from pyon.util.tracer import CallTracer
 
@@ -41,6 +44,7 @@ OBJ_SPECIAL = {"R": ("", ("type_", "lcstate", "availability", "visibility", "nam
                "E": ("", ("origin", "origin_type", "sub_type", "ts_created", "type_")),
                }
 OBJ_TYPE_PRECED = {"R": 1, "A": 2, "D": 3}
+COPY_CHUNK_SIZE = 5000
 
 # Shared connection pool for container
 pg_connection_pool = None
@@ -73,6 +77,9 @@ class PostgresDataStore(DataStore):
         self.database = self.config.get('database', None) or DEFAULT_DBNAME
         self.default_database = self.config.get('default_database', None) or 'postgres'
         self.pool_maxsize = int(self.config.get('connection_pool_max', 4))
+        self.iter_fetch_size = int(self.config.get('iter_fetch_size', 1000))
+        self.use_prepared = bool(self.config.get('prepared_statements', True))
+        self.insert_batch_size = int(self.config.get('insert_batch_size', 100))
 
         # Database (Postgres database) and datastore (database table) name handling.
         # Scope database with given scope (e.g. sysname).
@@ -90,6 +97,7 @@ class PostgresDataStore(DataStore):
         dsn = "host=%s port=%s dbname=%s user=%s password=%s sslmode=disable connect_timeout=5 application_name=%s" % (
             self.host, self.port, self.database, self.username, self.password, "%s:%s" % ("ion", self.datastore_name))
         log.info("Using Postgres connection DSN: %s", dsn)   # TODO: Remove later because of password
+        self._dsn = dsn
         global pg_connection_pool
         if not pg_connection_pool:
             pg_connection_pool = PostgresConnectionPool(dsn, maxsize=self.pool_maxsize)
@@ -509,17 +517,17 @@ class PostgresDataStore(DataStore):
 
                 extra_cols, table = self._get_extra_cols(doc, qual_ds_name, self.profile)
 
+                # All extra columns are set (NULL if empty) so that the statement is the same for a table
                 statement_args = dict(id=doc["_id"], doc=doc_json)
                 xcol, xval = "", ""
                 if extra_cols:
                     for col in extra_cols:
-                        insert_expr = self._create_value_expression(col, doc, col, statement_args)
-                        if insert_expr:
-                            xcol += ", %s" % col
-                            xval += insert_expr
+                        insert_expr = self._create_value_expression(col, doc, col, statement_args, allow_null_values=True)
+                        xcol += ", %s" % col
+                        xval += insert_expr
 
                 statement = "INSERT INTO " + table + " (id, rev, doc" + xcol + ") VALUES (%(id)s, 1, %(doc)s" + xval + ")"
-                cur.execute(statement, statement_args)
+                self._execute_prepared(cur, statement, statement_args)
                 oid, version = doc["_id"], "1"
             except IntegrityError:
                 raise BadRequest("Object with id %s already exists" % object_id)
@@ -549,49 +557,151 @@ class PostgresDataStore(DataStore):
         with self.pool.cursor(**self.cursor_args) as cur:
             # Need to make sure to first insert resources then associations for referential integrity
             for obj_type in sorted(all_obj_types, key=lambda x: OBJ_TYPE_PRECED.get(x, 10)):
-                sb = StatementBuilder()
                 docs_ot = [doc for (doc, doc_ot) in zip(docs, doc_obj_type) if doc_ot == obj_type]
 
                 # Take the first document to determine the type of objects (resource, association, dir entry)
                 extra_cols, table = self._get_extra_cols(docs_ot[0], qual_ds_name, self.profile)
-                xcol = ""
-                for col in extra_cols:
-                    xcol += ", %s" % col
-                sb.append("INSERT INTO "+table+" (id, rev, doc" + xcol + ") VALUES ")
 
-                # Build a large statement
                 for i, doc in enumerate(docs_ot):
                     object_id = object_ids[i] if object_ids else None
                     if "_id" not in doc:
                         object_id = object_id or self.get_unique_id()
                         doc["_id"] = object_id
-
                     doc["_rev"] = "1"
-                    doc_json = json.dumps(doc)
 
-                    if i>0:
-                        sb.append(",")
+                # Insert in batches of equal size, so that the statement can be prepared once
+                batch_size = self.insert_batch_size
+                for batch_start in xrange(0, len(docs_ot), batch_size):
+                    docs_batch = docs_ot[batch_start:batch_start + batch_size]
+                    statement, statement_args = self._build_insert_mult(table, extra_cols, docs_batch)
+                    try:
+                        if len(docs_batch) == batch_size:
+                            self._execute_prepared(cur, statement, statement_args)
+                        else:
+                            cur.execute(statement, statement_args)
+                        if cur.rowcount != len(docs_batch):
+                            log.warn("Number of objects created (%s) != objects given (%s) in %s", cur.rowcount, len(docs_batch), table)
+                    except IntegrityError as ie:
+                        raise BadRequest("Some object already exists: %s" % ie)
 
-                    sb.statement_args["id"+str(i)] = doc["_id"]
-                    sb.statement_args["doc"+str(i)] = doc_json
-                    xval = ""
-                    for col in extra_cols:
-                        valuename = col + str(i)
-                        insert_expr = self._create_value_expression(col, doc, valuename, sb.statement_args, allow_null_values=True)
-                        xval += insert_expr
+        result_list = [(True, doc["_id"], doc["_rev"]) for doc in docs]
 
-                    sb.append("(%(id", str(i), ")s, 1, %(doc", str(i), ")s", xval, ")")
+        return result_list
 
-                try:
-                    cur.execute(*sb.build())
-                    if cur.rowcount != len(docs_ot):
-                        log.warn("Number of objects created (%s) != objects given (%s) in %s", cur.rowcount, len(docs_ot), table)
-                except IntegrityError as ie:
-                    raise BadRequest("Some object already exists: %s" % ie)
+    def _build_insert_mult(self, table, extra_cols, docs):
+        """Returns a multi-row INSERT statement and its arguments for given documents with ids"""
+        sb = StatementBuilder()
+        xcol = ""
+        for col in extra_cols:
+            xcol += ", %s" % col
+        sb.append("INSERT INTO "+table+" (id, rev, doc" + xcol + ") VALUES ")
 
-        result_list = [(True, doc["_id"], doc["_rev"]) for doc in docs]
+        for i, doc in enumerate(docs):
+            if i>0:
+                sb.append(",")
 
-        return result_list
+            sb.statement_args["id"+str(i)] = doc["_id"]
+            sb.statement_args["doc"+str(i)] = json.dumps(doc)
+            xval = ""
+            for col in extra_cols:
+                valuename = col + str(i)
+                insert_expr = self._create_value_expression(col, doc, valuename, sb.statement_args, allow_null_values=True)
+                xval += insert_expr
+
+            sb.append("(%(id", str(i), ")s, 1, %(doc", str(i), ")s", xval, ")")
+
+        return sb.build()
+
+    def load_docs_copy(self, docs, datastore_name=None, chunk_size=COPY_CHUNK_SIZE, progress_cb=None):
+        """
+        Bulk loads new documents from an iterable using COPY FROM STDIN, in chunks of chunk_size rows,
+        keeping memory bounded independent of the number of documents.
+        Documents of types that must follow others (see OBJ_TYPE_PRECED, e.g. associations) are spooled to
+        temporary files and loaded after all other documents. Runs in one transaction on a dedicated
+        connection in blocking mode, so it can be called from a separate thread.
+        @param progress_cb  called with the number of documents loaded so far after each chunk
+        @retval  the number of documents loaded
+        """
+        qual_ds_name = self._get_datastore_name(datastore_name)
+        min_preced = min(OBJ_TYPE_PRECED.values())
+
+        type_info = {}      # obj_type -> (table, extra_cols, buffer, row count)
+        num_loaded = [0]
+
+        def copy_rows(cur, obj_type, buf):
+            table, extra_cols, _, num_rows = type_info[obj_type]
+            if not num_rows:
+                return
+            buf.seek(0)
+            cur.copy_expert("COPY %s (id, rev, doc%s) FROM STDIN" % (table, "".join(", " + col for col in extra_cols)), buf)
+            num_loaded[0] += num_rows
+            if progress_cb:
+                progress_cb(num_loaded[0])
+
+        with blocking_mode():
+            conn = psycopg2_connect(self._dsn)
+            try:
+                with conn.cursor() as cur:
+                    for doc in docs:
+                        if "_id" not in doc:
+                            doc["_id"] = self.get_unique_id()
+                        doc["_rev"] = "1"
+                        obj_type = self._get_obj_type(doc, self.profile)
+                        if obj_type not in type_info:
+                            extra_cols, table = self._get_extra_cols(doc, qual_ds_name, self.profile)
+                            deferred = OBJ_TYPE_PRECED.get(obj_type, min_preced) > min_preced
+                            buf = tempfile.SpooledTemporaryFile(max_size=10*1024*1024) if deferred else StringIO()
+                            type_info[obj_type] = [table, extra_cols, buf, 0]
+                        info = type_info[obj_type]
+                        info[2].write(self._get_copy_row(doc, info[1]))
+                        info[3] += 1
+
+                        if info[3] >= chunk_size and OBJ_TYPE_PRECED.get(obj_type, min_preced) == min_preced:
+                            copy_rows(cur, obj_type, info[2])
+                            info[2], info[3] = StringIO(), 0
+
+                    for obj_type in sorted(type_info, key=lambda x: OBJ_TYPE_PRECED.get(x, min_preced)):
+                        copy_rows(cur, obj_type, type_info[obj_type][2])
+                        type_info[obj_type][2].close()
+                conn.commit()
+            except IntegrityError as ie:
+                conn.rollback()
+                raise BadRequest("Some object already exists: %s" % ie)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+        return num_loaded[0]
+
+    def _get_copy_row(self, doc, extra_cols):
+        """Returns a line in COPY text format for given document"""
+        values = [doc["_id"], 1, json.dumps(doc)]
+        for col in extra_cols:
+            if col in GEOSPATIAL_COLS:
+                value = self._get_geom_value(col, doc)
+                if value:
+                    value = "SRID=4326;" + value
+            elif col in NUMRANGE_COLS:
+                value = self._get_range_value(col, doc)
+            else:
+                value = doc.get(col, None)
+            values.append(value)
+
+        row = []
+        for value in values:
+            if value is None:
+                row.append("\\N")
+                continue
+            elif type(value) is bool:
+                value = "t" if value else "f"
+            elif isinstance(value, unicode):
+                value = value.encode("utf8")
+            else:
+                value = str(value)
+            row.append(value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r"))
+        return "\t".join(row) + "\n"
 
     def create_attachment(self, doc, attachment_name, data, content_type=None, datastore_name=""):
         if not isinstance(attachment_name, str):
@@ -666,16 +776,15 @@ class PostgresDataStore(DataStore):
 
         extra_cols, table = self._get_extra_cols(doc, table, self.profile)
 
+        # All extra columns are set (NULL if empty) so that the statement is the same for a table
         statement_args = dict(doc=doc_json, id=doc["_id"], rev=old_rev, revn=old_rev+1)
         xval = ""
         if extra_cols:
             for col in extra_cols:
-                insert_expr = self._create_value_expression(col, doc, col, statement_args, assign=True)
-                if insert_expr:
-                    xval += insert_expr
+                xval += self._create_value_expression(col, doc, col, statement_args, allow_null_values=True, assign=True)
 
-        cur.execute("UPDATE "+table+" SET doc=%(doc)s, rev=%(revn)s" + xval + " WHERE id=%(id)s AND rev=%(rev)s",
-                    statement_args)
+        self._execute_prepared(cur, "UPDATE "+table+" SET doc=%(doc)s, rev=%(revn)s" + xval + " WHERE id=%(id)s AND rev=%(rev)s",
+                               statement_args)
         if not cur.rowcount:
             # Distinguish rev conflict from documents does not exist.
             #try:
@@ -744,7 +853,7 @@ class PostgresDataStore(DataStore):
             table = qual_ds_name + "_dir"
 
         with self.pool.cursor(**self.cursor_args) as cur:
-            cur.execute("SELECT doc FROM "+table+" WHERE id=%s", (doc_id,))
+            self._execute_prepared(cur, "SELECT doc FROM "+table+" WHERE id=%s", (doc_id,))
             doc_list = cur.fetchall()
             if not doc_list:
                 raise NotFound('Object with id %s does not exist.' % doc_id)
@@ -760,7 +869,7 @@ class PostgresDataStore(DataStore):
         qual_ds_name = self._get_datastore_name(datastore_name)
 
         with self.pool.cursor(**self.cursor_args) as cur:
-            cur.execute("SELECT rev FROM "+qual_ds_name+" WHERE id=%s", (doc_id,))
+            self._execute_prepared(cur, "SELECT rev FROM "+qual_ds_name+" WHERE id=%s", (doc_id,))
             doc_list = cur.fetchall()
             if not doc_list:
                 raise NotFound('Object with id %s does not exist.' % doc_id)
@@ -788,18 +897,9 @@ class PostgresDataStore(DataStore):
         elif object_type == "DirEntry":
             table = qual_ds_name + "_dir"
 
-        query = "SELECT id, doc FROM "+table+" WHERE id IN ("
-        query_args = dict()
-        for i, oid in enumerate(object_ids):
-            arg_name = "id" + str(i)
-            if i>0:
-                query += ","
-            query += "%(" + arg_name + ")s"
-            query_args[arg_name] = oid
-        query += ")"
-
+        # One array parameter instead of one parameter per id, so that the statement is the same for any number of ids
         with self.pool.cursor(**self.cursor_args) as cur:
-            cur.execute(query, query_args)
+            self._execute_prepared(cur, "SELECT id, doc FROM "+table+" WHERE id=ANY(%s)", (list(object_ids),))
             rows = cur.fetchall()
 
         doc_by_id = {row[0]: row[1] for row in rows}
@@ -869,12 +969,16 @@ class PostgresDataStore(DataStore):
             table = qual_ds_name + "_dir"
 
         with self.pool.cursor(**self.cursor_args) as cur:
-            for doc_id in object_ids:
-                self._delete_doc(cur, table, doc_id)
+            self._execute_prepared(cur, "DELETE FROM "+table+" WHERE id=ANY(%s) RETURNING id", (list(object_ids),))
+            deleted_ids = {row[0] for row in cur.fetchall()}
+            notfound_list = ['Object with id %s does not exist.' % doc_id
+                             for doc_id in object_ids if doc_id not in deleted_ids]
+            if notfound_list:
+                raise NotFound("\n".join(notfound_list))
 
     def _delete_doc(self, cur, table, doc_id):
         sql = "DELETE FROM "+table+" WHERE id=%s"
-        cur.execute(sql, (doc_id, ))
+        self._execute_prepared(cur, sql, (doc_id, ))
         if not cur.rowcount:
             raise NotFound('Object with id %s does not exist.' % doc_id)
 
@@ -986,6 +1090,22 @@ class PostgresDataStore(DataStore):
 
         return res_rows
 
+    def iter_all_docs(self, id_only=True, fetch_size=None):
+        """
+        Streaming variant of the _all_docs view. Yields (id, [], doc) tuples like find_docs_by_view, fetching
+        rows in chunks from a server-side cursor so that memory stays bounded independent of the table size.
+        A database connection is held until the iterator is exhausted or closed.
+        """
+        qual_ds_name = self._get_datastore_name()
+        cols = "id" if id_only else "id, doc"
+        tables = [qual_ds_name]
+        if self.profile == DataStore.DS_PROFILE.RESOURCES:
+            tables.extend([qual_ds_name + "_assoc", qual_ds_name + "_dir"])
+        query = " UNION ALL ".join("SELECT %s FROM %s" % (cols, table) for table in tables)
+
+        for row in self._iter_rows(query, fetch_size=fetch_size):
+            yield self._prep_id(row[0]), [], None if id_only else self._prep_doc(row[-1])
+
     def _find_directory(self, view_name, key=None, keys=None, start_key=None, end_key=None,
                         id_only=True, filter=None):
         qual_ds_name = self._get_datastore_name()
@@ -1000,6 +1120,9 @@ class PostgresDataStore(DataStore):
             parent = key[2]
             query_args.update(dict(org=org, parent=parent, key=entry))
             query_clause += "org=%(org)s AND parent=%(parent)s AND key=%(key)s"
+        elif view_name == "by_key" and keys:
+            query_args.update(dict(keys=tuple(tuple(k) for k in keys)))
+            query_clause += "(org, key, parent) IN %(keys)s"
         elif view_name == "by_key" and start_key:
             org = start_key[0]
             entry = start_key[1]
@@ -1193,6 +1316,34 @@ class PostgresDataStore(DataStore):
     def get_unique_id(self):
         return uuid4().hex
 
+    def _execute_prepared(self, cur, statement, statement_args=None):
+        """Executes a statement as server-side prepared statement, unless disabled in the config"""
+        if self.use_prepared:
+            return cur.execute_prepared(statement, statement_args)
+        return cur.execute(statement, statement_args)
+
+    def _iter_rows(self, statement, values=None, fetch_size=None, result=None):
+        """
+        Generator executing a statement with a named (server-side) cursor and yielding the result rows,
+        fetched from the server in chunks of fetch_size rows.
+        If result is a dict, it is updated with the executed statement and the final row count.
+        """
+        fetch_size = fetch_size or self.iter_fetch_size
+        with self.pool.cursor(name="iter_%s" % uuid4().hex, **self.cursor_args) as cur:
+            cur.execute(statement, values)
+            if result is not None:
+                result["statement_sql"] = cur.query
+            rowcount = 0
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                rowcount += len(rows)
+                for row in rows:
+                    yield row
+            if result is not None:
+                result["rowcount"] = rowcount
+
     def _prep_id(self, internal_id):
         return internal_id.replace("-", "")
 
@@ -112,28 +112,67 @@ class PostgresPyonDataStore(PostgresDataStore):
         """
         Returns a list of associations for a given list of subjects
         """
-        # TODO: Port this implementation to Postgres single query
-        res_list = [[], []]
-        if not subjects:
-            return res_list
-        for sub in subjects:
-            res_ids, res_assocs = self.find_objects(subject=sub, id_only=id_only, predicate=predicate, access_args=access_args)
-            res_list[0].extend(res_ids)
-            res_list[1].extend(res_assocs)
-        return res_list
+        return self._find_related_mult(subjects, id_only=id_only, predicate=predicate, access_args=access_args,
+                                       backward=False)
 
     def find_subjects_mult(self, objects, id_only=False, predicate=None, access_args=None):
         """
         Returns a list of associations for a given list of objects
         """
-        # TODO: Port this implementation to Postgres single query
+        return self._find_related_mult(objects, id_only=id_only, predicate=predicate, access_args=access_args,
+                                       backward=True)
+
+    def _find_related_mult(self, resources, id_only=False, predicate=None, access_args=None, backward=False):
+        """
+        Returns a 2-list of related resources (ids or objects) and associations for a list of subjects
+        (or objects, if backward), in a single query. Results are grouped in the order of the given resources.
+        """
         res_list = [[], []]
-        if not objects:
+        if not resources:
             return res_list
-        for obj in objects:
-            res_ids, res_assocs = self.find_subjects(obj=obj, id_only=id_only, predicate=predicate, access_args=access_args)
-            res_list[0].extend(res_ids)
-            res_list[1].extend(res_assocs)
+        if type(id_only) is not bool:
+            raise BadRequest('id_only must be type bool, not %s' % type(id_only))
+
+        res_ids = []
+        for res in resources:
+            if type(res) is str:
+                res_ids.append(res)
+            elif "_id" in res:
+                res_ids.append(res._id)
+            else:
+                raise BadRequest("Object id not available in %s" % ("object" if backward else "subject"))
+
+        qual_ds_name = self._get_datastore_name()
+        assoc_table_name = qual_ds_name+"_assoc"
+        table_names = dict(ds=qual_ds_name, dsa=assoc_table_name,
+                           rel="s" if backward else "o", key="o" if backward else "s")
+
+        if id_only:
+            query = "SELECT %(dsa)s.%(rel)s, %(dsa)s.%(key)s, %(dsa)s.doc FROM %(dsa)s, %(ds)s WHERE retired<>true AND %(dsa)s.%(rel)s=%(ds)s.id " % table_names
+        else:
+            query = "SELECT %(ds)s.doc, %(dsa)s.%(key)s, %(dsa)s.doc FROM %(dsa)s, %(ds)s WHERE retired<>true AND %(dsa)s.%(rel)s=%(ds)s.id " % table_names
+        query_args = dict(ids=tuple(res_ids), p=predicate)
+
+        query_clause = "AND %(dsa)s.%(key)s IN %%(ids)s" % table_names
+        if predicate:
+            query_clause += " AND p=%(p)s"
+
+        query_clause = self._add_access_filter(access_args, qual_ds_name, query_clause, query_args)
+        with self.pool.cursor(**self.cursor_args) as cur:
+            cur.execute(query + query_clause, query_args)
+            rows = cur.fetchall()
+
+        # Keep the grouping of results by given resource
+        res_order = {}
+        for i, res_id in enumerate(res_ids):
+            res_order.setdefault(res_id, i)
+        rows.sort(key=lambda row: res_order.get(self._prep_id(row[1]), 0))
+
+        if id_only:
+            res_list[0] = [self._prep_id(row[0]) for row in rows]
+        else:
+            res_list[0] = [self._persistence_dict_to_ion_object(row[0]) for row in rows]
+        res_list[1] = [self._persistence_dict_to_ion_object(row[-1]) for row in rows]
         return res_list
 
     def find_objects(self, subject, predicate=None, object_type=None, id_only=False, access_args=None, **kwargs):
@@ -725,16 +764,7 @@ class PostgresPyonDataStore(PostgresDataStore):
         @param query  a dict representation of a datastore query
         @retval  list of resource ids or resource objects matching query (dependent on id_only value)
         """
-        qual_ds_name = self._get_datastore_name()
-
-        pqb = PostgresQueryBuilder(query, qual_ds_name)
-        if self.profile == DataStore.DS_PROFILE.RESOURCES and not query["query_args"].get("ds_sub", None):
-            pqb.where = self._add_access_filter(access_args, qual_ds_name, pqb.where, pqb.values, add_where=False)
-
-        if self.profile == DataStore.DS_PROFILE.RESOURCES:
-            pqb.where = self._add_deleted_filter(pqb.basetable, query["query_args"].get("ds_sub", None),
-                                                 pqb.where, pqb.values,
-                                                 show_all=query["query_args"].get("show_all", False))
+        pqb = self._get_query_builder(query, access_args)
 
         with self.pool.cursor(**self.cursor_args) as cur:
             exec_query = pqb.get_query()
@@ -755,6 +785,44 @@ class PostgresPyonDataStore(PostgresDataStore):
             res_docs = [self._persistence_dict_to_ion_object(row[-1]) for row in rows]
             return res_docs
 
+    def iter_by_query(self, query, access_args=None, fetch_size=None):
+        """
+        Generator variant of find_by_query. Results are fetched in chunks of fetch_size rows from a
+        server-side cursor and yielded one by one, so that large results can be streamed with bounded memory.
+        The database connection is held until the iterator is exhausted or closed.
+        @param query  a dict representation of a datastore query
+        @param fetch_size  number of rows per fetch, defaults to the iter_fetch_size datastore config
+        @retval  iterator of resource ids or resource objects matching query (dependent on id_only value)
+        """
+        pqb = self._get_query_builder(query, access_args)
+
+        exec_query = pqb.get_query()
+        query_res = dict(statement_gen=exec_query)
+        query["_result"] = query_res
+
+        id_only = query["query_args"].get("id_only", True)
+        for row in self._iter_rows(exec_query, pqb.get_values(), fetch_size=fetch_size, result=query_res):
+            if id_only:
+                yield self._prep_id(row[0])
+            else:
+                yield self._persistence_dict_to_ion_object(row[-1])
+
+    def _get_query_builder(self, query, access_args=None):
+        """
+        Returns a PostgresQueryBuilder for given query, with access and deleted filters applied.
+        """
+        qual_ds_name = self._get_datastore_name()
+
+        pqb = PostgresQueryBuilder(query, qual_ds_name)
+        if self.profile == DataStore.DS_PROFILE.RESOURCES and not query["query_args"].get("ds_sub", None):
+            pqb.where = self._add_access_filter(access_args, qual_ds_name, pqb.where, pqb.values, add_where=False)
+
+        if self.profile == DataStore.DS_PROFILE.RESOURCES:
+            pqb.where = self._add_deleted_filter(pqb.basetable, query["query_args"].get("ds_sub", None),
+                                                 pqb.where, pqb.values,
+                                                 show_all=query["query_args"].get("show_all", False))
+        return pqb
+
 
     # -------------------------------------------------------------------------
     # Internal operations
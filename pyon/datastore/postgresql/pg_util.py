@@ -6,12 +6,16 @@ __author__ = 'Michael Meisinger'
 
 import contextlib
 import gevent
+import hashlib
+import re
 from gevent.queue import Queue
 from gevent.socket import wait_read, wait_write
 import time
 import sys
 import simplejson as json
 
+from pyon.util.threading import Lock
+
 try:
     import psycopg2
     from psycopg2 import OperationalError, ProgrammingError, DatabaseError, IntegrityError, extensions
@@ -41,6 +45,30 @@ def gevent_wait_callback(conn, timeout=None):
 extensions.set_wait_callback(gevent_wait_callback)
 # End Gevent Monkey patching
 
+_blocking_lock = Lock()
+_blocking_count = 0
+
+
+@contextlib.contextmanager
+def blocking_mode():
+    """
+    Context manager that removes the gevent wait callback for operations psycopg2 does not support
+    in green mode, such as COPY. While active, database calls of all greenlets block their thread.
+    Can be nested and used from multiple threads.
+    """
+    global _blocking_count
+    with _blocking_lock:
+        if _blocking_count == 0:
+            extensions.set_wait_callback(None)
+        _blocking_count += 1
+    try:
+        yield
+    finally:
+        with _blocking_lock:
+            _blocking_count -= 1
+            if _blocking_count == 0:
+                extensions.set_wait_callback(gevent_wait_callback)
+
 # Set JSON to Pyon default simplejson to get str instead of unicode in deserialization
 register_default_json(None, globally=True, loads=json.loads)
 
@@ -181,8 +209,7 @@ class PostgresConnectionPool(DatabaseConnectionPool):
         maxsize = kwargs.pop('maxsize', None)
         self.args = args
         self.kwargs = kwargs
-        if self.tracer:
-            self.kwargs.setdefault("connection_factory", TracingConnection)
+        self.kwargs.setdefault("connection_factory", TracingConnection)
         DatabaseConnectionPool.__init__(self, maxsize)
 
     def create_connection(self):
@@ -211,7 +238,12 @@ def psycopg2_connect(dsn=None, *args, **kwargs):
 
 
 class TracingConnection(_connection):
-    """A connection that logs all queries to a file or logger__ object."""
+    """A connection that logs all queries to a file or logger__ object.
+    Keeps the server-side prepared statements of the connection session."""
+    def __init__(self, *args, **kwargs):
+        super(TracingConnection, self).__init__(*args, **kwargs)
+        self._prepared = {}
+
     def set_tracer(self, tracer, trace_stmt=None):
         self._tracer = tracer
         self._trace_stmt = trace_stmt
@@ -253,6 +285,36 @@ class TracingCursor(_cursor):
             if self._tracer:
                 self._log_call(self._tracer, trace_stmt=self._trace_stmt, query_time=query_time)
 
+    def execute_prepared(self, query, vars=None):
+        """
+        Executes a query as server-side prepared statement. The query is prepared once per connection with
+        PREPARE and then run with EXECUTE, so that Postgres parses and plans it only once.
+        The query uses the same %s or %(name)s parameters as for execute.
+        Falls back to execute for connections that do not keep prepared statements.
+        """
+        prepared = getattr(self.connection, "_prepared", None)
+        if prepared is None:
+            return self.execute(query, vars)
+
+        prep_stmt = prepared.get(query, None)
+        if prep_stmt is None:
+            prep_stmt = PreparedStatement(query)
+            super(TracingCursor, self).execute(prep_stmt.prepare_sql)
+            prepared[query] = prep_stmt
+
+        query_time = 0
+        try:
+            t_begin = time.time()
+            res = super(TracingCursor, self).execute(prep_stmt.execute_sql, prep_stmt.get_args(vars))
+            query_time = time.time() - t_begin
+            return res
+        finally:
+            prep_stmt.exec_count += 1
+            prep_stmt.exec_time += query_time
+            if self._tracer:
+                log_entry = self._log_call(self._tracer, trace_stmt=self._trace_stmt or query, query_time=query_time)
+                log_entry["prepared"] = prep_stmt.name
+
     def fetchall(self):
         query_time = 0
         try:
@@ -262,7 +324,8 @@ class TracingCursor(_cursor):
             return res
         finally:
             log_entry = getattr(self, "_current_entry", None)
-            if log_entry and log_entry.get("statement", "") == self.query and "statement_time" in log_entry:
+            if log_entry and "statement_time" in log_entry and \
+                    (log_entry.get("statement", "") == self.query or "prepared" in log_entry):
                 log_entry["statement_time"] += query_time
 
     def _log_call(self, tracer, trace_stmt=None, query_time=None):
@@ -279,6 +342,40 @@ class TracingCursor(_cursor):
         return log_entry
 
 
+class PreparedStatement(object):
+    """
+    Translates a query with psycopg2 parameters into PREPARE and EXECUTE statements.
+    Named parameters used multiple times map to the same positional parameter.
+    """
+    PARAM_RE = re.compile(r"%\((\w+)\)s|%s|%%")
+
+    def __init__(self, query):
+        self.query = query
+        self.name = "ps_" + hashlib.md5(query).hexdigest()
+        self.param_keys = []
+        self.exec_count = 0
+        self.exec_time = 0.0
+
+        def replace_param(match):
+            if match.group(0) == "%%":
+                return "%"
+            key = match.group(1) if match.group(1) is not None else len(self.param_keys)
+            if key not in self.param_keys:
+                self.param_keys.append(key)
+            return "$%s" % (self.param_keys.index(key) + 1)
+
+        self.prepare_sql = "PREPARE %s AS %s" % (self.name, self.PARAM_RE.sub(replace_param, query))
+        if self.param_keys:
+            self.execute_sql = "EXECUTE %s (%s)" % (self.name, ", ".join(["%s"] * len(self.param_keys)))
+        else:
+            self.execute_sql = "EXECUTE %s" % self.name
+
+    def get_args(self, vars):
+        if not self.param_keys:
+            return None
+        return [vars[key] for key in self.param_keys]
+
+
 class StatementBuilder(object):
     def __init__(self):
         self.statement = None
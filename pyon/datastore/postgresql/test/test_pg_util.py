@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+from nose.plugins.attrib import attr
+
+from pyon.util.unit_test import IonUnitTestCase
+
+from pyon.datastore.postgresql.pg_util import PreparedStatement
+
+
+@attr('UNIT', group='datastore')
+class PreparedStatementUnitTest(IonUnitTestCase):
+
+    def test_prepared_statement(self):
+        ps = PreparedStatement("UPDATE ds SET doc=%(doc)s, rev=%(revn)s WHERE id=%(id)s AND rev=%(rev)s AND name LIKE 'A%%' AND s=%(id)s")
+        self.assertTrue(ps.name.startswith("ps_"))
+        self.assertEquals(ps.prepare_sql, "PREPARE " + ps.name + " AS UPDATE ds SET doc=$1, rev=$2 WHERE id=$3 AND rev=$4 AND name LIKE 'A%' AND s=$3")
+        self.assertEquals(ps.execute_sql, "EXECUTE %s (%%s, %%s, %%s, %%s)" % ps.name)
+        self.assertEquals(ps.get_args(dict(doc="{}", revn=2, id="id1", rev=1)), ["{}", 2, "id1", 1])
+
+        ps = PreparedStatement("SELECT id, doc FROM ds WHERE id=ANY(%s)")
+        self.assertEquals(ps.prepare_sql, "PREPARE %s AS SELECT id, doc FROM ds WHERE id=ANY($1)" % ps.name)
+        self.assertEquals(ps.get_args((["id1", "id2"],)), [["id1", "id2"]])
+
+        ps = PreparedStatement("SELECT count(*) FROM ds")
+        self.assertEquals(ps.execute_sql, "EXECUTE %s" % ps.name)
+        self.assertEquals(ps.get_args(None), None)
+
+        self.assertEquals(PreparedStatement("SELECT 1").name, PreparedStatement("SELECT 1").name)
+        self.assertNotEquals(PreparedStatement("SELECT 1").name, PreparedStatement("SELECT 2").name)
@@ -3,6 +3,11 @@
 __author__ = 'Thomas R. Lennan, Michael Meisinger'
 
 
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
 from nose.plugins.attrib import attr
 from unittest import SkipTest
 from mock import Mock, patch, ANY
@@ -13,6 +18,7 @@ from pyon.util.unit_test import IonUnitTestCase
 from pyon.core.bootstrap import IonObject, CFG, get_sys_name
 from pyon.core.exception import BadRequest, NotFound, Conflict
 from pyon.datastore.datastore import DataStore
+from pyon.datastore.datastore_admin import iter_compact_dump, iter_dump_shard, DumpShardWriter
 from pyon.datastore.couchdb.datastore import CouchPyonDataStore
 from pyon.util.containers import get_ion_ts
 from pyon.ion.identifier import create_unique_resource_id, create_unique_association_id
@@ -50,6 +56,37 @@ class TestDataStoreUnitTest(IonUnitTestCase):
         qb.build_query(where=qb.within_geom(qb.RA_GEOM_LOC,wkt,buf))
         self.assertEquals(qb.get_query()['where'], ['gop:within_geom', ('geom_loc', 'POINT(-72.0 40.0)', 0.1)])
 
+    def test_iter_compact_dump(self):
+        objs = [dict(_id="id%s" % i, name="a, b] [c" * i, attr=[1, {"a": None}]) for i in xrange(20)]
+        dump_text = json.dumps(["COMPACTDUMP", objs])
+        for read_size in (1, 7, 100000):
+            self.assertEquals(list(iter_compact_dump(StringIO(dump_text), read_size)), objs)
+
+        self.assertEquals(list(iter_compact_dump(StringIO('["COMPACTDUMP", []]'))), [])
+        with self.assertRaises(BadRequest):
+            list(iter_compact_dump(StringIO('{"_id": "id1"}')))
+
+    def test_dump_shard(self):
+        objs = [dict(_id="id%s" % i, name=u"obj \u00e9\n%s" % i) for i in xrange(20)]
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            writer = DumpShardWriter(os.path.join(tmp_dir, "ds_0000.json.gz"), phase=2)
+            for obj in objs:
+                writer.write(obj)
+            shard = writer.close()
+            self.assertEquals(shard["file"], "ds_0000.json.gz")
+            self.assertEquals(shard["rows"], 20)
+            self.assertEquals(shard["phase"], 2)
+
+            shard_file = os.path.join(tmp_dir, shard["file"])
+            self.assertEquals(list(iter_dump_shard(shard_file, shard["rows"], shard["sha1"])), objs)
+            with self.assertRaises(BadRequest):
+                list(iter_dump_shard(shard_file, 19))
+            with self.assertRaises(BadRequest):
+                list(iter_dump_shard(shard_file, sha1="0"))
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 @attr('INT', group='datastore')
 class TestDataStores(IonIntegrationTestCase):
@@ -932,5 +969,21 @@ class TestDataStores(IonIntegrationTestCase):
         res = data_store.find_by_query(qb.get_query(), access_args=access_args)
         self.assertEquals(len(res), 3)
 
+        # Streaming query results from a server-side cursor
+        res_iter = list(data_store.iter_by_query(qb.get_query(), access_args=access_args, fetch_size=2))
+        self.assertEquals(sorted(r._id for r in res_iter), sorted(r._id for r in res))
+
+        qb = DatastoreQueryBuilder()
+        qb.build_query(where=qb.like(qb.RA_NAME, "Buoy%"))
+        query = qb.get_query()
+        res_iter = list(data_store.iter_by_query(query, fetch_size=1))
+        self.assertEquals(len(res_iter), 1)
+        self.assertEquals(res_iter[0].name, "Buoy1")
+        self.assertEquals(query["_result"]["rowcount"], 1)
+
+        all_ids = [doc_id for doc_id, _, _ in data_store.iter_all_docs(fetch_size=2)]
+        self.assertIn(plat1_obj_id, all_ids)
+        self.assertIn(dp1_obj_id, all_ids)
+
         # Clean up
         self.data_store.delete_mult([plat1_obj_id, plat2_obj_id, plat3_obj_id, aid1_obj_id, dp1_obj_id])
@@ -4,12 +4,15 @@
 
 __author__ = 'Thomas R. Lennan, Michael Meisinger'
 
+import copy
+
 from pyon.core import bootstrap
 from pyon.core.bootstrap import CFG
 from pyon.core.exception import Inconsistent, BadRequest
 from pyon.datastore.datastore import DataStore
 from pyon.ion.event import EventPublisher, EventSubscriber
 from pyon.ion.identifier import create_unique_directory_id
+from pyon.util.cache import LRUTTLCache
 from pyon.util.log import log
 from pyon.util.containers import get_ion_ts
 from interface.objects import DirEntry
@@ -38,6 +41,12 @@ class Directory(object):
         self.event_pub = None
         self.event_sub = None
 
+        # Optional cache of DirEntries by path, invalidated by directory change events
+        cache_cfg = CFG.get_safe("container.directory.cache") or {}
+        self.dir_cache = None
+        if cache_cfg.get("enabled", False):
+            self.dir_cache = LRUTTLCache(max_size=int(cache_cfg.get("size", 1000)),
+                                         ttl=float(cache_cfg.get("ttl", 60.0)))
 
     def start(self):
         # Create directory root entry (for current org) if not existing
@@ -51,10 +60,12 @@ class Directory(object):
             # init change event publisher
             self.event_pub = EventPublisher()
 
-            # Register to receive directory changes
-            self.event_sub = EventSubscriber(event_type="ContainerConfigModifiedEvent",
-                                             origin="Directory",
-                                             callback=self.receive_directory_change_event)
+            # Register to receive directory changes (only needed to invalidate cached entries)
+            if self.dir_cache is not None:
+                self.event_sub = EventSubscriber(event_type="ContainerConfigModifiedEvent",
+                                                 origin="Directory",
+                                                 callback=self.receive_directory_change_event)
+                self.event_sub.start()
 
     def stop(self):
         self.close()
@@ -64,7 +75,8 @@ class Directory(object):
         Close directory and all resources including datastore and event listener.
         """
         if self.event_sub:
-            self.event_sub.deactivate()
+            self.event_sub.stop()
+            self.event_sub = None
         self.dir_store.close()
 
     def _get_path(self, parent, key):
@@ -96,7 +108,7 @@ class Directory(object):
         de = DirEntry(org=orgname, parent=parent, key=key, attributes=attributes, ts_created=ts, ts_updated=ts)
         return de
 
-    def _read_by_path(self, path, orgname=None):
+    def _read_by_path(self, path, orgname=None, use_cache=True):
         """
         Given a qualified path, find entry in directory and return DirEntry
         object or None if not found.
@@ -105,6 +117,12 @@ class Directory(object):
         if path is None:
             raise BadRequest("Illegal arguments")
         orgname = orgname or self.orgname
+        use_cache = use_cache and self.dir_cache is not None and orgname == self.orgname
+        if use_cache:
+            direntry = self.dir_cache.get(path)
+            if direntry is not None:
+                return copy.deepcopy(direntry)
+
         parent, key = path.rsplit("/", 1)
         parent = parent or "/"
         find_key = [orgname, key, parent]
@@ -113,11 +131,34 @@ class Directory(object):
         match = [doc for docid, index, doc in view_res]
         if len(match) > 1:
             log.warn("More than one directory entry found for key %s" % path)
-            recent_match = self._cleanup_outdated_entries(match, "path=%s" % path)
-            return recent_match
+            direntry = self._cleanup_outdated_entries(match, "path=%s" % path)
         elif match:
-            return match[0]
-        return None
+            direntry = match[0]
+        else:
+            return None
+
+        if use_cache:
+            self.dir_cache.put(path, copy.deepcopy(direntry))
+        return direntry
+
+    def _entry_changed(self, path, mod_type="UPDATE"):
+        """
+        Removes the entry for path from the local cache and notifies the caches of other containers.
+        """
+        if self.dir_cache is None:
+            return
+        self.dir_cache.pop(path)
+        if self.event_pub:
+            self.event_pub.publish_event(event_type="ContainerConfigModifiedEvent", origin="Directory",
+                                         sub_type=mod_type, description=path)
+
+    def get_cache_stats(self):
+        """
+        Returns hit/miss statistics of the DirEntry cache or None if the cache is disabled.
+        """
+        if self.dir_cache is None:
+            return None
+        return self.dir_cache.get_stats()
 
     def _cleanup_outdated_entries(self, dir_entries, common="key"):
         """
@@ -163,6 +204,50 @@ class Directory(object):
         else:
             return direntry.attributes if direntry else None
 
+    def lookup_mult(self, paths, return_entry=False, orgname=None):
+        """
+        Read entries for a list of qualified paths in one datastore access (for entries not cached).
+        Returns a list in the order of paths with attributes (or DirEntry if return_entry) or None if not found.
+        Note: Does not clean up duplicate entries for a path. The most recently updated one is returned.
+        """
+        if type(paths) not in (list, tuple):
+            raise BadRequest("Illegal argument paths")
+        orgname = orgname or self.orgname
+        use_cache = self.dir_cache is not None and orgname == self.orgname
+        entries = {}
+        find_keys = []
+        for path in paths:
+            if path in entries:
+                continue
+            direntry = self.dir_cache.get(path) if use_cache else None
+            if direntry is not None:
+                entries[path] = copy.deepcopy(direntry)
+                continue
+            if not path or not path.startswith("/"):
+                raise BadRequest("Illegal path: %s" % path)
+            parent, key = path.rsplit("/", 1)
+            entries[path] = None
+            find_keys.append([orgname, key, parent or "/"])
+
+        if find_keys:
+            view_res = self.dir_store.find_by_view('directory', 'by_key', keys=find_keys, id_only=True, convert_doc=True)
+            for docid, index, direntry in view_res:
+                path = self._get_path(direntry.parent, direntry.key)
+                if path not in entries:
+                    continue
+                prev_entry = entries[path]
+                if prev_entry is None or int(direntry.ts_updated) > int(prev_entry.ts_updated):
+                    entries[path] = direntry
+            if use_cache:
+                for de_key in find_keys:
+                    path = self._get_path(de_key[2], de_key[1])
+                    if entries[path] is not None:
+                        self.dir_cache.put(path, copy.deepcopy(entries[path]))
+
+        if return_entry:
+            return [entries[path] for path in paths]
+        return [entries[path].attributes if entries[path] else None for path in paths]
+
     def _get_unique_parents(self, entry_list):
         """Returns a sorted, unique list of parents of DirEntries (excluding the root /)"""
         if entry_list and type(entry_list) not in (list, tuple):
@@ -178,8 +263,8 @@ class Directory(object):
         parents_list = self._get_unique_parents(entry_list)
         pe_list = []
         try:
-            for parent in parents_list:
-                pe = self.lookup(parent)
+            parent_entries = self.lookup_mult(parents_list, return_entry=True) if parents_list else []
+            for parent, pe in zip(parents_list, parent_entries):
                 if pe is None:
                     pp, pk = parent.rsplit("/", 1)
                     direntry = self._create_dir_entry(parent=pp, key=pk)
@@ -208,7 +293,7 @@ class Directory(object):
         entry_old = None
         cur_time = get_ion_ts()
         # Must read existing entry by path to make sure to not create path twice
-        direntry = self._read_by_path(dn)
+        direntry = self._read_by_path(dn, use_cache=False)
         if direntry and create_only:
             # We only wanted to make sure entry exists. Do not change
             return direntry
@@ -218,6 +303,7 @@ class Directory(object):
             direntry.ts_updated = cur_time
             # TODO: This may fail because of concurrent update
             self.dir_store.update(direntry)
+            self._entry_changed(dn)
         else:
             direntry = self._create_dir_entry(parent, key, attributes=kwargs, ts=cur_time)
             self._ensure_parents_exist([direntry])
@@ -259,9 +345,10 @@ class Directory(object):
         path = self._get_path(parent, key) if key else parent
         log.debug("Removing content at path %s" % path)
 
-        direntry = self._read_by_path(path)
+        direntry = self._read_by_path(path, use_cache=False)
         if direntry:
             self.dir_store.delete(direntry)
+            self._entry_changed(path, "DELETE")
 
         if direntry and not return_entry:
             return direntry.attributes
@@ -359,5 +446,7 @@ class Directory(object):
 
     def receive_directory_change_event(self, event_msg, headers):
         # @TODO add support to fold updated config into container config
-        pass
+        path = getattr(event_msg, "description", None)
+        if self.dir_cache is not None and path:
+            self.dir_cache.pop(path)
 
@@ -14,6 +14,17 @@ from gevent.timeout import Timeout
 #############################################################################
 # PROCESS LEVEL ENDPOINTS
 #############################################################################
+def get_process_messaging_config(process, name):
+    """
+    Returns an endpoint messaging config value (such as prefetch_count) from the process.messaging
+    section of the given process' config, or None if not set there.
+    """
+    process_cfg = getattr(process, 'CFG', None)
+    if not isinstance(process_cfg, dict):
+        return None
+    return process_cfg.get_safe('process.messaging.%s' % name)
+
+
 class ProcessEndpointUnitMixin(EndpointUnit):
     """
     Common-base mixin for Process related endpoints.
@@ -49,7 +60,7 @@ class ProcessEndpointUnitMixin(EndpointUnit):
         This is a request, so the order should be Message, Process
         """
         inv_one = EndpointUnit._intercept_msg_in(self, inv)
-        inv_two = process_interceptors(self.interceptors["process_incoming"] if "process_incoming" in self.interceptors else [], inv_one)
+        inv_two = process_interceptors(self.interceptors.get("process_incoming", []), inv_one)
         return inv_two
 
     def _intercept_msg_out(self, inv):
@@ -58,7 +69,7 @@ class ProcessEndpointUnitMixin(EndpointUnit):
 
         This is request, so the order should be Process, Message
         """
-        inv_one = process_interceptors(self.interceptors["process_outgoing"] if "process_outgoing" in self.interceptors else [], inv)
+        inv_one = process_interceptors(self.interceptors.get("process_outgoing", []), inv)
         inv_two = EndpointUnit._intercept_msg_out(self, inv_one)
 
         return inv_two
@@ -178,6 +189,21 @@ class ProcessRPCClient(RPCClient):
         newkwargs['process'] = self._process
         return RPCClient.create_endpoint(self, to_name, existing_channel, **newkwargs)
 
+    def _spawn_request(self, request_call, *args, **kwargs):
+        """
+        Override to carry the calling greenlet's process context (actor, conv-id etc) into the request greenlet.
+        """
+        if not hasattr(self._process, 'push_context'):
+            return RPCClient._spawn_request(self, request_call, *args, **kwargs)
+
+        ctx = self._process.get_context()
+
+        def request_in_context(*args, **kwargs):
+            with self._process.push_context(ctx):
+                return request_call(*args, **kwargs)
+
+        return RPCClient._spawn_request(self, request_in_context, *args, **kwargs)
+
 
 class ProcessRPCResponseEndpointUnit(ProcessEndpointUnitMixin, RPCResponseEndpointUnit):
     def __init__(self, process=None, routing_call=None, **kwargs):
@@ -293,6 +319,15 @@ class ProcessRPCServer(RPCServer):
         newkwargs['routing_call'] = self._routing_call
         return RPCServer.create_endpoint(self, **newkwargs)
 
+    def _get_messaging_config(self, name, default=None):
+        """
+        Override to take endpoint messaging config from the process config (process.messaging) first.
+        """
+        value = get_process_messaging_config(self._process, name)
+        if value is not None:
+            return value
+        return RPCServer._get_messaging_config(self, name, default)
+
     def __str__(self):
         return "ProcessRPCServer at %s:\n\trecv_name: %s\n\tprocess: %s" % (hex(id(self)), str(self._recv_name), str(self._process))
 
@@ -411,6 +446,15 @@ class ProcessSubscriber(Subscriber):
         newkwargs['routing_call'] = self._routing_call
         return Subscriber.create_endpoint(self, **newkwargs)
 
+    def _get_messaging_config(self, name, default=None):
+        """
+        Override to take endpoint messaging config from the process config (process.messaging) first.
+        """
+        value = get_process_messaging_config(self._process, name)
+        if value is not None:
+            return value
+        return Subscriber._get_messaging_config(self, name, default)
+
     def __str__(self):
         return "ProcessSubscriber at %s:\n\trecv_name: %s\n\tprocess: %s\n\tcb: %s" % (hex(id(self)), str(self._recv_name), str(self._process), str(self._callback))
 
@@ -6,8 +6,10 @@ __author__ = 'Dave Foster <dfoster@asascience.com>, Michael Meisinger'
 
 import functools
 import sys
+import time
 import traceback
-from gevent import event as gevent_event
+from gevent import event as gevent_event, coros
+from ooi.timer import Accumulator
 
 from pyon.core import bootstrap
 from pyon.core.exception import BadRequest, IonException, StreamException
@@ -16,7 +18,7 @@ from pyon.datastore.datastore_query import QUERY_EXP_KEY, DatastoreQueryBuilder,
 from pyon.ion.identifier import create_unique_event_id, create_simple_unique_id
 from pyon.net.endpoint import Publisher, Subscriber
 from pyon.util.async import spawn
-from pyon.util.containers import get_ion_ts_millis, is_valid_ts
+from pyon.util.containers import get_ion_ts_millis, is_valid_ts, get_safe
 from pyon.util.log import log
 
 from interface.objects import Event
@@ -29,6 +31,10 @@ EVENTS_XP_TYPE = "topic"
 #The event will be ignored if older than this time period
 VALID_EVENT_TIME_PERIOD = 365 * 24 * 60 * 60 * 1000   # one year
 
+# Write-behind buffer stats of the EventRepository (flush latency, flush size, queue depth)
+stats = Accumulator(persist=True)
+
+
 def get_events_exchange_point():
     return "%s.%s" % (bootstrap.get_sys_name(), EVENTS_XP)
 
@@ -82,13 +88,45 @@ class EventPublisher(Publisher):
         @param event_object     the event object to be published
         @retval event_object    the event object which was published
         """
+        topic = self._prepare_event_object(event_object)
+        to_name = (self._send_name.exchange, topic)
+
+        try:
+            self.publish(event_object, to_name=to_name)
+        except Exception as ex:
+            log.exception("Failed to publish event (%s): '%s'" % (ex.message, event_object))
+            raise
+
+        return event_object
+
+    def publish_event_objects(self, event_objects):
+        """
+        Publishes several event objects at once, in one batch over one channel.
+        Event objects are completed and validated as in publish_event_object.
+        @param event_objects    list of event objects to be published
+        @retval event_objects   the event objects which were published
+        """
+        topics = [self._prepare_event_object(event_object) for event_object in event_objects]
+
+        try:
+            self.publish_batch(event_objects, routing_keys=topics)
+        except Exception as ex:
+            log.exception("Failed to publish %s events (%s)" % (len(event_objects), ex.message))
+            raise
+
+        return event_objects
+
+    def _prepare_event_object(self, event_object):
+        """
+        Completes and validates an event object before publishing.
+        @retval the topic (routing key) to publish the event to
+        """
         if not event_object:
             raise BadRequest("Must provide event_object")
 
         event_object.base_types = event_object._get_extends()
 
         topic = self._topic(event_object)  # Routing key generated using type_, base_types, origin, origin_type, sub_type
-        to_name = (self._send_name.exchange, topic)
 
         current_time = get_ion_ts_millis()
 
@@ -128,13 +166,7 @@ class EventPublisher(Publisher):
         #Generate a unique ID for this event
         event_object._id = create_unique_event_id()
 
-        try:
-            self.publish(event_object, to_name=to_name)
-        except Exception as ex:
-            log.exception("Failed to publish event (%s): '%s'" % (ex.message, event_object))
-            raise
-
-        return event_object
+        return topic
 
 
     def publish_event(self, origin=None, event_type=None, **kwargs):
@@ -288,6 +320,10 @@ class EventSubscriber(Subscriber, BaseEventSubscriberMixin):
 class EventRepository(object):
     """
     Class that uses a data store to provide a persistent repository for ION events.
+
+    Events stored with queue_event(s) go through an optional write-behind buffer
+    (container.event_repository.write_behind config) that is flushed with one multi-row
+    insert when it reaches batch_size events or after batch_time seconds, and on stop.
     """
 
     def __init__(self, datastore_manager=None, container=None):
@@ -298,10 +334,40 @@ class EventRepository(object):
         datastore_manager = datastore_manager or self.container.datastore_manager
         self.event_store = datastore_manager.get_datastore("events", DataStore.DS_PROFILE.EVENTS)
 
+        # Write-behind buffer
+        wb_cfg = bootstrap.CFG.get_safe("container.event_repository.write_behind") or {}
+        self._wb_enabled = get_safe(wb_cfg, "enabled", False)
+        self._wb_batch_size = get_safe(wb_cfg, "batch_size", 500)
+        self._wb_batch_time = get_safe(wb_cfg, "batch_time", 1.0)
+        self._wb_max_size = get_safe(wb_cfg, "max_size", 20000)    # above this, queue_events flushes inline
+        self._wb_max_retries = get_safe(wb_cfg, "max_retries", 3)   # then a failing batch is written in parts
+        self._wb_stop_timeout = get_safe(wb_cfg, "stop_timeout", 10.0)   # wait for a running flush on stop
+        self._wb_queue = []
+        self._wb_flush_lock = coros.RLock()     # one flush at a time, stop waits for a running flush
+        self._wb_trigger = gevent_event.Event()
+        self._wb_flushed = gevent_event.Event()  # set after each write-behind flush
+        self._wb_retries = 0
+        self._wb_gl = None
+        self._wb_stats = dict(queue_depth=0, max_queue_depth=0, events_queued=0, events_flushed=0,
+                              events_dropped=0, flushes=0, flush_errors=0, last_flush_time=0.0, max_flush_time=0.0)
+
     def start(self):
-        pass
+        if self._wb_enabled and not self._wb_gl:
+            self._wb_gl = spawn(self._run_write_behind)
+            self._wb_gl._glname = "EventRepository write-behind"
 
     def stop(self):
+        if self._wb_gl:
+            # Clearing _wb_gl lets the write-behind greenlet exit after its current flush
+            gl, self._wb_gl = self._wb_gl, None
+            self._wb_trigger.set()
+            gl.join(timeout=self._wb_stop_timeout)
+            if not gl.ready():
+                # The interrupted batch is still in the buffer and written below
+                log.warn("EventRepository write-behind flush did not complete in %s sec, interrupting", self._wb_stop_timeout)
+                gl.kill()
+        # Flush anything still buffered before closing the datastore
+        self.flush_events()
         self.close()
 
     def close(self):
@@ -329,6 +395,133 @@ class EventRepository(object):
         else:
             return None
 
+    def queue_event(self, event):
+        """
+        Stores an event via the write-behind buffer, if enabled, otherwise immediately.
+        Returns the event id.
+        """
+        return self.queue_events([event])[0]
+
+    def queue_events(self, events):
+        """
+        Stores a list of events via the write-behind buffer, if enabled, otherwise immediately.
+        Ids are assigned right away, so the events can be referenced before they are flushed.
+        Returns the list of event ids.
+        """
+        if type(events) is not list:
+            raise BadRequest("events must be type list, not %s" % type(events))
+        for event in events:
+            if not isinstance(event, Event):
+                raise BadRequest("events must all be type Event")
+            if not getattr(event, "_id", None):
+                event._id = create_unique_event_id()
+        event_ids = [event._id for event in events]
+
+        if not self._wb_enabled or not self._wb_gl:
+            self.put_events(events)
+            return event_ids
+
+        if len(self._wb_queue) + len(events) > self._wb_max_size:
+            # The datastore does not keep up - apply back pressure to the caller
+            log.warn("EventRepository write-behind queue full (%s events), flushing inline", len(self._wb_queue))
+            self.flush_events()
+            if len(self._wb_queue) + len(events) > self._wb_max_size:
+                # Still full because writes fail - do not buffer any more
+                self.put_events(events)
+                return event_ids
+
+        self._wb_queue.extend(events)
+        queue_depth = len(self._wb_queue)
+        self._wb_stats["events_queued"] += len(events)
+        self._wb_stats["queue_depth"] = queue_depth
+        self._wb_stats["max_queue_depth"] = max(queue_depth, self._wb_stats["max_queue_depth"])
+
+        if queue_depth >= self._wb_batch_size:
+            self._wb_trigger.set()
+
+        return event_ids
+
+    def flush_events(self):
+        """
+        Writes all events in the write-behind buffer to the datastore with multi-row inserts.
+        A batch that fails to write stays in the buffer and is retried with the next flush, up to
+        max_retries times (or not at all on stop). Then it is written in parts and events that still
+        cannot be written are dropped.
+        Returns the number of events written.
+        """
+        num_flushed = 0
+        with self._wb_flush_lock:
+            while self._wb_queue:
+                events = self._wb_queue[:self._wb_batch_size]
+                split = self._wb_retries > self._wb_max_retries or not self._wb_gl
+
+                t1 = time.time()
+                try:
+                    num_written = self._write_batch(events, split=split)
+                except Exception:
+                    self._wb_retries += 1
+                    self._wb_stats["flush_errors"] += 1
+                    log.exception("EventRepository failed to write %s events (attempt %s)", len(events), self._wb_retries)
+                    break
+                finally:
+                    self._wb_stats["queue_depth"] = len(self._wb_queue)
+                self._wb_retries = 0
+
+                flush_time = time.time() - t1
+                num_flushed += num_written
+                self._wb_stats["flushes"] += 1
+                self._wb_stats["events_flushed"] += num_written
+                self._wb_stats["last_flush_time"] = flush_time
+                self._wb_stats["max_flush_time"] = max(flush_time, self._wb_stats["max_flush_time"])
+                stats.add_value("flush_time", flush_time)
+                stats.add_value("flush_size", num_written)
+
+        return num_flushed
+
+    def _write_batch(self, events, split=False):
+        """
+        Writes given events from the head of the write-behind buffer and removes them from the buffer
+        once written, so that an interrupted write leaves them buffered.
+        If split, a failing batch is written in halves down to single events, which are dropped
+        if they cannot be written. Returns the number of events written.
+        """
+        try:
+            self.event_store.create_mult(events, allow_ids=True)
+        except Exception:
+            if not split:
+                raise
+            if len(events) > 1:
+                half = len(events) / 2
+                return self._write_batch(events[:half], split=True) + self._write_batch(events[half:], split=True)
+            log.exception("EventRepository dropped event %s that cannot be written", events[0]._id)
+            del self._wb_queue[:1]
+            self._wb_stats["events_dropped"] += 1
+            return 0
+
+        del self._wb_queue[:len(events)]
+        return len(events)
+
+    def get_write_behind_stats(self):
+        """
+        Returns a dict with write-behind buffer metrics: current and max queue depth, counts of queued and
+        flushed and dropped events, flushes and flush errors, and last and max flush latency in seconds.
+        """
+        return dict(self._wb_stats)
+
+    def _run_write_behind(self):
+        """
+        Flushes the write-behind buffer whenever it reaches batch_size or batch_time passed.
+        """
+        while self._wb_gl:
+            self._wb_trigger.wait(timeout=self._wb_batch_time)
+            self._wb_trigger.clear()
+            stats.add_value("queue_depth", len(self._wb_queue))
+            try:
+                self.flush_events()
+            except Exception:
+                log.exception("EventRepository write-behind flush failed")
+            self._wb_flushed.set()
+
     def get_event(self, event_id):
         log.trace("Retrieving persistent event for id=%s", event_id)
         event_obj = self.event_store.read(event_id)
@@ -389,6 +582,19 @@ class EventRepository(object):
         log.debug("find_events_query() found %s events", len(events))
         return events
 
+    def iter_events_query(self, query, id_only=False, fetch_size=None):
+        """
+        Streaming variant of find_events_query. Returns an iterator over events or event ids that fetches
+        rows lazily in chunks of fetch_size rows. The iterator should be exhausted or closed.
+        """
+        if not query or not isinstance(query, dict) or not QUERY_EXP_KEY in query:
+            raise BadRequest("Illegal events query")
+        qargs = query["query_args"]
+        qargs["datastore"] = DataStore.DS_EVENTS
+        qargs["profile"] = DataStore.DS_PROFILE.EVENTS
+        qargs["id_only"] = id_only
+        return self.event_store.iter_by_query(query, fetch_size=fetch_size)
+
 
 class EventGate(EventSubscriber):
     def __init__(self, *args, **kwargs):
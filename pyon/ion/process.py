@@ -13,11 +13,52 @@ from pyon.core.exception import IonException, ContainerError
 from pyon.core.exception import Timeout as IonTimeout
 from pyon.util.containers import get_ion_ts, get_ion_ts_millis
 from pyon.core.bootstrap import CFG
+from pyon.util import procpool
 import threading
 import traceback
 
 STAT_INTERVAL_LENGTH = 60000  # Interval time for process saturation stats collection
 
+# Container wide pool of worker processes for CPU-bound operations, created on first use
+_process_pool = None
+
+
+def cpu_bound(func):
+    """
+    Decorator marking a service operation as CPU-bound. The ION process executes calls to it in a worker
+    process of the container's process pool instead of on the gevent hub, so other processes in the container
+    are not stalled while it runs.
+
+    Arguments and return value are encoded like messages. The operation runs on a blank instance of the service
+    class, so it must only use its arguments, not process state (clients, publishers, attributes set in on_init).
+    Operations can also be offloaded by name with the process.offload_ops config list.
+    """
+    func._cpu_bound = True
+    return func
+
+
+def get_process_pool():
+    """
+    Returns the container wide ProcessPool, creating it on first use. Returns None if offloading is
+    disabled (container.process_pool.enabled) or if called within a worker process.
+    """
+    global _process_pool
+    if procpool._in_worker or not CFG.get_safe('container.process_pool.enabled', True):
+        return None
+    if _process_pool is None:
+        _process_pool = procpool.ProcessPool(CFG.get_safe('container.process_pool.size', 0))
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """
+    Stops the container wide ProcessPool, if it was started.
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.close()
+        _process_pool = None
+
 
 class OperationInterruptedException(BaseException):
     """
@@ -70,6 +111,7 @@ class IonProcessThread(PyonThread):
         self._ready_control     = Event()
         self._errors            = []
         self._ctrl_current      = None      # set to the AR generated by _routing_call when in the context of a call
+        self._offload_ops       = None      # names of service operations to run in the process pool
 
         # processing vs idle time (ms)
         self._start_time        = None
@@ -314,6 +356,22 @@ class IonProcessThread(PyonThread):
         if not self._cancel_pending_call(ar) and not ar.ready():
             self._interrupt_control_thread()
 
+    def should_offload(self, call):
+        """
+        Returns True if the given call is a CPU-bound operation of this process' service that should run in the
+        container's process pool, either marked with the cpu_bound decorator or listed in process.offload_ops.
+        """
+        if getattr(call, '_cpu_bound', False):
+            return True
+
+        if self._offload_ops is None:
+            service_cfg = getattr(self.service, 'CFG', None)
+            offload_ops = service_cfg.get_safe('process.offload_ops') if isinstance(service_cfg, dict) else None
+            self._offload_ops = set(offload_ops or [])
+
+        return bool(self._offload_ops) and getattr(call, 'im_self', None) is self.service and \
+            call.__name__ in self._offload_ops
+
     def _control_flow(self):
         """
         Main process thread of execution method.
@@ -364,7 +422,12 @@ class IonProcessThread(PyonThread):
                 with self.service.push_context(context):
                     with self.service.container.context.push_context(context):
                         self._ctrl_current = ar
-                        res = call(*callargs, **callkwargs)
+                        pool = get_process_pool() if self.should_offload(call) else None
+                        if pool is not None:
+                            # CPU-bound operation: only this greenlet waits for the worker process
+                            res = pool.apply(call, *callargs, **callkwargs)
+                        else:
+                            res = call(*callargs, **callkwargs)
             except OperationInterruptedException:
                 # endpoint layer takes care of response as it's the one that caused this
                 log.debug("Operation interrupted")
@@ -50,14 +50,18 @@ LCE = DotDict()
 lcs_workflow_defs = {}
 lcs_workflows = {}
 
+# Contents of resource_lifecycle.yml
+ResourceLifecycleDefs = DotDict()
+
 
 # -----------------------------------------------------------------------------
 # System initialization functions
 
-def get_predicate_type_list():
-    """Parses the associations.yml file for permissible associations"""
+def get_predicate_type_list(assoc_defs=None):
+    """Parses the associations.yml file for permissible associations (unless definitions are given)"""
     Predicates.clear()
-    assoc_defs = Config(["res/config/associations.yml"]).data['AssociationDefinitions']
+    if assoc_defs is None:
+        assoc_defs = Config(["res/config/associations.yml"]).data['AssociationDefinitions']
     for ad in assoc_defs:
         if ad['predicate'] in Predicates:
             raise Inconsistent('Predicate %s defined multiple times in associations.yml' % ad['predicate'])
@@ -65,18 +69,25 @@ def get_predicate_type_list():
     return Predicates.keys()
 
 
-def get_compound_associations_list():
-    """Parses the associations.yml file for compound associations for the extended resource framework"""
+def get_compound_associations_list(compound_assocs=None):
+    """Parses the associations.yml file for compound associations for the extended resource framework
+    (unless definitions are given)"""
     CompoundAssociations.clear()
-    CompoundAssociations.update(Config(["res/config/associations.yml"]).data['CompoundAssociations'])
+    if compound_assocs is None:
+        compound_assocs = Config(["res/config/associations.yml"]).data['CompoundAssociations']
+    CompoundAssociations.update(compound_assocs)
     return CompoundAssociations.keys()
 
 
-def initialize_res_lcsms():
+def initialize_res_lcsms(res_lifecycle=None):
     """
-    Initializes resource type lifecycle state machines.
+    Initializes resource type lifecycle state machines from resource_lifecycle.yml (unless definitions are given).
     """
-    res_lifecycle = (Config(["res/config/resource_lifecycle.yml"])).data
+    if res_lifecycle is None:
+        res_lifecycle = (Config(["res/config/resource_lifecycle.yml"])).data
+    ResourceLifecycleDefs.clear()
+    ResourceLifecycleDefs.update(res_lifecycle)
+    res_lifecycle = ResourceLifecycleDefs
 
     # Initialize the set of available resource lifecycle workflows
     lcs_workflow_defs.clear()
@@ -99,10 +110,12 @@ def initialize_res_lcsms():
         lcs_workflows[res_type] = lcs_workflow_defs[wf_name]
 
 
-def load_definitions():
+def load_definitions(snapshot=None):
     """Loads constants for resource, association and life cycle states.
     Make sure global module variable objects are updated, not replaced, because other modules had already
     imported them (BAD).
+    @param snapshot  A registry snapshot dict (see pyon.core.registry_snapshot) with the association and
+                     lifecycle definitions, avoiding to parse the YAML files
     """
     # Resource Types
     ot_list = getextends('IonObjectBase')
@@ -119,16 +132,16 @@ def load_definitions():
     ResourceTypes.lock()
 
     # Predicate Types
-    pt_list = get_predicate_type_list()
+    pt_list = get_predicate_type_list(snapshot["predicates"] if snapshot else None)
     PredicateType.clear()
     PredicateType.update(zip(pt_list, pt_list))
     PredicateType.lock()
 
     # Compound Associations
-    get_compound_associations_list()
+    get_compound_associations_list(snapshot["compound_associations"] if snapshot else None)
 
     # Lifecycle, availability states and transition events
-    initialize_res_lcsms()
+    initialize_res_lcsms(snapshot["resource_lifecycle"] if snapshot else None)
     lcstates, avstates, fsmevents = get_all_lcsm_names()
 
     LifeCycleStates.clear()
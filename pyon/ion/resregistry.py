@@ -4,23 +4,37 @@
 
 __author__ = 'Michael Meisinger'
 
+import copy
+import sys
+from gevent.event import AsyncResult
+
 from pyon.core import bootstrap
 from pyon.core.bootstrap import IonObject, CFG
 from pyon.core.exception import BadRequest, NotFound, Inconsistent
 from pyon.core.object import IonObjectBase
 from pyon.core.registry import getextends
 from pyon.datastore.datastore import DataStore
-from pyon.datastore.datastore_query import DatastoreQueryBuilder, DQ
-from pyon.ion.event import EventPublisher
+from pyon.datastore.datastore_query import QUERY_EXP_KEY, DatastoreQueryBuilder, DQ
+from pyon.ion.event import EventPublisher, EventSubscriber
 from pyon.ion.identifier import create_unique_resource_id, create_unique_association_id
 from pyon.ion.resource import LCS, LCE, PRED, RT, AS, OT, get_restype_lcsm, is_resource, ExtendedResourceContainer, \
     lcstate, lcsplit, Predicates, create_access_args
 from pyon.ion.process import get_ion_actor_id
+from pyon.net.endpoint import Publisher
+from pyon.util.cache import LRUTTLCache
 from pyon.util.containers import get_ion_ts
 from pyon.util.log import log
 
 from interface.objects import Attachment, AttachmentType, ResourceModificationType
 
+# Internal exchange for association change notices to other containers (not persisted as events)
+ASSOC_CHANGE_XP = "pyon.associations"
+ASSOC_CHANGE_TOPIC = "associations.changed"
+
+
+def get_assoc_change_exchange_point():
+    return "%s.%s" % (bootstrap.get_sys_name(), ASSOC_CHANGE_XP)
+
 
 class ResourceRegistry(object):
     """
@@ -44,10 +58,50 @@ class ResourceRegistry(object):
 
         self.superuser_actors = None
 
+        # Optional read-through cache of resource objects, invalidated by resource events
+        cache_cfg = CFG.get_safe("container.resource_registry.cache") or {}
+        self.res_cache = None
+        if cache_cfg.get("enabled", False):
+            self.res_cache = LRUTTLCache(max_size=int(cache_cfg.get("size", 2000)),
+                                         ttl=float(cache_cfg.get("ttl", 60.0)))
+        # Resource id -> [number of reads in progress, invalidation count during these reads]
+        self._res_reads = {}
+
+        # Optional index of associations by resource, invalidated by resource events
+        assoc_cache_cfg = CFG.get_safe("container.resource_registry.assoc_cache") or {}
+        self.assoc_cache = None
+        if assoc_cache_cfg.get("enabled", False):
+            self.assoc_cache = AssociationCache(self.rr_store, max_size=int(assoc_cache_cfg.get("size", 5000)),
+                                                ttl=float(assoc_cache_cfg.get("ttl", 300.0)))
+        self.res_event_sub = None
+        self.assoc_change_pub = None
+        self.assoc_change_sub = None
+
     def start(self):
-        pass
+        caches_enabled = self.res_cache is not None or self.assoc_cache is not None
+        if caches_enabled and self.container.has_capability(self.container.CCAP.EVENT_PUBLISHER):
+            # ResourceModifiedEvent and ResourceLifecycleEvent both extend ResourceEvent
+            self.res_event_sub = EventSubscriber(event_type=OT.ResourceEvent, callback=self._receive_resource_event)
+            self.res_event_sub.start()
+
+        # Association changes are announced to the association indexes of all containers
+        if self.assoc_cache is not None and self.container.has_capability(self.container.CCAP.EVENT_PUBLISHER):
+            assoc_xp = get_assoc_change_exchange_point()
+            self.assoc_change_pub = Publisher(to_name=(assoc_xp, ASSOC_CHANGE_TOPIC))
+            self.assoc_change_sub = EventSubscriber(xp_name=assoc_xp, pattern=ASSOC_CHANGE_TOPIC,
+                                                    callback=self._receive_assoc_change)
+            self.assoc_change_sub.start()
 
     def stop(self):
+        if self.res_event_sub:
+            self.res_event_sub.stop()
+            self.res_event_sub = None
+        if self.assoc_change_sub:
+            self.assoc_change_sub.stop()
+            self.assoc_change_sub = None
+        if self.assoc_change_pub:
+            self.assoc_change_pub.close()
+            self.assoc_change_pub = None
         self.close()
 
     def close(self):
@@ -56,6 +110,105 @@ class ResourceRegistry(object):
         """
         self.rr_store.close()
 
+    # -------------------------------------------------------------------------
+    # Resource object cache
+
+    def _receive_resource_event(self, event, headers):
+        if event.origin:
+            self._uncache(event.origin)
+            if self.assoc_cache is not None:
+                self.assoc_cache.invalidate(event.origin)
+
+    def _uncache(self, resource_id):
+        if self.res_cache is not None:
+            self.res_cache.pop(resource_id)
+            read_entry = self._res_reads.get(resource_id, None)
+            if read_entry:
+                read_entry[1] += 1
+
+    def _receive_assoc_change(self, msg, headers):
+        if self.assoc_cache is not None:
+            for res_id in msg.get("resource_ids", None) or []:
+                self.assoc_cache.invalidate(res_id)
+
+    @property
+    def _track_assoc_changes(self):
+        """Returns True if association changes need the changed association objects"""
+        return self.assoc_cache is not None
+
+    def _associations_changed(self, assocs):
+        """
+        Invalidates the association index for the subjects and objects of given created or deleted
+        associations and notifies other containers on the association change exchange.
+        """
+        if not assocs or not self._track_assoc_changes:
+            return
+        changed_res = set()
+        for assoc in assocs:
+            changed_res.add(assoc.s)
+            changed_res.add(assoc.o)
+        for res_id in changed_res:
+            self.assoc_cache.invalidate(res_id)
+
+        if self.assoc_change_pub is not None:
+            try:
+                self.assoc_change_pub.publish(dict(resource_ids=list(changed_res)))
+            except Exception:
+                log.exception("Failed to publish association change for %s resources", len(changed_res))
+
+    def _get_cached(self, resource_id, rev_id=""):
+        """
+        Returns a copy of the cached resource object for id (and rev, if given) or None.
+        Copies are returned so that callers can modify the objects without affecting the cache.
+        """
+        res_obj = self.res_cache.get(resource_id)
+        if res_obj is None:
+            return None
+        if rev_id and res_obj._rev != rev_id:
+            return None
+        return copy.deepcopy(res_obj)
+
+    def _put_cached(self, res_obj):
+        if isinstance(res_obj, IonObjectBase) and "_id" in res_obj:
+            self.res_cache.put(res_obj._id, copy.deepcopy(res_obj))
+
+    def _read_started(self, resource_ids):
+        """
+        Registers datastore reads for given resource ids. Returns the invalidation counts to pass to
+        _read_finished, which caches a read object only if it was not invalidated during the read.
+        """
+        generations = []
+        for resource_id in resource_ids:
+            read_entry = self._res_reads.setdefault(resource_id, [0, 0])
+            read_entry[0] += 1
+            generations.append(read_entry[1])
+        return generations
+
+    def _read_finished(self, resource_ids, generations, res_objs=None):
+        for i, resource_id in enumerate(resource_ids):
+            read_entry = self._res_reads[resource_id]
+            read_entry[0] -= 1
+            if read_entry[0] <= 0:
+                del self._res_reads[resource_id]
+            if res_objs and res_objs[i] is not None and read_entry[1] == generations[i]:
+                self._put_cached(res_objs[i])
+
+    def get_cache_stats(self):
+        """
+        Returns hit/miss statistics of the resource object cache or None if the cache is disabled.
+        """
+        if self.res_cache is None:
+            return None
+        return self.res_cache.get_stats()
+
+    def get_assoc_cache_stats(self):
+        """
+        Returns hit/miss statistics of the association index or None if the index is disabled.
+        """
+        if self.assoc_cache is None:
+            return None
+        return self.assoc_cache.get_stats()
+
     # -------------------------------------------------------------------------
     # Resource object manipulation
 
@@ -141,7 +294,19 @@ class ResourceRegistry(object):
         if not object_id:
             raise BadRequest("The object_id parameter is an empty string")
 
-        return self.rr_store.read(object_id, rev_id)
+        if self.res_cache is None:
+            return self.rr_store.read(object_id, rev_id)
+
+        res_obj = self._get_cached(object_id, rev_id)
+        if res_obj is None:
+            if rev_id:
+                return self.rr_store.read(object_id, rev_id)
+            generations = self._read_started([object_id])
+            try:
+                res_obj = self.rr_store.read(object_id)
+            finally:
+                self._read_finished([object_id], generations, [res_obj])
+        return res_obj
 
     def read_mult(self, object_ids=None, strict=True):
         """
@@ -152,15 +317,31 @@ class ResourceRegistry(object):
         """
         if object_ids is None:
             raise BadRequest("The object_ids parameter is empty")
-        return self.rr_store.read_mult(object_ids, strict=strict)
+
+        if self.res_cache is None:
+            return self.rr_store.read_mult(object_ids, strict=strict)
+
+        res_list = [self._get_cached(obj_id) for obj_id in object_ids]
+        missing_ids = [obj_id for obj_id, res_obj in zip(object_ids, res_list) if res_obj is None]
+        if missing_ids:
+            missing_list = None
+            generations = self._read_started(missing_ids)
+            try:
+                missing_list = self.rr_store.read_mult(missing_ids, strict=strict)
+            finally:
+                self._read_finished(missing_ids, generations, missing_list)
+            missing_objs = dict(zip(missing_ids, missing_list))
+            res_list = [missing_objs[obj_id] if res_obj is None else res_obj
+                        for obj_id, res_obj in zip(object_ids, res_list)]
+        return res_list
 
     def update(self, object):
         if object is None:
             raise BadRequest("Object not present")
         if not hasattr(object, "_id") or not hasattr(object, "_rev"):
             raise BadRequest("Object does not have required '_id' or '_rev' attribute")
-            # Do an check whether LCS has been modified
-        res_obj = self.read(object._id)
+            # Do an check whether LCS has been modified. Read from the store to compare with the current version
+        res_obj = self.rr_store.read(object._id)
 
         object.ts_updated = get_ion_ts()
         if res_obj.lcstate != object.lcstate or res_obj.availability != object.availability:
@@ -170,12 +351,15 @@ class ResourceRegistry(object):
             object.lcstate = res_obj.lcstate
             object.availability = res_obj.availability
 
+        res = self.rr_store.update(object)
+        self._uncache(object._id)
+
         self.event_pub.publish_event(event_type="ResourceModifiedEvent",
                                      origin=object._id, origin_type=object.type_,
                                      sub_type="UPDATE",
                                      mod_type=ResourceModificationType.UPDATE)
 
-        return self.rr_store.update(object)
+        return res
 
     def delete(self, object_id='', del_associations=False):
         res_obj = self.read(object_id)
@@ -186,14 +370,20 @@ class ResourceRegistry(object):
             self._delete_owners(object_id)
 
         if del_associations:
-            assoc_ids = self.find_associations(anyside=object_id, id_only=True)
+            if self._track_assoc_changes:
+                assocs = self.find_associations(anyside=object_id, id_only=False)
+                assoc_ids = [assoc._id for assoc in assocs]
+            else:
+                assocs, assoc_ids = None, self.find_associations(anyside=object_id, id_only=True)
             self.rr_store.delete_doc_mult(assoc_ids, object_type="Association")
+            self._associations_changed(assocs)
             #log.debug("Deleted %s associations for resource %s", len(assoc_ids), object_id)
 
         elif self._is_in_association(object_id):
             log.warn("Deleting object %s that still has associations" % object_id)
 
         res = self.rr_store.delete(object_id)
+        self._uncache(object_id)
 
         if self.container.has_capability(self.container.CCAP.EVENT_PUBLISHER):
             self.event_pub.publish_event(event_type="ResourceModifiedEvent",
@@ -217,7 +407,7 @@ class ResourceRegistry(object):
         This is the official "delete" for resource objects: they are set to DELETED lcstate.
         All associations are set to deleted as well.
         """
-        res_obj = self.read(resource_id)
+        res_obj = self.rr_store.read(resource_id)
         old_state = res_obj.lcstate
         if old_state == LCS.DELETED:
             raise BadRequest("Resource id=%s already DELETED" % (resource_id))
@@ -226,6 +416,7 @@ class ResourceRegistry(object):
         res_obj.ts_updated = get_ion_ts()
 
         updres = self.rr_store.update(res_obj)
+        self._uncache(resource_id)
         log.debug("retire(res_id=%s). Change %s_%s to %s_%s", resource_id,
                   old_state, res_obj.availability, res_obj.lcstate, res_obj.availability)
 
@@ -234,6 +425,7 @@ class ResourceRegistry(object):
             assoc.retired = True  # retired means soft deleted
         if assocs:
             self.rr_store.update_mult(assocs)
+            self._associations_changed(assocs)
             log.debug("lcs_delete(res_id=%s). Retired %s associations", resource_id, len(assocs))
 
         if self.container.has_capability(self.container.CCAP.EVENT_PUBLISHER):
@@ -248,7 +440,7 @@ class ResourceRegistry(object):
         if transition_event == LCE.DELETE:
             return self.lcs_delete(resource_id)
 
-        res_obj = self.read(resource_id)
+        res_obj = self.rr_store.read(resource_id)
         old_lcstate = res_obj.lcstate
         old_availability = res_obj.availability
 
@@ -276,6 +468,7 @@ class ResourceRegistry(object):
 
         res_obj.ts_updated = get_ion_ts()
         self.rr_store.update(res_obj)
+        self._uncache(resource_id)
         log.debug("execute_lifecycle_transition(res_id=%s, event=%s). Change %s_%s to %s_%s", resource_id, transition_event,
                   old_lcstate, old_availability, res_obj.lcstate, res_obj.availability)
 
@@ -298,7 +491,7 @@ class ResourceRegistry(object):
         if target_lcstate.startswith(LCS.RETIRED):
             self.execute_lifecycle_transition(resource_id, LCE.RETIRE)
 
-        res_obj = self.read(resource_id)
+        res_obj = self.rr_store.read(resource_id)
         old_lcstate = res_obj.lcstate
         old_availability = res_obj.availability
 
@@ -333,6 +526,7 @@ class ResourceRegistry(object):
         res_obj.ts_updated = get_ion_ts()
 
         updres = self.rr_store.update(res_obj)
+        self._uncache(resource_id)
         log.debug("set_lifecycle_state(res_id=%s, target=%s). Change %s_%s to %s_%s", resource_id, target_lcstate,
                   old_lcstate, old_availability, res_obj.lcstate, res_obj.availability)
 
@@ -501,7 +695,9 @@ class ResourceRegistry(object):
                           p=predicate,
                           o=object_id, ot=object_type,
                           ts=get_ion_ts())
-        return self.rr_store.create(assoc, create_unique_association_id())
+        res = self.rr_store.create(assoc, create_unique_association_id())
+        self._associations_changed([assoc])
+        return res
 
     def create_association_mult(self, assoc_list=None):
         """
@@ -572,7 +768,9 @@ class ResourceRegistry(object):
             new_assoc_list.append(assoc)
 
         new_assoc_ids = [create_unique_association_id() for i in xrange(len(new_assoc_list))]
-        return self.rr_store.create_mult(new_assoc_list, new_assoc_ids)
+        res = self.rr_store.create_mult(new_assoc_list, new_assoc_ids)
+        self._associations_changed(new_assoc_list)
+        return res
 
     def delete_association(self, association=''):
         """
@@ -581,13 +779,18 @@ class ResourceRegistry(object):
         """
         if type(association) in (list, tuple) and len(association) == 3:
             subject, predicate, obj = association
-            assoc_id_list = self.find_associations(subject=subject, predicate=predicate, object=obj, id_only=True)
+            assoc_list = self.find_associations(subject=subject, predicate=predicate, object=obj, id_only=False)
             success = True
-            for aid in assoc_id_list:
-                success = success and self.rr_store.delete(aid, object_type="Association")
+            for assoc in assoc_list:
+                success = success and self.rr_store.delete(assoc._id, object_type="Association")
+            self._associations_changed(assoc_list)
             return success
         else:
-            return self.rr_store.delete(association, object_type="Association")
+            if self._track_assoc_changes and type(association) is str:
+                association = self.read_association(association)
+            res = self.rr_store.delete(association, object_type="Association")
+            self._associations_changed([association])
+            return res
 
     def _is_in_association(self, obj_id):
         if not obj_id:
@@ -640,14 +843,68 @@ class ResourceRegistry(object):
 
     def find_objects(self, subject="", predicate="", object_type="", id_only=False,
                      limit=None, skip=None, descending=None, access_args=None):
+        if self._use_assoc_cache(subject, predicate, object_type, id_only, limit, skip, descending, access_args):
+            assoc_list = self.assoc_cache.find_objects(self._get_id(subject), predicate, object_type)
+            return self._prepare_assoc_result([assoc.o for assoc in assoc_list], assoc_list)
+
         return self.rr_store.find_objects(subject, predicate, object_type, id_only=id_only,
                                           limit=limit, skip=skip, descending=descending, access_args=access_args)
 
     def find_subjects(self, subject_type="", predicate="", object="", id_only=False,
                       limit=None, skip=None, descending=None, access_args=None):
+        if self._use_assoc_cache(object, predicate, subject_type, id_only, limit, skip, descending, access_args):
+            assoc_list = self.assoc_cache.find_subjects(self._get_id(object), predicate, subject_type)
+            return self._prepare_assoc_result([assoc.s for assoc in assoc_list], assoc_list)
+
         return self.rr_store.find_subjects(subject_type, predicate, object, id_only=id_only,
                                            limit=limit, skip=skip, descending=descending, access_args=access_args)
 
+    def _get_id(self, resource):
+        return resource if type(resource) is str else resource._id
+
+    def _use_assoc_cache(self, resource, predicate, target_type, id_only, limit, skip, descending, access_args):
+        """
+        Returns True if a find can be served from the association index. Paged, sorted and access
+        filtered finds as well as illegal arguments go to the datastore. So do id_only finds, because
+        the datastore only returns associations to existing resources, which requires reading them.
+        """
+        if self.assoc_cache is None or limit or skip or descending or access_args:
+            return False
+        if id_only is not False or not resource or (target_type and not predicate):
+            return False
+        return type(resource) is str or (isinstance(resource, IonObjectBase) and "_id" in resource)
+
+    def _prepare_assoc_result(self, target_ids, assoc_list):
+        """
+        Returns a find result tuple of resource objects for given related resource ids and associations.
+        As with the datastore, associations to resources that do not exist are omitted.
+        """
+        target_objs = self.read_mult(target_ids, strict=False) if target_ids else []
+        res_list = [(obj, assoc) for obj, assoc in zip(target_objs, assoc_list) if obj is not None]
+        return [obj for obj, assoc in res_list], [assoc for obj, assoc in res_list]
+
+    def find_associated_paths(self, resource_ids=None, path=None, id_only=True):
+        """
+        Follows a path of association hops from each of the given resources, e.g.
+        ["hasSite<", "hasDevice"] returns the devices of the parent sites. Each hop is a predicate, optionally
+        suffixed by ">" (subject to object, default) or "<" (object to subject).
+        Each hop is one batched datastore query for all resources not yet in the association index.
+        @retval dict mapping each given resource id to a list of target resource ids or objects
+        """
+        if not resource_ids:
+            return {}
+        if not path:
+            raise BadRequest("Must provide an association path")
+        assoc_cache = self.assoc_cache or AssociationCache(self.rr_store, max_size=sys.maxint)
+        res_paths = assoc_cache.traverse(resource_ids, path)
+        if id_only:
+            return res_paths
+
+        target_ids = list({target_id for target_ids in res_paths.itervalues() for target_id in target_ids})
+        target_objs = dict(zip(target_ids, self.read_mult(target_ids, strict=False))) if target_ids else {}
+        return {res_id: [target_objs[target_id] for target_id in target_ids if target_objs[target_id] is not None]
+                for res_id, target_ids in res_paths.iteritems()}
+
     def find_associations(self, subject="", predicate="", object="", assoc_type=None, id_only=False, anyside=None, query=None,
                           limit=None, skip=None, descending=None, access_args=None):
         return self.rr_store.find_associations(subject, predicate, object, assoc_type, id_only=id_only, anyside=anyside,
@@ -684,6 +941,15 @@ class ResourceRegistry(object):
             limit=limit, skip=skip, descending=descending,
             id_only=id_only, query=query, access_args=access_args)
 
+    def iter_resources_query(self, query, id_only=False, access_args=None, fetch_size=None):
+        """
+        Streams resources or resource ids matching a datastore query, e.g. built with ResourceQuery.
+        Results are fetched lazily in chunks of fetch_size rows. The iterator should be exhausted or closed.
+        """
+        if not query or not isinstance(query, dict) or not QUERY_EXP_KEY in query:
+            raise BadRequest("Illegal resources query")
+        query["query_args"]["id_only"] = id_only
+        return self.rr_store.iter_by_query(query, access_args=access_args, fetch_size=fetch_size)
 
     def get_superuser_actors(self, reset=False):
         """Returns a memoized list of system superusers, including the system actor and all actors with
@@ -771,6 +1037,133 @@ class ResourceRegistry(object):
         return user_id
 
 
+class AssociationCache(object):
+    """
+    In-memory index of the associations of resources. For each resource, the (not retired) associations where it is
+    subject or object are loaded lazily from the datastore, with one query for a batch of resources, and kept in an
+    LRU cache with TTL. The owner invalidates entries when associations change. The associations of a resource
+    are ordered by creation time.
+    Association objects are shared between callers and must not be modified.
+    """
+    LOAD_BATCH_SIZE = 200
+
+    def __init__(self, rr_store, max_size=5000, ttl=0):
+        self.rr_store = rr_store
+        self._cache = LRUTTLCache(max_size=max_size, ttl=ttl)
+        # Resource id -> [number of loads in progress, invalidation count during these loads]
+        self._loads = {}
+        self.num_loads = 0
+
+    def load(self, resource_ids):
+        """
+        Returns a dict mapping each given resource id to the list of its associations. Resources not in the
+        cache are loaded in batches.
+        """
+        res_assocs = {}
+        missing_ids = []
+        for res_id in resource_ids:
+            if res_id in res_assocs:
+                continue
+            assoc_list = self._cache.get(res_id)
+            if assoc_list is None:
+                res_assocs[res_id] = assoc_list = []
+                missing_ids.append(res_id)
+            else:
+                res_assocs[res_id] = assoc_list
+
+        for i in xrange(0, len(missing_ids), self.LOAD_BATCH_SIZE):
+            batch_ids = missing_ids[i:i + self.LOAD_BATCH_SIZE]
+            generations = []
+            for res_id in batch_ids:
+                load_entry = self._loads.setdefault(res_id, [0, 0])
+                load_entry[0] += 1
+                generations.append(load_entry[1])
+            assocs = None
+            try:
+                assocs = self.rr_store.find_associations(anyside=batch_ids, id_only=False)
+                self.num_loads += 1
+                assocs.sort(key=lambda assoc: (assoc.ts, assoc._id))
+                for assoc in assocs:
+                    if assoc.s in res_assocs:
+                        res_assocs[assoc.s].append(assoc)
+                    if assoc.o in res_assocs and assoc.o != assoc.s:
+                        res_assocs[assoc.o].append(assoc)
+            finally:
+                for res_id, generation in zip(batch_ids, generations):
+                    load_entry = self._loads[res_id]
+                    load_entry[0] -= 1
+                    if load_entry[0] <= 0:
+                        del self._loads[res_id]
+                    # Do not cache associations that changed while they were loaded
+                    if assocs is not None and load_entry[1] == generation:
+                        self._cache.put(res_id, res_assocs[res_id])
+
+        return res_assocs
+
+    def find_objects(self, subject_id, predicate=None, object_type=None):
+        """
+        Returns the list of associations with given subject and optional predicate and object type.
+        """
+        assoc_list = self.load([subject_id])[subject_id]
+        return [assoc for assoc in assoc_list if assoc.s == subject_id and (not predicate or assoc.p == predicate)
+                and (not object_type or assoc.ot == object_type)]
+
+    def find_subjects(self, object_id, predicate=None, subject_type=None):
+        """
+        Returns the list of associations with given object and optional predicate and subject type.
+        """
+        assoc_list = self.load([object_id])[object_id]
+        return [assoc for assoc in assoc_list if assoc.o == object_id and (not predicate or assoc.p == predicate)
+                and (not subject_type or assoc.st == subject_type)]
+
+    def traverse(self, resource_ids, path):
+        """
+        Follows a path of association hops (predicate with optional direction suffix ">" or "<") from each
+        of the given resources. Loads the associations for all resources of one hop at once.
+        @retval dict mapping each given resource id to the list of resource ids reached at the end of the path
+        """
+        res_paths = {res_id: [res_id] for res_id in resource_ids}
+        for hop in path:
+            backward = hop.endswith("<")
+            predicate = hop[:-1] if hop.endswith(("<", ">")) else hop
+
+            hop_ids = {res_id for target_ids in res_paths.itervalues() for res_id in target_ids}
+            res_assocs = self.load(hop_ids)
+            hop_targets = {}
+            for res_id in hop_ids:
+                if backward:
+                    hop_targets[res_id] = [assoc.s for assoc in res_assocs[res_id] if assoc.o == res_id and assoc.p == predicate]
+                else:
+                    hop_targets[res_id] = [assoc.o for assoc in res_assocs[res_id] if assoc.s == res_id and assoc.p == predicate]
+
+            for res_id, target_ids in res_paths.iteritems():
+                next_ids, seen_ids = [], set()
+                for target_id in target_ids:
+                    for next_id in hop_targets[target_id]:
+                        if next_id not in seen_ids:
+                            seen_ids.add(next_id)
+                            next_ids.append(next_id)
+                res_paths[res_id] = next_ids
+
+        return res_paths
+
+    def invalidate(self, resource_id):
+        self._cache.pop(resource_id)
+        load_entry = self._loads.get(resource_id, None)
+        if load_entry:
+            load_entry[1] += 1
+
+    def clear(self):
+        self._cache.clear()
+        for load_entry in self._loads.itervalues():
+            load_entry[1] += 1
+
+    def get_stats(self):
+        stats = self._cache.get_stats()
+        stats["loads"] = self.num_loads
+        return stats
+
+
 class ResourceRegistryServiceWrapper(object):
     """
     The purpose of this class is to map the service interface of the resource_registry service (YML)
@@ -784,8 +1177,29 @@ class ResourceRegistryServiceWrapper(object):
     def __getattr__(self, attr):
         if attr in self.__dict__:
             return getattr(self, attr)
+        if attr.endswith("_async"):
+            return self._get_async_method(attr[:-len("_async")])
         return getattr(self._rr, attr)
 
+    def _get_async_method(self, name):
+        """
+        Provides the <op>_async variant of the generated service clients for local calls.
+        The call is made in place and a ready AsyncResult returned.
+        """
+        sync_method = getattr(self, name)
+
+        def async_method(*args, **kwargs):
+            kwargs.pop('headers', None)
+            kwargs.pop('timeout', None)
+            ar = AsyncResult()
+            try:
+                ar.set(sync_method(*args, **kwargs))
+            except Exception as ex:
+                ar.set_exception(ex)
+            return ar
+
+        return async_method
+
     def create(self, object=None):
         return self._rr.create(object=object, actor_id=get_ion_actor_id(self._process))
 
@@ -4,6 +4,8 @@
 
 __author__ = 'Adam R. Smith, Michael Meisinger'
 
+import os
+import re
 from zope.interface import implementedBy
 
 from pyon.core.exception import BadRequest, ServerError
@@ -198,10 +200,15 @@ class IonServiceOperation(object):
         return str(self)
 
 
+# Matches the service base class and its service name in generated service interface modules
+SERVICE_NAME_RE = re.compile(r"^class Base\w+\(BaseService\):.*?^    name = '([^']+)'", re.M | re.S)
+
+
 class IonServiceRegistry(object):
     def __init__(self):
         self.services = {}
         self.services_by_name = {}
+        self.service_index = {}     # service name -> module name of services not yet imported (lazy loading)
         self.classes_loaded = False
         self.operations = None
 
@@ -244,27 +251,78 @@ class IonServiceRegistry(object):
                 except Exception, ex:
                     log.warning("Import module '%s' failed: %s" % (mod_qual, ex))
 
+    def index_service_mods(self, path, snapshot=None):
+        """
+        Indexes service names to service interface module names without importing the modules,
+        either from a registry snapshot or by scanning the generated module files.
+        Modules are imported on first access of a service definition, see get_service_by_name.
+        """
+        if snapshot:
+            for svc_name, svc_entry in snapshot["services"].iteritems():
+                if svc_entry.get("module", None) and svc_name not in self.services:
+                    self.service_index[svc_name] = svc_entry["module"]
+            return
+
+        mod_prefix = path.replace("/", ".")
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fn in sorted(filenames):
+                if not fn.endswith(".py") or fn == "__init__.py":
+                    continue
+                mod_qual = "%s.%s" % (mod_prefix, os.path.join(dirpath, fn[:-3])[len(path) + 1:].replace("/", "."))
+                with open(os.path.join(dirpath, fn), "r") as f:
+                    for svc_name in SERVICE_NAME_RE.findall(f.read()):
+                        if svc_name not in self.services:
+                            self.service_index[svc_name] = mod_qual
+
+    def _load_indexed_service(self, name):
+        """
+        Imports the module of an indexed service and adds its service definitions.
+        """
+        mod_qual = self.service_index.pop(name)
+        try:
+            named_any(mod_qual)
+        except Exception, ex:
+            log.warning("Import module '%s' failed: %s" % (mod_qual, ex))
+            return
+        for cls in BaseService.__subclasses__():
+            if cls.__module__ == mod_qual:
+                self._add_service_class(cls)
+
+    def load_all_services(self):
+        """
+        Imports all indexed service modules, e.g. to list all service definitions.
+        """
+        for name in self.service_index.keys():
+            if name in self.service_index:
+                self._load_indexed_service(name)
+
     def build_service_map(self):
         """
         Adds all known service definitions to service registry.
         @todo: May be a bit fragile due to using BaseService.__subclasses__
         """
         for cls in BaseService.__subclasses__():
-            assert hasattr(cls, 'name'), 'Service class must define name value. Service class in error: %s' % cls
-            if cls.name:
-                self.services_by_name[cls.name] = cls
-                self.add_servicedef_entry(cls.name, "base", cls)
-                interfaces = list(implementedBy(cls))
-                if interfaces:
-                    self.add_servicedef_entry(cls.name, "interface", interfaces[0])
-                if cls.__name__.startswith("Base"):
-                    try:
-                        client = "%s.%sProcessClient" % (cls.__module__, cls.__name__[4:])
-                        self.add_servicedef_entry(cls.name, "client", named_any(client))
-                        sclient = "%s.%sClient" % (cls.__module__, cls.__name__[4:])
-                        self.add_servicedef_entry(cls.name, "simple_client", named_any(sclient))
-                    except Exception, ex:
-                        log.warning("Cannot find client for service %s" % (cls.name))
+            self._add_service_class(cls)
+
+    def _add_service_class(self, cls):
+        assert hasattr(cls, 'name'), 'Service class must define name value. Service class in error: %s' % cls
+        if not cls.name or self.services_by_name.get(cls.name, None) is cls:
+            return
+        self.service_index.pop(cls.name, None)
+        self.services_by_name[cls.name] = cls
+        self.add_servicedef_entry(cls.name, "base", cls)
+        interfaces = list(implementedBy(cls))
+        if interfaces:
+            self.add_servicedef_entry(cls.name, "interface", interfaces[0])
+        if cls.__name__.startswith("Base"):
+            try:
+                client = "%s.%sProcessClient" % (cls.__module__, cls.__name__[4:])
+                self.add_servicedef_entry(cls.name, "client", named_any(client))
+                sclient = "%s.%sClient" % (cls.__module__, cls.__name__[4:])
+                self.add_servicedef_entry(cls.name, "simple_client", named_any(sclient))
+            except Exception, ex:
+                log.warning("Cannot find client for service %s" % (cls.name))
 
     def discover_service_classes(self):
         """
@@ -272,6 +330,8 @@ class IonServiceRegistry(object):
         @todo Only works for ion packages and submodules
         """
         IonServiceRegistry.load_service_mods("ion")
+        # Implementation modules import their service interface modules
+        self.build_service_map()
 
         sclasses = [s for s in itersubclasses(BaseService) if not s.__subclasses__()]
 
@@ -284,6 +344,8 @@ class IonServiceRegistry(object):
         """
         Returns the service base class with interface for the given service name or None.
         """
+        if name in self.service_index:
+            self._load_indexed_service(name)
         if name in self.services:
             return getattr(self.services[name], 'base', None)
         else:
@@ -293,6 +355,8 @@ class IonServiceRegistry(object):
         """
         Returns the service definition for the given service name or None.
         """
+        if name in self.service_index:
+            self._load_indexed_service(name)
         if name in self.services:
             return self.services[name]
         else:
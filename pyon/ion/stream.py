@@ -10,6 +10,7 @@ import gevent
 
 from pyon.core.exception import BadRequest
 from pyon.net.endpoint import Publisher, Subscriber
+from pyon.ion.endpoint import get_process_messaging_config
 from pyon.util.arg_check import validate_is_instance
 from interface.services.dm.ipubsub_management_service import PubsubManagementServiceProcessClient
 from pyon.util.log import log
@@ -82,6 +83,20 @@ class StreamPublisher(Publisher):
         log.trace('Publishing (%s,%s)', xp.exchange, stream_route.routing_key)
         super(StreamPublisher,self).publish(msg, to_name=xp_route, headers={'exchange_point':stream_route.exchange_point, 'stream':stream_id or self.stream_id})
 
+    def publish_batch(self, msgs, stream_id='', stream_route=None):
+        '''
+        Publishes several messages at once to either the specified stream/route or the stream/route
+        specified at instantiation. The messages are encoded and handed to the transport in one go.
+        '''
+        xp_route = self.xp_route
+        if stream_route:
+            xp = self.container.ex_manager.create_xp(stream_route.exchange_point)
+            xp_route = xp.create_route(stream_route.routing_key)
+        else:
+            stream_route = self.stream_route
+        log.trace('Publishing batch of %s (%s,%s)', len(msgs), stream_route.exchange_point, stream_route.routing_key)
+        super(StreamPublisher,self).publish_batch(msgs, to_name=xp_route, headers={'exchange_point':stream_route.exchange_point, 'stream':stream_id or self.stream_id})
+
 
 class StreamSubscriber(Subscriber):
     '''
@@ -109,8 +124,18 @@ class StreamSubscriber(Subscriber):
         self.xn = self.container.ex_manager.create_xn_queue(exchange_name)
         self.started = False
         self.callback = callback or process.call_process
+        self._process = process
         super(StreamSubscriber, self).__init__(from_name=self.xn, callback=self.preprocess)
 
+    def _get_messaging_config(self, name, default=None):
+        '''
+        Takes prefetch and ack batching config from the process config (process.messaging) first.
+        '''
+        value = get_process_messaging_config(self._process, name)
+        if value is not None:
+            return value
+        return super(StreamSubscriber, self)._get_messaging_config(name, default)
+
     def preprocess(self, msg, headers):
         '''
         De-encapsulates the incoming message and calls the callback.
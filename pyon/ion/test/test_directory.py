@@ -6,6 +6,8 @@ from nose.plugins.attrib import attr
 
 from pyon.core.bootstrap import CFG
 from pyon.ion.directory import Directory
+from pyon.util.cache import LRUTTLCache
+from pyon.util.containers import DotDict
 from pyon.util.unit_test import IonUnitTestCase
 from pyon.datastore.datastore import DatastoreManager
 
@@ -144,3 +146,51 @@ class TestDirectory(IonUnitTestCase):
 
 
         directory.stop()
+
+    def test_directory_cache(self):
+        dsm = DatastoreManager()
+        ds = dsm.get_datastore("resources", "DIRECTORY")
+        ds.delete_datastore()
+        ds.create_datastore()
+
+        directory = Directory(datastore_manager=dsm)
+        directory.start()
+        self.addCleanup(directory.stop)
+        directory.dir_cache = LRUTTLCache(max_size=100, ttl=60)
+
+        directory.register("/Cache", "entry1", foo="awesome")
+        directory.register("/Cache", "entry2", foo="brilliant")
+        directory.dir_cache.reset_stats()
+
+        self.assertEquals(directory.lookup("/Cache/entry1"), {"foo": "awesome"})
+        self.assertEquals(directory.get_cache_stats()["misses"], 1)
+
+        # Hits return copies of the cached entry
+        entry = directory.lookup("/Cache/entry1")
+        entry["foo"] = "changed"
+        self.assertEquals(directory.lookup("/Cache/entry1"), {"foo": "awesome"})
+        self.assertEquals(directory.get_cache_stats()["hits"], 2)
+
+        res_list = directory.lookup_mult(["/Cache/entry2", "/Cache/none", "/Cache/entry1"])
+        self.assertEquals(res_list, [{"foo": "brilliant"}, None, {"foo": "awesome"}])
+        self.assertIn("/Cache/entry2", directory.dir_cache)
+        self.assertNotIn("/Cache/none", directory.dir_cache)
+
+        res_list = directory.lookup_mult(["/Cache", "/Cache/entry2"], return_entry=True)
+        self.assertEquals([de.key for de in res_list], ["Cache", "entry2"])
+
+        # Entries of other orgs are not served from the cache
+        self.assertEquals(directory.lookup_mult(["/Cache/entry2"], orgname="OtherOrg"), [None])
+
+        # Changes invalidate the cached entry
+        directory.register("/Cache", "entry1", foo="ingenious")
+        self.assertNotIn("/Cache/entry1", directory.dir_cache)
+        self.assertEquals(directory.lookup("/Cache/entry1"), {"foo": "ingenious"})
+
+        directory.unregister("/Cache", "entry1")
+        self.assertEquals(directory.lookup("/Cache/entry1"), None)
+
+        # Change events from other containers invalidate the cached entry
+        self.assertIn("/Cache/entry2", directory.dir_cache)
+        directory.receive_directory_change_event(DotDict(description="/Cache/entry2"), {})
+        self.assertNotIn("/Cache/entry2", directory.dir_cache)
@@ -8,6 +8,7 @@ import sys
 
 from mock import Mock, sentinel, patch
 from nose.plugins.attrib import attr
+import gevent
 from gevent import event, queue
 from unittest import SkipTest
 
@@ -139,6 +140,32 @@ class TestEventsInt(IonIntegrationTestCase):
         self.assertEquals(res[1].description, "2")
         self.assertEquals(res[2].description, "3")
 
+    def test_pub_batch(self):
+        ar = event.AsyncResult()
+        gq = queue.Queue()
+        self.count = 0
+
+        def cb(*args, **kwargs):
+            self.count += 1
+            gq.put(args[0])
+            if self.count == 3:
+                ar.set()
+
+        sub = EventSubscriber(event_type="ResourceEvent", callback=cb)
+        pub = EventPublisher(event_type="ResourceEvent")
+
+        self._listen(sub)
+
+        event_objs = [IonObject('ResourceEvent', origin=origin, description=str(i)) for i, origin in enumerate(["one", "two", "three"])]
+        self.assertEquals(pub.publish_event_objects(event_objs), event_objs)
+        self.assertTrue(all(evt._id and evt.ts_created for evt in event_objs))
+
+        ar.get(timeout=5)
+
+        res = [gq.get(timeout=5) for x in xrange(self.count)]
+        self.assertEquals([evt.origin for evt in res], ["one", "two", "three"])
+        self.assertEquals([evt.description for evt in res], ["0", "1", "2"])
+
     def test_pub_on_different_subtypes(self):
         ar = event.AsyncResult()
         gq = queue.Queue()
@@ -475,6 +502,115 @@ class TestEventRepository(IonUnitTestCase):
         events_r = event_repo.find_events(event_type='DeviceStatusEvent')
         self.assertEquals(len(events_r), 4)
 
+    def test_write_behind(self):
+        dsm = Mock()
+        event_store = dsm.get_datastore.return_value
+        event_repo = EventRepository(dsm)
+        event_repo._wb_enabled = True
+        event_repo._wb_batch_size = 3
+        event_repo._wb_batch_time = 0.05
+
+        # not started: immediate write
+        event_id = event_repo.queue_event(Event(origin="resource1"))
+        self.assertTrue(event_id)
+        self.assertEquals(event_store.create_mult.call_count, 1)
+        event_store.create_mult.reset_mock()
+
+        event_repo.start()
+        self.assertRaises(BadRequest, event_repo.queue_events, [sentinel.notevent])
+
+        # below batch size: buffered until batch time passes
+        event_ids = event_repo.queue_events([Event(origin="resource2") for i in xrange(2)])
+        self.assertEquals(len(event_ids), 2)
+        self.assertEquals(event_repo.get_write_behind_stats()["queue_depth"], 2)
+        self.assertEquals(event_store.create_mult.call_count, 0)
+
+        event_repo._wb_flushed.clear()
+        self.assertTrue(event_repo._wb_flushed.wait(timeout=5))
+        self.assertEquals(event_store.create_mult.call_count, 1)
+        self.assertEquals([ev._id for ev in event_store.create_mult.call_args[0][0]], event_ids)
+
+        # batch size reached: flushed in batches of batch size
+        event_repo._wb_batch_time = 10
+        event_repo._wb_flushed.clear()
+        event_repo.queue_events([Event(origin="resource3") for i in xrange(4)])
+        self.assertTrue(event_repo._wb_flushed.wait(timeout=5))
+        self.assertEquals(event_store.create_mult.call_count, 3)
+
+        # flush on stop
+        event_repo.queue_events([Event(origin="resource4")])
+        event_repo.stop()
+        self.assertEquals(event_store.create_mult.call_count, 4)
+        event_store.close.assert_called_once_with()
+
+        wb_stats = event_repo.get_write_behind_stats()
+        self.assertEquals(wb_stats["queue_depth"], 0)
+        self.assertEquals(wb_stats["max_queue_depth"], 4)
+        self.assertEquals(wb_stats["events_flushed"], 7)
+        self.assertEquals(wb_stats["flushes"], 4)
+
+    def test_write_behind_stop_during_flush(self):
+        dsm = Mock()
+        event_store = dsm.get_datastore.return_value
+        event_repo = EventRepository(dsm)
+        event_repo._wb_enabled = True
+        event_repo._wb_batch_size = 3
+        event_repo._wb_stop_timeout = 0.1
+        event_store.create_mult.side_effect = lambda *args, **kwargs: gevent.sleep(5) if event_store.create_mult.call_count == 1 else None
+
+        event_repo.start()
+        event_ids = event_repo.queue_events([Event(origin="resource1") for i in xrange(3)])
+        gevent.sleep(0.01)
+        self.assertEquals(event_store.create_mult.call_count, 1)
+
+        # the batch of the interrupted flush is written on stop
+        event_repo.stop()
+        self.assertEquals(event_store.create_mult.call_count, 2)
+        self.assertEquals([ev._id for ev in event_store.create_mult.call_args[0][0]], event_ids)
+        self.assertEquals(event_repo.get_write_behind_stats()["events_flushed"], 3)
+
+    def test_write_behind_errors(self):
+        dsm = Mock()
+        event_store = dsm.get_datastore.return_value
+        event_repo = EventRepository(dsm)
+        event_repo._wb_enabled = True
+        event_repo._wb_batch_size = 10
+        event_repo._wb_batch_time = 10
+        event_repo._wb_max_size = 4
+        event_repo._wb_max_retries = 1
+        def create_mult(events, **kwargs):
+            if any(ev.origin == "bad" for ev in events):
+                raise Exception("cannot write")
+        event_store.create_mult.side_effect = create_mult
+
+        event_repo.start()
+        good_ids = event_repo.queue_events([Event(origin="good1"), Event(origin="bad"), Event(origin="good2")])
+
+        # a failing batch stays buffered for the next flush
+        self.assertEquals(event_repo.flush_events(), 0)
+        wb_stats = event_repo.get_write_behind_stats()
+        self.assertEquals(wb_stats["queue_depth"], 3)
+        self.assertEquals(wb_stats["flush_errors"], 1)
+
+        # buffer full: flushes inline, and writes directly if that fails
+        event_ids = event_repo.queue_events([Event(origin="good3"), Event(origin="good4")])
+        self.assertEquals([ev._id for ev in event_store.create_mult.call_args[0][0]], event_ids)
+        wb_stats = event_repo.get_write_behind_stats()
+        self.assertEquals(wb_stats["queue_depth"], 3)
+        self.assertEquals(wb_stats["flush_errors"], 2)
+
+        # after max retries, the batch is written in parts and the bad event is dropped
+        self.assertEquals(event_repo.flush_events(), 2)
+        written_ids = [call[0][0][0]._id for call in event_store.create_mult.call_args_list
+                       if len(call[0][0]) == 1 and call[0][0][0].origin != "bad"]
+        self.assertEquals(written_ids, [good_ids[0], good_ids[2]])
+        wb_stats = event_repo.get_write_behind_stats()
+        self.assertEquals(wb_stats["queue_depth"], 0)
+        self.assertEquals(wb_stats["events_dropped"], 1)
+        self.assertEquals(wb_stats["events_flushed"], 2)
+
+        event_repo.stop()
+
 
 @attr('INT', group='event')
 class TestEventRepoInt(IonIntegrationTestCase):
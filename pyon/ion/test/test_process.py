@@ -2,7 +2,7 @@
 
 __author__ = 'Dave Foster <dfoster@asascience.com>'
 
-from pyon.ion.process import IonProcessThread
+from pyon.ion.process import IonProcessThread, cpu_bound
 from pyon.ion.endpoint import ProcessRPCServer
 from gevent.event import AsyncResult, Event
 from gevent.coros import Semaphore
@@ -12,6 +12,7 @@ from pyon.util.int_test import IonIntegrationTestCase
 from pyon.util.context import LocalContextMixin
 from pyon.core.exception import IonException, NotFound, ContainerError, Timeout as IonTimeout
 from pyon.util.async import spawn
+from pyon.util.containers import DotDict
 from mock import sentinel, Mock, MagicMock, ANY, patch
 from nose.plugins.attrib import attr
 from pyon.net.endpoint import RPCClient
@@ -532,6 +533,42 @@ class ProcessTest(PyonTestCase):
 
         self.assertEquals((True, True, False), hb)
 
+    def test_should_offload(self):
+        svc = FakeService()
+        p = IonProcessThread(name=sentinel.name, listeners=[], service=svc)
+
+        self.assertTrue(p.should_offload(svc.crunch))
+        self.assertFalse(p.should_offload(svc.takes_too_long))
+
+        # by config
+        p = IonProcessThread(name=sentinel.name, listeners=[], service=svc)
+        svc.CFG = DotDict({'process': {'offload_ops': ['takes_too_long']}})
+        self.assertTrue(p.should_offload(svc.takes_too_long))
+        self.assertFalse(p.should_offload(FakeService().takes_too_long))
+
+    @patch('pyon.ion.process.get_process_pool')
+    def test__control_flow_offload(self, gppmock):
+        svc = self._make_service()
+        p = IonProcessThread(name=sentinel.name, listeners=[], service=svc)
+        p.start()
+        p.get_ready_event().wait(timeout=5)
+
+        fsvc = FakeService()
+        gppmock.return_value.apply.return_value = sentinel.result
+
+        ar = p._routing_call(fsvc.crunch, None, sentinel.arg, value=sentinel.kwarg)
+        self.assertEquals(ar.get(timeout=5), sentinel.result)
+        gppmock.return_value.apply.assert_called_once_with(fsvc.crunch, sentinel.arg, value=sentinel.kwarg)
+
+        # not offloaded
+        callar = AsyncResult()
+        p._routing_call(callar.set, None, value=sentinel.callarg)
+        self.assertEquals(callar.get(timeout=5), sentinel.callarg)
+        self.assertEquals(gppmock.return_value.apply.call_count, 1)
+
+        p._notify_stop()
+        p.stop()
+
 class FakeService(BaseService):
     """
     Class to use for testing below.
@@ -545,6 +582,10 @@ class FakeService(BaseService):
         ar = AsyncResult()
         ar.wait()
 
+    @cpu_bound
+    def crunch(self, arg, value=None):
+        return arg
+
 @attr('INT', group='coi')
 @unittest.skip("no active tests, 18 oct 2012")
 class TestProcessInt(IonIntegrationTestCase):
@@ -3,13 +3,15 @@
 __author__ = 'Michael Meisinger'
 
 import uuid
+from mock import patch
 from nose.plugins.attrib import attr
 
 from pyon.util.int_test import IonIntegrationTestCase
 from pyon.core.bootstrap import IonObject
 from pyon.core.exception import NotFound, Inconsistent, BadRequest
 from pyon.ion.resource import PRED, RT, LCS, AS, LCE, lcstate, create_access_args
-from pyon.ion.resregistry import ResourceQuery, AssociationQuery
+from pyon.ion.resregistry import ResourceQuery, AssociationQuery, AssociationCache
+from pyon.util.cache import LRUTTLCache
 
 from interface.objects import Attachment, AttachmentType, ResourceVisibilityEnum
 
@@ -101,6 +103,126 @@ class TestResourceRegistry(IonIntegrationTestCase):
              self.rr.delete_association(a)
 
 
+    def test_rr_read_cache(self):
+        self.rr.res_cache = LRUTTLCache(max_size=100, ttl=60)
+
+        res_obj1 = IonObject(RT.Org, name="Org1")
+        rid1, rev1 = self.rr.create(res_obj1)
+        res_obj2 = IonObject(RT.ActorIdentity, name="Actor1")
+        rid2, _ = self.rr.create(res_obj2)
+
+        read_obj1 = self.rr.read(rid1)
+        self.assertEquals(read_obj1.name, "Org1")
+        self.assertEquals(self.rr.get_cache_stats()["misses"], 1)
+
+        # Hits return copies of the cached object
+        read_obj1.name = "Changed"
+        read_obj1a = self.rr.read(rid1)
+        self.assertEquals(read_obj1a.name, "Org1")
+        self.assertEquals(self.rr.get_cache_stats()["hits"], 1)
+        self.rr.read(rid1, rev1)
+        self.assertEquals(self.rr.get_cache_stats()["hits"], 2)
+
+        read_objs = self.rr.read_mult([rid2, rid1])
+        self.assertEquals([o._id for o in read_objs], [rid2, rid1])
+        self.assertEquals(self.rr.get_cache_stats()["hits"], 3)
+        self.assertEquals(self.rr.get_cache_stats()["misses"], 2)
+
+        # Updates invalidate the cached object
+        read_obj1a.description = "updated"
+        self.rr.update(read_obj1a)
+        read_obj1b = self.rr.read(rid1)
+        self.assertEquals(read_obj1b.description, "updated")
+        self.assertNotEquals(read_obj1b._rev, rev1)
+
+        self.rr.execute_lifecycle_transition(rid2, LCE.RETIRE)
+        self.assertEquals(self.rr.read(rid2).lcstate, LCS.RETIRED)
+
+        # Objects invalidated while being read from the datastore are not cached
+        store_read = self.rr.rr_store.read
+        def read_and_invalidate(object_id, *args, **kwargs):
+            res_obj = store_read(object_id, *args, **kwargs)
+            self.rr._uncache(object_id)
+            return res_obj
+        with patch.object(self.rr.rr_store, "read", side_effect=read_and_invalidate):
+            self.rr.read(rid1)
+        self.assertIsNone(self.rr.res_cache.get(rid1))
+        self.assertEquals(self.rr._res_reads, {})
+
+        self.rr.delete(rid1)
+        with self.assertRaises(NotFound):
+            self.rr.read(rid1)
+
+    def test_rr_assoc_cache(self):
+        self.rr.assoc_cache = AssociationCache(self.rr.rr_store, max_size=100, ttl=60)
+
+        os_id, _ = self.rr.create(IonObject(RT.Observatory, name="OS1"))
+        ps_id, _ = self.rr.create(IonObject(RT.PlatformSite, name="PS1"))
+        pd_id, _ = self.rr.create(IonObject(RT.PlatformDevice, name="PD1"))
+        pd2_id, _ = self.rr.create(IonObject(RT.PlatformDevice, name="PD2"))
+        self.rr.create_association(os_id, PRED.hasSite, ps_id)
+        self.rr.create_association(ps_id, PRED.hasDevice, pd_id)
+
+        obj_list, assocs = self.rr.find_objects(ps_id, PRED.hasDevice, id_only=False)
+        self.assertEquals([o._id for o in obj_list], [pd_id])
+        self.assertEquals(assocs[0].o, pd_id)
+        sub_objs, _ = self.rr.find_subjects(RT.Observatory, PRED.hasSite, ps_id, id_only=False)
+        self.assertEquals([o._id for o in sub_objs], [os_id])
+        self.assertEquals(self.rr.get_assoc_cache_stats()["hits"], 1)
+
+        # id_only finds go to the datastore
+        obj_ids, _ = self.rr.find_objects(ps_id, PRED.hasDevice, id_only=True)
+        self.assertEquals(obj_ids, [pd_id])
+        self.assertEquals(self.rr.get_assoc_cache_stats()["hits"], 1)
+
+        # Association changes invalidate the index and are announced to other containers
+        with patch.object(self.rr, "assoc_change_pub") as pub_mock:
+            aid, _ = self.rr.create_association(ps_id, PRED.hasDevice, pd2_id)
+            self.assertEquals(set(pub_mock.publish.call_args[0][0]["resource_ids"]), {ps_id, pd2_id})
+            obj_list, _ = self.rr.find_objects(ps_id, PRED.hasDevice, id_only=False)
+            self.assertEquals([o._id for o in obj_list], [pd_id, pd2_id])
+
+            self.rr.delete_association(aid)
+            self.assertEquals(pub_mock.publish.call_count, 2)
+            obj_list, _ = self.rr.find_objects(ps_id, PRED.hasDevice, id_only=False)
+            self.assertEquals([o._id for o in obj_list], [pd_id])
+
+        # Changes made by another container are picked up after its notice
+        aid, _ = self.rr.rr_store.create(IonObject("Association", s=ps_id, st=RT.PlatformSite, p=PRED.hasDevice,
+                                                   o=pd2_id, ot=RT.PlatformDevice), "assoc_ext")
+        obj_list, _ = self.rr.find_objects(ps_id, PRED.hasDevice, id_only=False)
+        self.assertEquals([o._id for o in obj_list], [pd_id])
+        self.rr._receive_assoc_change(dict(resource_ids=[ps_id, pd2_id]), {})
+        obj_list, _ = self.rr.find_objects(ps_id, PRED.hasDevice, id_only=False)
+        self.assertEquals({o._id for o in obj_list}, {pd_id, pd2_id})
+
+        # Associations that change while being loaded are not kept in the index
+        store_find = self.rr.rr_store.find_associations
+        def find_and_invalidate(*args, **kwargs):
+            assocs = store_find(*args, **kwargs)
+            self.rr.assoc_cache.invalidate(ps_id)
+            return assocs
+        self.rr.assoc_cache.invalidate(ps_id)
+        with patch.object(self.rr.rr_store, "find_associations", side_effect=find_and_invalidate):
+            self.rr.find_objects(ps_id, PRED.hasDevice, id_only=False)
+        num_loads = self.rr.get_assoc_cache_stats()["loads"]
+        self.rr.find_objects(ps_id, PRED.hasDevice, id_only=False)
+        self.assertEquals(self.rr.get_assoc_cache_stats()["loads"], num_loads + 1)
+        self.rr.delete_association(aid)
+
+        # Batched multi-hop traversal
+        res_paths = self.rr.find_associated_paths([os_id, ps_id], [PRED.hasSite, PRED.hasDevice])
+        self.assertEquals(res_paths, {os_id: [pd_id], ps_id: []})
+        res_paths = self.rr.find_associated_paths([pd_id], [PRED.hasDevice + "<", PRED.hasSite + "<"], id_only=False)
+        self.assertEquals([o.name for o in res_paths[pd_id]], ["OS1"])
+
+        self.rr.assoc_cache = None
+        res_paths = self.rr.find_associated_paths([os_id], [PRED.hasSite, PRED.hasDevice])
+        self.assertEquals(res_paths, {os_id: [pd_id]})
+
+        sub_ids, assocs = self.rr.find_subjects_mult([pd_id, ps_id], id_only=True)
+        self.assertEquals(sub_ids, [ps_id, os_id])
+
     def test_rr_create_with_id(self):
         res_obj1 = IonObject(RT.ActorIdentity)
 
@@ -2,9 +2,12 @@
 
 __author__ = 'Adam R. Smith'
 
+from nose.plugins.attrib import attr
+
 import pyon
-from pyon.ion.service import BaseService
+from pyon.ion.service import BaseService, IonServiceRegistry
 from pyon.util.int_test import IonIntegrationTestCase
+from pyon.util.unit_test import IonUnitTestCase
 
 class TestService(BaseService):
     name = 'test-service'
@@ -14,3 +17,32 @@ class ServiceTest(IonIntegrationTestCase):
         # TODO: Make an equivalent of R1's ServiceProcess
         srv = TestService()
         #srv.serve_forever()
+
+
+@attr('UNIT')
+class ServiceRegistryTest(IonUnitTestCase):
+    def test_lazy_service_registry(self):
+        service_registry = IonServiceRegistry()
+        service_registry.index_service_mods('interface/services')
+        self.assertEquals(service_registry.service_index["resource_registry"],
+                          "interface.services.coi.iresource_registry_service")
+        self.assertNotIn("resource_registry", service_registry.services)
+
+        svc_base = service_registry.get_service_base("resource_registry")
+        self.assertEquals(svc_base.name, "resource_registry")
+        self.assertNotIn("resource_registry", service_registry.service_index)
+        svc_def = service_registry.get_service_by_name("resource_registry")
+        self.assertIs(svc_def.base, svc_base)
+        self.assertEquals(svc_def.client.__name__, "ResourceRegistryServiceProcessClient")
+        self.assertEquals(service_registry.get_service_by_name("unknown_service"), None)
+
+        num_indexed = len(service_registry.service_index) + len(service_registry.services)
+        service_registry.load_all_services()
+        self.assertEquals(service_registry.service_index, {})
+        self.assertEquals(len(service_registry.services), num_indexed)
+
+        eager_registry = IonServiceRegistry()
+        eager_registry.load_service_mods('interface/services')
+        eager_registry.build_service_map()
+        for svc_name, svc_def in service_registry.services.iteritems():
+            self.assertIs(eager_registry.services[svc_name].base, svc_def.base)
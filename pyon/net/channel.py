@@ -43,6 +43,7 @@ from gevent import queue as gqueue
 from gevent import coros
 from contextlib import contextmanager
 from gevent.event import AsyncResult, Event
+from gevent import spawn_later, getcurrent
 from pyon.net.transport import AMQPTransport, NameTrio
 from pyon.util.fsm import FSM
 from pyon.core.bootstrap import CFG
@@ -383,6 +384,55 @@ class SendChannel(BaseChannel):
                                          mandatory=False,
                                          durable_msg=durable_msg)
 
+    def send_batch(self, messages, routing_keys=None):
+        """
+        Sends several messages in one transport call.
+
+        @param  messages        A list of (data, headers) tuples.
+        @param  routing_keys    Optional list of routing keys, one per message, to use instead of the binding of
+                                the name this channel is connected to. The exchange is always the connected one.
+        """
+        exchange    = self._send_name.exchange
+        routing_keys = routing_keys or [self._send_name.binding] * len(messages)
+        assert len(routing_keys) == len(messages), "Need one routing key per message"
+
+        queue_blame = None
+        if os.environ.get('QUEUE_BLAME', None) is not None:
+            queue_blame = os.environ['QUEUE_BLAME'].split(',')
+
+        batch = []
+        for routing_key, (data, headers) in zip(routing_keys, messages):
+            headers = headers or {}
+            if queue_blame is not None:
+                headers['QUEUE_BLAME'] = queue_blame
+            batch.append((routing_key, data, headers))
+
+        durable_msg = False
+        if hasattr(self._send_name, 'queue_durable'):
+            durable_msg = self._send_name.queue_durable
+
+        with self._ensure_transport():
+            self._transport.publish_batch_impl(exchange=exchange,
+                                               messages=batch,
+                                               immediate=False,
+                                               mandatory=False,
+                                               durable_msg=durable_msg)
+
+    def enable_confirms(self, max_in_flight=1000):
+        """
+        Turns on publisher confirms for messages sent on this channel, with at most max_in_flight
+        messages unconfirmed by the broker. Sending blocks while this window is full.
+        """
+        with self._ensure_transport():
+            self._transport.enable_confirms_impl(max_in_flight=max_in_flight)
+
+    def wait_for_confirms(self, timeout=None):
+        """
+        Blocks until the broker has confirmed all messages sent on this channel (see enable_confirms).
+        """
+        with self._ensure_transport():
+            self._transport.wait_for_confirms_impl(timeout=timeout)
+
 class RecvChannel(BaseChannel):
     """
     A channel that can only receive.
@@ -405,6 +455,13 @@ class RecvChannel(BaseChannel):
     # consuming flag (consuming is not a state, a property)
     _consuming          = False
 
+    # batched acks (see set_ack_batching), by default each message is acked on its own
+    _ack_batch_size     = 1
+    _ack_batch_time     = 0         # ms
+    _ack_pending        = 0         # number of acks not yet sent to the broker
+    _ack_last_tag       = None      # delivery tag of the latest of these
+    _ack_timer          = None      # greenlet flushing acks after _ack_batch_time
+
     class SizeNotifyQueue(gqueue.Queue):
         """
         Custom gevent-safe queue to allow us to be notified when queue reaches a threshold.
@@ -668,6 +725,12 @@ class RecvChannel(BaseChannel):
         """
         #log.debug("RecvChannel.close_impl (%s)", self.get_channel_id())
 
+        # send collected acks, otherwise the broker redelivers these messages
+        try:
+            self.flush_acks()
+        except Exception:
+            log.warn("Could not send batched acks on close of channel (%s)", self.get_channel_id(), exc_info=True)
+
         self._recv_queue.put(ChannelShutdownMessage())
 
         # if we were consuming, we aren't anymore
@@ -725,21 +788,70 @@ class RecvChannel(BaseChannel):
         # put body, headers, delivery tag (for acking) in the recv queue
         self._recv_queue.put((body, header_frame.headers, delivery_tag))
 
+    def set_prefetch(self, prefetch_count):
+        """
+        Sets the max number of unacked messages the broker delivers to this channel.
+        """
+        with self._ensure_transport():
+            self._transport.qos_impl(prefetch_count=prefetch_count)
+
+    def set_ack_batching(self, batch_size, batch_time=0):
+        """
+        Enables batched acks: acks are collected and sent as one ack with multiple=True once batch_size
+        messages are acked, or at the latest batch_time ms after the first collected ack.
+
+        Only use this if messages are acked in the order they were delivered, as with the listen loop
+        of the endpoint layer. batch_size should not exceed the prefetch count.
+        """
+        self.flush_acks()
+        self._ack_batch_size = max(batch_size, 1)
+        self._ack_batch_time = batch_time
+
     def ack(self, delivery_tag):
         """
         Acks a message using the delivery tag.
         Should be called by the EP layer.
         """
         #log.debug("RecvChannel.ack: %s", delivery_tag)
+        if self._ack_batch_size > 1:
+            self._ack_pending += 1
+            self._ack_last_tag = delivery_tag
+
+            if self._ack_pending >= self._ack_batch_size:
+                self.flush_acks()
+            elif self._ack_timer is None and self._ack_batch_time:
+                self._ack_timer = spawn_later(self._ack_batch_time / 1000.0, self.flush_acks)
+            return
+
         with self._ensure_transport():
             self._transport.ack_impl(delivery_tag)
 
+    def flush_acks(self):
+        """
+        Sends the acks collected with batched acks to the broker, as one ack with multiple=True.
+        """
+        if self._ack_timer is not None:
+            if self._ack_timer is not getcurrent():
+                self._ack_timer.kill(block=False)
+            self._ack_timer = None
+
+        if not self._ack_pending:
+            return
+
+        delivery_tag = self._ack_last_tag
+        self._ack_pending = 0
+        self._ack_last_tag = None
+
+        with self._ensure_transport():
+            self._transport.ack_impl(delivery_tag, multiple=True)
+
     def reject(self, delivery_tag, requeue=False):
         """
         Rejects a message using the delivery tag.
         Should be called by the EP layer.
         """
         #log.debug("RecvChannel.reject: %s", delivery_tag)
+        self.flush_acks()
         with self._ensure_transport():
             self._transport.reject_impl(delivery_tag, requeue=requeue)
 
@@ -776,6 +888,14 @@ class PublisherChannel(SendChannel):
         self._declare_exchange(self._send_name.exchange)
         SendChannel.send(self, data, headers=headers)
 
+    def send_batch(self, messages, routing_keys=None):
+        """
+        Send batch override that ensures the exchange is declared, once per batch.
+        """
+        assert self._send_name and self._send_name.exchange
+        self._declare_exchange(self._send_name.exchange)
+        SendChannel.send_batch(self, messages, routing_keys=routing_keys)
+
 class BidirClientChannel(SendChannel, RecvChannel):
     """
     This should be pooled for the receiving side?
@@ -800,6 +920,16 @@ class BidirClientChannel(SendChannel, RecvChannel):
 
         SendChannel._send(self, name, data, headers=headers)
 
+class SharedReplyChannel(RecvChannel):
+    """
+    Long-lived receiving channel owning one anonymous reply queue that is shared by many
+    request/response conversations (see pyon.net.endpoint.RPCReplyDispatcher).
+
+    The queue is auto-delete, so the broker removes it when its single consumer goes away.
+    """
+    _consumer_exclusive = True
+    _queue_auto_delete  = True
+
 class ListenChannel(RecvChannel):
     """
     Used for listening patterns (RR server, Subscriber).
@@ -858,13 +988,19 @@ class ListenChannel(RecvChannel):
             """
             Acks a message - broker discards.
             """
-            RecvChannel.ack(self, delivery_tag)
+            if self._parent_channel is not None and self._parent_channel._ack_batch_size > 1:
+                self._parent_channel.ack(delivery_tag)      # batches acks across accepted channels
+            else:
+                RecvChannel.ack(self, delivery_tag)
             self._checkin(delivery_tag)
 
         def reject(self, delivery_tag, requeue=False):
             """
             Rejects a message - specify requeue=True to requeue for delivery later.
             """
+            if self._parent_channel is not None:
+                # a batched ack with multiple=True sent later would also cover the rejected message
+                self._parent_channel.flush_acks()
             RecvChannel.reject(self, delivery_tag, requeue=requeue)
             self._checkin(delivery_tag)
 
@@ -17,9 +17,11 @@ import threading
 from pyon.core import bootstrap, exception
 from pyon.core.bootstrap import CFG, IonObject
 from pyon.core.exception import ExceptionFactory, IonException, BadRequest
-from pyon.net.channel import ChannelClosedError, PublisherChannel, ListenChannel, SubscriberChannel, ServerChannel, BidirClientChannel
+from pyon.net.channel import ChannelClosedError, PublisherChannel, ListenChannel, SubscriberChannel, ServerChannel, BidirClientChannel, SharedReplyChannel
 from pyon.core.interceptor.interceptor import Invocation, process_interceptors
+from pyon.core.interceptor.encode import NPARRAY_ACCEPT_HEADER, NPARRAY_HEADER
 from pyon.util.containers import get_ion_ts, get_ion_ts_millis
+from pyon.util.async import spawn
 from pyon.util.log import log
 from pyon.net.transport import NameTrio, BaseTransport
 from pyon.util.sflow import SFlowManager
@@ -122,7 +124,7 @@ class EndpointUnit(object):
         @param inv      An Invocation instance.
         @returns        A processed Invocation instance.
         """
-        inv_prime = process_interceptors(self.interceptors["message_incoming"] if "message_incoming" in self.interceptors else [], inv)
+        inv_prime = process_interceptors(self.interceptors.get("message_incoming", []), inv)
         return inv_prime
 
     def message_received(self, msg, headers):
@@ -162,6 +164,33 @@ class EndpointUnit(object):
 
         return new_msg, new_headers
 
+    def send_batch(self, msgs, headers=None, routing_keys=None):
+        """
+        Sends several messages with a single call into the Channel.
+
+        Each message is built and put through the outgoing Interceptor stack(s) as in send.
+
+        @param  msgs            A list of messages to send.
+        @param  headers         Optional headers to send with each message. Will override anything produced by _build_header.
+        @param  routing_keys    Optional list of routing keys, one per message. See SendChannel.send_batch.
+        @returns    A list of 2-tuples of the message body sent and the message headers sent, post-interceptor.
+        """
+        batch = []
+        for msg in msgs:
+            _msg, _header = self._build_msg(msg, headers)
+            if headers: _header.update(headers)
+
+            new_msg, new_headers = self.intercept_out(_msg, _header)
+
+            # Provide a hook for all outgoing messages before they hit transport
+            trigger_msg_out_callback(new_msg, new_headers, self)
+
+            batch.append((new_msg, new_headers))
+
+        self.channel.send_batch(batch, routing_keys=routing_keys)
+
+        return batch
+
     def intercept_out(self, msg, headers):
         """
         Builds an invocation and runs interceptors on it, direction: out.
@@ -187,7 +216,7 @@ class EndpointUnit(object):
         @param  inv     An Invocation instance.
         @returns        A processed Invocation instance.
         """
-        inv_prime = process_interceptors(self.interceptors["message_outgoing"] if "message_outgoing" in self.interceptors else [], inv)
+        inv_prime = process_interceptors(self.interceptors.get("message_outgoing", []), inv)
         return inv_prime
 
     def close(self):
@@ -445,7 +474,15 @@ class ListeningBaseEndpoint(BaseEndpoint):
 
             self.endpoint._message_received(self.body, self.headers)
 
-    def __init__(self, node=None, name=None, from_name=None, binding=None, transport=None):
+    def __init__(self, node=None, name=None, from_name=None, binding=None, transport=None,
+                 prefetch_count=None, ack_batch_size=None, ack_batch_time=None):
+        """
+        @param  prefetch_count  Max number of unacked messages delivered to this endpoint.
+                                Defaults to messaging config prefetch_count, see _get_messaging_config.
+        @param  ack_batch_size  If > 1, acks are sent for this many messages at once (capped at prefetch_count).
+                                Defaults to messaging config ack_batch_size.
+        @param  ack_batch_time  Max time in ms to hold back batched acks. Defaults to messaging config ack_batch_time.
+        """
         BaseEndpoint.__init__(self, node=node, transport=transport)
 
         if name:
@@ -460,6 +497,10 @@ class ListeningBaseEndpoint(BaseEndpoint):
         self._binding = binding
         self._chan = None
 
+        self._prefetch_count = prefetch_count
+        self._ack_batch_size = ack_batch_size
+        self._ack_batch_time = ack_batch_time
+
     def _create_channel(self, **kwargs):
         """
         Overrides the BaseEndpoint create channel to supply a transport if our recv name is one.
@@ -537,6 +578,42 @@ class ListeningBaseEndpoint(BaseEndpoint):
         else:
             self._setup_listener(self._recv_name, binding=binding)
 
+        self._setup_flow_control()
+
+    def _get_messaging_config(self, name, default=None):
+        """
+        Returns a messaging config value for this endpoint, from container.messaging.endpoint in the CFG.
+        Override to provide endpoint specific config.
+        """
+        return CFG.get_safe('container.messaging.endpoint.%s' % name, default)
+
+    def _setup_flow_control(self):
+        """
+        Applies prefetch count and batched acks to the channel.
+        """
+        prefetch_count = self._prefetch_count
+        if prefetch_count is None:
+            prefetch_count = self._get_messaging_config('listen_prefetch_count')
+
+        if prefetch_count:
+            self._chan.set_prefetch(prefetch_count)
+        else:
+            # channels are created with this prefetch count by the node
+            prefetch_count = CFG.get_safe('container.messaging.endpoint.prefetch_count', 1)
+
+        ack_batch_size = self._ack_batch_size
+        if ack_batch_size is None:
+            ack_batch_size = self._get_messaging_config('ack_batch_size', 1)
+        if prefetch_count:
+            # the broker stops delivering with prefetch_count messages unacked
+            ack_batch_size = min(ack_batch_size, prefetch_count)
+
+        if ack_batch_size > 1:
+            ack_batch_time = self._ack_batch_time
+            if ack_batch_time is None:
+                ack_batch_time = self._get_messaging_config('ack_batch_time', 100)
+            self._chan.set_ack_batching(ack_batch_size, ack_batch_time)
+
     def activate(self):
         """
         Begins consuming.
@@ -664,11 +741,27 @@ class Publisher(SendingBaseEndpoint):
     endpoint_unit_type = PublisherEndpointUnit
     channel_type = PublisherChannel
 
-    def __init__(self, **kwargs):
+    def __init__(self, publisher_confirms=None, max_in_flight=None, **kwargs):
+        """
+        @param  publisher_confirms  If True, the broker confirms published messages. Publishing blocks while
+                                    max_in_flight messages are unconfirmed, and messages the broker rejects
+                                    raise an error. Defaults to container.messaging.publisher.confirms config.
+        @param  max_in_flight       Max number of unconfirmed messages.
+                                    Defaults to container.messaging.publisher.max_in_flight config.
+        """
         self._pub_ep = None
+        if publisher_confirms is None:
+            publisher_confirms = CFG.get_safe('container.messaging.publisher.confirms', False)
+        if max_in_flight is None:
+            max_in_flight = CFG.get_safe('container.messaging.publisher.max_in_flight', 1000)
+        self._publisher_confirms = publisher_confirms
+        self._max_in_flight = max_in_flight
         SendingBaseEndpoint.__init__(self, **kwargs)
 
-    def publish(self, msg, to_name=None, headers=None):
+    def _get_publish_endpoint(self, to_name=None):
+        """
+        Returns the endpoint to publish to to_name, the cached one if to_name is None.
+        """
         if to_name is not None:
             if not isinstance(to_name, NameTrio):
                 to_name = NameTrio(bootstrap.get_sys_name(), to_name)   # ensure NT before
@@ -686,16 +779,67 @@ class Publisher(SendingBaseEndpoint):
 
                 self._pub_ep = self.create_endpoint(self._send_name)
                 self._pub_ep.channel.connect(self._send_name)
+                if self._publisher_confirms:
+                    self._pub_ep.channel.enable_confirms(self._max_in_flight)
 
             ep = self._pub_ep
         else:
             ep = self.create_endpoint(to_name)
             ep.channel.connect(to_name)
+            if self._publisher_confirms:
+                ep.channel.enable_confirms(self._max_in_flight)
+
+        return ep
+
+    def publish(self, msg, to_name=None, headers=None):
+        ep = self._get_publish_endpoint(to_name)
+        try:
+            ep.send(msg, headers)
+        finally:
+            if ep != self._pub_ep:
+                self._close_publish_endpoint(ep)
+
+    def publish_batch(self, msgs, to_name=None, headers=None, routing_keys=None):
+        """
+        Publishes several messages at once.
+
+        All messages go through one endpoint and are handed to the transport in one call.
+
+        @param  msgs            A list of messages.
+        @param  to_name         Optional address to publish to (otherwise the Publisher's address).
+        @param  headers         Optional headers for every message.
+        @param  routing_keys    Optional list of routing keys, one per message, on the exchange of the address.
+        """
+        if not msgs:
+            return
+
+        ep = self._get_publish_endpoint(to_name)
+        try:
+            ep.send_batch(msgs, headers=headers, routing_keys=routing_keys)
+        finally:
+            if ep != self._pub_ep:
+                self._close_publish_endpoint(ep)
 
-        ep.send(msg, headers)
-        if ep != self._pub_ep:
+    def _close_publish_endpoint(self, ep):
+        """
+        Closes a non cached publish endpoint, making sure its messages are confirmed first (if enabled).
+        """
+        try:
+            if self._publisher_confirms:
+                ep.channel.wait_for_confirms()
+        finally:
             ep.close()
 
+    def wait_for_confirms(self, timeout=None):
+        """
+        Blocks until all messages published via the Publisher's address are confirmed by the broker.
+        Only valid with publisher_confirms.
+        """
+        if not self._publisher_confirms:
+            raise EndpointError("Publisher confirms are not enabled")
+        if self._pub_ep:
+            self._pub_ep.channel.wait_for_confirms(timeout=timeout)
+
     def close(self):
         """
         Closes the opened publishing channel, if we've opened it previously.
@@ -776,7 +920,168 @@ class BidirectionalListeningEndpointUnit(EndpointUnit):
 #
 
 
+class RPCReplyDispatcher(object):
+    """
+    Owns one long-lived anonymous reply queue on a Node and routes responses to waiting
+    requesters by conv-id.
+
+    Used by RequestEndpointUnit when its RequestResponseClient runs in shared reply queue mode:
+    many concurrent requests then share one queue and one consumer, instead of paying a
+    consume/cancel (and possibly a queue declare/bind/delete) round trip with the broker per call.
+
+    Obtain instances via get_reply_dispatcher, which keeps one per node and exchange.
+    """
+    channel_type = SharedReplyChannel
+
+    def __init__(self, node, exchange):
+        self._node = node
+        self._exchange = exchange
+        self._chan = None
+        self._gl_consume = None
+        self._waiters = {}      # conv-id -> AsyncResult
+        self._closed = False
+
+    def __str__(self):
+        return "RPCReplyDispatcher: exchange: %s, reply-to: %s, waiting: %s" % (self._exchange, self.reply_to, len(self._waiters))
+
+    @property
+    def reply_to(self):
+        """
+        The value of the reply-to header that gets responses routed to this dispatcher.
+        """
+        if self._chan is None or self._chan._recv_name is None:
+            return None
+        return "%s,%s" % (self._chan._recv_name.exchange, self._chan._recv_name.queue)
+
+    def start(self):
+        """
+        Declares the anonymous reply queue, starts consuming and spawns the demultiplexing greenlet.
+        """
+        self._chan = self._node.channel(self.channel_type)
+        self._chan.set_closed_error_callback(self._on_channel_error)
+        self._chan.setup_listener(NameTrio(self._exchange))     # anon queue
+
+        # replies are acked as soon as they are routed, so let the broker deliver more than one at a time
+        prefetch_count = CFG.get_safe('container.messaging.endpoint.shared_reply_prefetch_count', 0)
+        with self._chan._ensure_transport():
+            self._chan._transport.qos_impl(prefetch_count=prefetch_count)
+
+        self._chan.start_consume()
+
+        self._gl_consume = spawn(self._run_consume)
+        self._gl_consume._glname = "pyon.net RPC reply dispatcher"
+
+    def close(self):
+        """
+        Closes the reply channel. Requests still waiting get a ChannelClosedError.
+        """
+        self._closed = True
+        if self._chan is not None:
+            ev = self._chan.close()
+            if not ev.wait(timeout=3):
+                log.warn("Reply channel (%s) close did not respond in time, giving up", self._chan.get_channel_id())
+
+        if self._gl_consume is not None:
+            self._gl_consume.join(timeout=3)
+            self._gl_consume.kill()
+            self._gl_consume = None
+
+        self._abort_waiters(ChannelClosedError("Shared reply queue closed"))
+
+    def register(self, conv_id):
+        """
+        Announces a request that expects a response with the given conv-id.
+
+        Must be called before the request is sent, so a fast response can never be missed.
+
+        @raises ChannelClosedError  If the reply channel is closed.
+        """
+        if self._closed:
+            raise ChannelClosedError("Shared reply queue closed")
+        self._waiters[conv_id] = event.AsyncResult()
+
+    def unregister(self, conv_id):
+        """
+        Forgets a request, whether or not its response arrived.
+        """
+        self._waiters.pop(conv_id, None)
+
+    def wait(self, conv_id, timeout=None):
+        """
+        Blocks until the response for the registered conv-id arrives.
+
+        @raises Timeout
+        @return A 3-tuple of the raw (not intercepted) message body, headers and delivery tag.
+        """
+        return self._waiters[conv_id].get(timeout=timeout)
+
+    def _run_consume(self):
+        try:
+            while True:
+                try:
+                    rmsg, rheaders, rdtag = self._chan.recv()
+                except ChannelClosedError:
+                    break
+
+                try:
+                    self._chan.ack(rdtag)
+                except Exception as ex:
+                    log.warn("Could not ack shared reply (%s): %s", rdtag, ex)
+
+                conv_id = rheaders.get('conv-id', None)
+                ar = self._waiters.get(conv_id, None)
+                if ar is None or ar.ready():
+                    log.warn("Discarding unknown message, likely from a previous timed out request (conv-id: %s, seq: %s, perf: %s)", conv_id or "no conv id", rheaders.get('conv-seq', 'no conv seq'), rheaders.get('performative', 'None'))
+                    continue
+
+                ar.set((rmsg, rheaders, rdtag))
+
+        finally:
+            # no longer usable: fail the requests still waiting and make sure the next request sets up a new one
+            self._closed = True
+            if self._node.reply_dispatchers.get(self._exchange, None) is self:
+                del self._node.reply_dispatchers[self._exchange]
+            self._abort_waiters(ChannelClosedError("Shared reply queue closed"))
+
+    def _on_channel_error(self, ch, code, text):
+        log.warn("Shared reply channel closed with error (%s): %s", code, text)
+        self._closed = True
+        if self._node.reply_dispatchers.get(self._exchange, None) is self:
+            del self._node.reply_dispatchers[self._exchange]
+        self._abort_waiters(ChannelClosedError("Shared reply queue closed with error (%s): %s" % (code, text)))
+
+    def _abort_waiters(self, ex):
+        for ar in self._waiters.itervalues():
+            if not ar.ready():
+                ar.set_exception(ex)
+
+
+def get_reply_dispatcher(node, exchange):
+    """
+    Returns the node's started RPCReplyDispatcher for the given exchange, creating it on first use.
+    """
+    with node._lock:
+        rd = node.reply_dispatchers.get(exchange, None)
+        if rd is None:
+            rd = RPCReplyDispatcher(node, exchange)
+            rd.start()
+            node.reply_dispatchers[exchange] = rd
+
+    return rd
+
+
 class RequestEndpointUnit(BidirectionalEndpointUnit):
+
+    _reply_dispatcher = None
+
+    def __init__(self, reply_dispatcher=None, **kwargs):
+        """
+        @param  reply_dispatcher    Optional RPCReplyDispatcher. If set, the response is received via its
+                                    shared reply queue instead of a queue on this unit's channel.
+        """
+        BidirectionalEndpointUnit.__init__(self, **kwargs)
+        self._reply_dispatcher = reply_dispatcher
+
     def _get_response(self, conv_id, timeout):
         """
         Gets a response message to the conv_id within the given timeout.
@@ -784,6 +1089,14 @@ class RequestEndpointUnit(BidirectionalEndpointUnit):
         @raises Timeout
         @return A 2-tuple of the received message body and received message headers.
         """
+        if self._reply_dispatcher is not None:
+            rmsg, rheaders, rdtag = self._reply_dispatcher.wait(conv_id, timeout=timeout)
+
+            # Provide a hook for any message received
+            trigger_msg_in_callback(rmsg, rheaders, rdtag, self)
+
+            return self.intercept_in(rmsg, rheaders)
+
         with Timeout(seconds=timeout):
 
             # start consuming
@@ -818,15 +1131,31 @@ class RequestEndpointUnit(BidirectionalEndpointUnit):
 
         # we have a timeout, update reply-by header
         headers['reply-by'] = str(int(headers['ts']) + int(timeout * 1000))
-        self.channel.setup_listener(NameTrio(self.channel._send_name.exchange)) # anon queue
-        # call base send, and get back the headers it ended up building and sending
-        # we extract the conv-id so we can tell the listener what is valid.
-        _, sent_headers = BidirectionalEndpointUnit._send(self, msg, headers=headers)
+
+        # with a shared reply queue, register the conv-id before sending so the response cannot be missed
+        shared_conv_id = None
+        if self._reply_dispatcher is not None and 'conv-id' in headers:
+            shared_conv_id = headers['conv-id']
+            headers['reply-to'] = self._reply_dispatcher.reply_to
+            self._reply_dispatcher.register(shared_conv_id)
+        else:
+            # nothing to route a shared response by, receive on our own channel instead
+            self._reply_dispatcher = None
+            self.channel.setup_listener(NameTrio(self.channel._send_name.exchange)) # anon queue
 
         try:
-            result_data, result_headers = self._get_response(sent_headers['conv-id'], timeout)
-        except Timeout:
-            raise exception.Timeout('Request timed out (%d sec) waiting for response from %s, conv %s' % (timeout, str(self.channel._send_name), sent_headers['conv-id']))
+            # call base send, and get back the headers it ended up building and sending
+            # we extract the conv-id so we can tell the listener what is valid.
+            _, sent_headers = BidirectionalEndpointUnit._send(self, msg, headers=headers)
+
+            try:
+                result_data, result_headers = self._get_response(sent_headers['conv-id'], timeout)
+            except Timeout:
+                raise exception.Timeout('Request timed out (%d sec) waiting for response from %s, conv %s' % (timeout, str(self.channel._send_name), sent_headers['conv-id']))
+        finally:
+            if shared_conv_id is not None:
+                self._reply_dispatcher.unregister(shared_conv_id)
+
         return result_data, result_headers
 
     def _build_header(self, raw_msg, raw_headers):
@@ -844,11 +1173,31 @@ class RequestEndpointUnit(BidirectionalEndpointUnit):
 class RequestResponseClient(SendingBaseEndpoint):
     """
     Sends a request, waits for a response.
+
+    In shared reply queue mode (shared_reply_queue kwarg, or container.messaging.endpoint.rpc_shared_reply_queue
+    in CFG), responses for all requests on the node are received on one long-lived queue per exchange.
     """
     endpoint_unit_type = RequestEndpointUnit
 
+    def __init__(self, shared_reply_queue=None, **kwargs):
+        SendingBaseEndpoint.__init__(self, **kwargs)
+
+        if shared_reply_queue is None:
+            shared_reply_queue = CFG.get_safe('container.messaging.endpoint.rpc_shared_reply_queue', False)
+        self._shared_reply_queue = shared_reply_queue
+
+    def _get_reply_dispatcher(self):
+        """
+        Returns the RPCReplyDispatcher to hand to new endpoint units, or None if not in shared reply queue mode.
+        """
+        if not self._shared_reply_queue:
+            return None
+
+        self._ensure_node()
+        return get_reply_dispatcher(self.node, self._send_name.exchange)
+
     def request(self, msg, headers=None, timeout=None):
-        e = self.create_endpoint(self._send_name)
+        e = self.create_endpoint(self._send_name, reply_dispatcher=self._get_reply_dispatcher())
         try:
             retval, headers = e.send(msg, headers=headers, timeout=timeout)
         finally:
@@ -856,6 +1205,35 @@ class RequestResponseClient(SendingBaseEndpoint):
             e.close()
         return retval
 
+    def request_async(self, msg, headers=None, timeout=None):
+        """
+        Non-blocking version of request.
+
+        The request is made from a new greenlet. Many of these may be outstanding at once; use
+        gather to wait for all of them.
+
+        @returns    An AsyncResult. Its get() returns the response or raises the error request would have.
+        """
+        return self._spawn_request(self.request, msg, headers=headers, timeout=timeout)
+
+    def _spawn_request(self, request_call, *args, **kwargs):
+        """
+        Runs request_call in a new greenlet and returns an AsyncResult for its outcome.
+
+        Override to carry greenlet-local state (such as a process context) over into the new greenlet.
+        """
+        ar = event.AsyncResult()
+
+        def run_request():
+            try:
+                ar.set(request_call(*args, **kwargs))
+            except Exception as ex:
+                ar.set_exception(ex)
+
+        gl = spawn(run_request)
+        gl._glname = "pyon.net async request"
+        return ar
+
 
 class ResponseEndpointUnit(BidirectionalListeningEndpointUnit):
     """
@@ -1029,10 +1407,20 @@ class RPCClient(RequestResponseClient):
             ionobj = IonObject(in_obj, **kwargs)
             return self.request(ionobj, op=name, headers=headers)
 
+        def svcmethod_async(self, *args, **kwargs):
+            assert len(args) == 0, "You MUST used named keyword args when calling a dynamically generated remote method"      # we have no way of getting correct order
+            headers = kwargs.pop('headers', None)
+            ionobj = IonObject(in_obj, **kwargs)
+            return self.request_async(ionobj, op=name, headers=headers)
+
         newmethod           = svcmethod
         newmethod.__doc__   = doc
         setattr(self.__class__, name, newmethod)
 
+        newmethod_async             = svcmethod_async
+        newmethod_async.__doc__     = "Non-blocking version of %s, returns an AsyncResult." % name
+        setattr(self.__class__, "%s_async" % name, newmethod_async)
+
     def request(self, msg, headers=None, op=None, timeout=None):
         """
         Request override for RPCClients.
@@ -1051,6 +1439,14 @@ class RPCClient(RequestResponseClient):
 
         return RequestResponseClient.request(self, msg, headers=headers, timeout=timeout)
 
+    def request_async(self, msg, headers=None, op=None, timeout=None):
+        """
+        Non-blocking version of request, returns an AsyncResult.
+
+        The generated service clients expose this per operation as <op>_async.
+        """
+        return self._spawn_request(self.request, msg, headers=headers, op=op, timeout=timeout)
+
 
 class RPCResponseEndpointUnit(ResponseEndpointUnit):
     def __init__(self, routing_obj=None, **kwargs):
@@ -1113,6 +1509,10 @@ class RPCResponseEndpointUnit(ResponseEndpointUnit):
             response_headers['conv-id']     = headers.get('conv-id', '')
             response_headers['conv-seq']    = headers.get('conv-seq', 1) + 1
 
+            # send numpy arrays in the reply encoded as the requester can decode them (see EncodeInterceptor)
+            if NPARRAY_ACCEPT_HEADER in headers:
+                response_headers[NPARRAY_HEADER] = headers[NPARRAY_ACCEPT_HEADER]
+
 #            # record elapsed time in RPC stats
 #            receiver = headers.get('receiver', '?')  # header field is generally: systemname,service_name
 #            parts = receiver.split(',')
@@ -1378,6 +1778,24 @@ class RPCServer(RequestResponseServer):
         return "RPCServer: recv_name: %s" % (str(self._recv_name))
 
 
+def gather(async_results, timeout=None):
+    """
+    Waits for all given AsyncResults (as returned by request_async) to complete.
+
+    @param  async_results   An iterable of AsyncResults.
+    @param  timeout         Optional overall timeout in seconds.
+    @raises Timeout         If not all results are in within the timeout.
+    @returns                A list of the results, in order. If any request failed, its error is raised.
+    """
+    async_results = list(async_results)
+    try:
+        with Timeout(timeout):
+            return [ar.get() for ar in async_results]
+    except Timeout:
+        num_ready = len([ar for ar in async_results if ar.ready()])
+        raise exception.Timeout("Timed out (%s sec) gathering results, %d of %d ready" % (timeout, num_ready, len(async_results)))
+
+
 def log_message(prefix="MESSAGE", msg=None, headers=None, recv=None, delivery_tag=None, is_send=True):
     """
     Utility function to print an legible comprehensive summary of a received message.
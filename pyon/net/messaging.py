@@ -12,6 +12,7 @@ from pika import channel as pikachannel
 from pika.exceptions import NoFreeChannels
 
 from pyon.core.bootstrap import CFG, get_sys_name
+from pyon.core.interceptor.interceptor import InterceptorChain
 from pyon.net import channel
 from pyon.util.async import blocking_cb
 from pyon.util.containers import for_name
@@ -33,6 +34,7 @@ class BaseNode(object):
         self._lock = coros.RLock()
 
         self.interceptors = {}  # endpoint interceptors
+        self.reply_dispatchers = {}     # exchange -> shared RPC reply dispatcher (see pyon.net.endpoint)
 
     def on_connection_open(self, client):
         """
@@ -68,6 +70,17 @@ class BaseNode(object):
         log.debug("In Node.stop_node")
         self.running = False
 
+    def _close_reply_dispatchers(self):
+        """
+        Closes any shared RPC reply queues living on this node. Called before the node stops.
+        """
+        for rd in self.reply_dispatchers.values():
+            try:
+                rd.close()
+            except Exception as ex:
+                log.warn("Could not close reply dispatcher %s: %s", rd, ex)
+        self.reply_dispatchers.clear()
+
     def channel(self, ch_type):
         """
         Create a channel on current node.
@@ -127,7 +140,10 @@ class BaseNode(object):
 
                 interceptors[type_and_direction].append(classinst)
 
-        self.interceptors = dict(interceptors)
+        # Precompile each stack into a chain of bound methods, skipping no-op interceptors
+        timing = interceptor_cfg.get("timing", False)
+        self.interceptors = {type_and_direction: InterceptorChain(stack_list, list(stack[type_and_direction]), timing)
+                             for type_and_direction, stack_list in interceptors.iteritems()}
 
 class NodeB(BaseNode):
     """
@@ -155,7 +171,8 @@ class NodeB(BaseNode):
         log.debug("NodeB.stop_node (running: %s)", self.running)
 
         if self.running:
-            # clean up pooling before we shut connection
+            # clean up shared reply queues and pooling before we shut connection
+            self._close_reply_dispatchers()
             self._destroy_pool()
             self.client.close()
 
@@ -412,6 +429,7 @@ class LocalNode(BaseNode):
 
     def stop_node(self):
         if self.running:
+            self._close_reply_dispatchers()
             if self._own_router:
                 self._local_router.stop()
         self.running = False
@@ -3,9 +3,9 @@
 __author__ = 'Dave Foster <dfoster@asascience.com>'
 
 
-from mock import Mock, sentinel, patch, MagicMock
+from mock import Mock, sentinel, patch, MagicMock, call
 from gevent.event import Event
-from gevent import spawn
+from gevent import spawn, sleep
 from gevent.queue import Queue
 import Queue as PQueue
 import time
@@ -173,6 +173,24 @@ class TestSendChannel(PyonTestCase):
         self.assertIn('custom', props)
         self.assertEquals(props['custom'], 'val')
 
+    def test_send_batch(self):
+        transport = Mock()
+        transport.channel_number = sentinel.channel_number
+        self.ch.on_channel_open(transport)
+        self.ch.connect(NameTrio('xp', 'namen'))
+
+        self.ch.send_batch([('daten1', None), ('daten2', {'custom':'val'})])
+        transport.publish_batch_impl.assert_called_once_with(exchange='xp',
+                                                             messages=[('namen', 'daten1', {}),
+                                                                       ('namen', 'daten2', {'custom':'val'})],
+                                                             immediate=False,
+                                                             mandatory=False,
+                                                             durable_msg=False)
+        self.assertFalse(transport.publish_impl.called)
+
+        self.ch.send_batch([('daten1', None), ('daten2', None)], routing_keys=['k1', 'k2'])
+        self.assertEquals(transport.publish_batch_impl.call_args[1]['messages'], [('k1', 'daten1', {}), ('k2', 'daten2', {})])
+
 @attr('UNIT')
 class TestRecvChannel(PyonTestCase):
     def setUp(self):
@@ -527,6 +545,53 @@ class TestRecvChannel(PyonTestCase):
 
         transport.ack_impl.assert_called_once_with(sentinel.delivery_tag)
 
+    def test_ack_batching(self):
+        transport = Mock()
+        transport.channel_number = sentinel.channel_number
+        self.ch.on_channel_open(transport)
+
+        self.ch.set_ack_batching(3)
+        self.ch.ack(1)
+        self.ch.ack(2)
+        self.assertFalse(transport.ack_impl.called)
+
+        self.ch.ack(3)
+        transport.ack_impl.assert_called_once_with(3, multiple=True)
+
+        # pending acks get sent before a reject
+        self.ch.ack(4)
+        self.ch.reject(5)
+        self.assertEquals(transport.ack_impl.call_args, call(4, multiple=True))
+        transport.reject_impl.assert_called_once_with(5, requeue=False)
+
+        self.ch.flush_acks()
+        self.assertEquals(transport.ack_impl.call_count, 2)
+
+    def test_ack_batching_time(self):
+        transport = Mock()
+        transport.channel_number = sentinel.channel_number
+        self.ch.on_channel_open(transport)
+
+        self.ch.set_ack_batching(10, batch_time=10)
+        self.ch.ack(1)
+        self.ch.ack(2)
+        self.assertFalse(transport.ack_impl.called)
+
+        sleep(0.1)
+        transport.ack_impl.assert_called_once_with(2, multiple=True)
+        self.assertIsNone(self.ch._ack_timer)
+
+    def test_close_flushes_acks(self):
+        transport = Mock()
+        transport.channel_number = sentinel.channel_number
+        self.ch.on_channel_open(transport)
+
+        self.ch.set_ack_batching(10)
+        self.ch.ack(1)
+        self.ch.close_impl()
+
+        transport.ack_impl.assert_called_once_with(1, multiple=True)
+
     def test_reject(self):
         transport = Mock()
         transport.channel_number = sentinel.channel_number
@@ -672,6 +737,41 @@ class TestListenChannel(PyonTestCase):
         self.assertEquals(self.ch._fsm.current_state, self.ch.S_ACTIVE)
         self.assertTrue(self.ch._consuming)
 
+    def test_accepted_channel_batched_ack(self):
+        transport = Mock()
+        self.ch.on_channel_open(transport)
+        self.ch._fsm.current_state = self.ch.S_ACCEPTED
+        self.ch.set_ack_batching(2)
+
+        for dtag in (1, 2):
+            newch = self.ch._create_accepted_channel(transport, None)
+            newch._delivery_tags.add(dtag)
+            newch.ack(dtag)
+            self.ch._fsm.current_state = self.ch.S_ACCEPTED
+
+        # both accepted channels acked via the parent, as one
+        transport.ack_impl.assert_called_once_with(2, multiple=True)
+
+    def test_accepted_channel_reject_flushes_acks(self):
+        transport = Mock()
+        self.ch.on_channel_open(transport)
+        self.ch._fsm.current_state = self.ch.S_ACCEPTED
+        self.ch.set_ack_batching(10)
+        transport.reset_mock()
+
+        newch = self.ch._create_accepted_channel(transport, None)
+        newch._delivery_tags.add(1)
+        newch.ack(1)
+        self.ch._fsm.current_state = self.ch.S_ACCEPTED
+        self.assertFalse(transport.ack_impl.called)
+
+        newch = self.ch._create_accepted_channel(transport, None)
+        newch._delivery_tags.add(2)
+        newch.reject(2)
+
+        # the pending ack is sent before the reject
+        self.assertEquals(transport.method_calls, [call.ack_impl(1, multiple=True), call.reject_impl(2, requeue=False)])
+
     def test_close_while_accepted(self):
         rmock = Mock()
         rmock.return_value = sentinel.msg
@@ -6,6 +6,7 @@ __author__ = 'Dave Foster <dfoster@asascience.com>'
 from nose.plugins.attrib import attr
 from mock import Mock, sentinel, patch, ANY, call, MagicMock
 from gevent import event, spawn
+from gevent.timeout import Timeout
 import unittest
 from zope.interface.declarations import implements
 from zope.interface.interface import Interface
@@ -17,12 +18,13 @@ from pyon.core import exception
 from pyon.core.bootstrap import get_sys_name, CFG
 from pyon.container.cc import Container
 from pyon.core.interceptor.interceptor import Invocation
-from pyon.net.channel import BaseChannel, SendChannel, BidirClientChannel, SubscriberChannel, ChannelClosedError, ServerChannel, RecvChannel, ListenChannel
-from pyon.net.endpoint import EndpointUnit, BaseEndpoint, RPCServer, Subscriber, Publisher, RequestResponseClient, RequestEndpointUnit, RPCRequestEndpointUnit, RPCClient, RPCResponseEndpointUnit, EndpointError, SendingBaseEndpoint, ListeningBaseEndpoint
+from pyon.net.channel import BaseChannel, SendChannel, BidirClientChannel, SubscriberChannel, ChannelClosedError, ServerChannel, RecvChannel, ListenChannel, SharedReplyChannel
+from pyon.net.endpoint import EndpointUnit, BaseEndpoint, RPCServer, Subscriber, Publisher, RequestResponseClient, RequestEndpointUnit, RPCRequestEndpointUnit, RPCClient, RPCResponseEndpointUnit, EndpointError, SendingBaseEndpoint, ListeningBaseEndpoint, RPCReplyDispatcher, get_reply_dispatcher, gather
 from pyon.net.messaging import NodeB
 from pyon.ion.service import BaseService
 from pyon.net.transport import NameTrio, BaseTransport
 from pyon.util.sflow import SFlowManager
+from pyon.util.containers import DotDict
 
 # NO INTERCEPTORS - we use these mock-like objects up top here which deliver received messages that don't go through the interceptor stack.
 no_interceptors = {'message_incoming': [],
@@ -333,6 +335,41 @@ class TestListeningBaseEndpoint(PyonTestCase):
         chmock.accept.return_value.recv.assert_called_once_with()
         ep.create_endpoint.assert_called_once_with(existing_channel=chmock.accept.return_value)
 
+    def test_initialize_flow_control(self):
+        chmock = Mock(spec=ListenChannel)
+        nodemock = Mock(spec=NodeB)
+        nodemock.channel.return_value = chmock
+
+        ep = ListeningBaseEndpoint(node=nodemock, from_name=NameTrio(sentinel.ex, sentinel.queue),
+                                   prefetch_count=50, ack_batch_size=100, ack_batch_time=20)
+        ep.initialize()
+
+        chmock.set_prefetch.assert_called_once_with(50)
+        chmock.set_ack_batching.assert_called_once_with(50, 20)      # capped at prefetch count
+
+    def test_initialize_flow_control_default(self):
+        chmock = Mock(spec=ListenChannel)
+        nodemock = Mock(spec=NodeB)
+        nodemock.channel.return_value = chmock
+
+        ep = ListeningBaseEndpoint(node=nodemock, from_name=NameTrio(sentinel.ex, sentinel.queue))
+        ep.initialize()
+
+        self.assertFalse(chmock.set_prefetch.called)
+        self.assertFalse(chmock.set_ack_batching.called)
+
+    def test_initialize_flow_control_config(self):
+        chmock = Mock(spec=ListenChannel)
+        nodemock = Mock(spec=NodeB)
+        nodemock.channel.return_value = chmock
+
+        ep = ListeningBaseEndpoint(node=nodemock, from_name=NameTrio(sentinel.ex, sentinel.queue))
+        with patch('pyon.net.endpoint.CFG', DotDict({'container': {'messaging': {'endpoint': {'listen_prefetch_count': 20, 'ack_batch_size': 10}}}})):
+            ep.initialize()
+
+        chmock.set_prefetch.assert_called_once_with(20)
+        chmock.set_ack_batching.assert_called_once_with(10, 100)
+
     def test_get_stats_no_channel(self):
         ep = ListeningBaseEndpoint()
         self.assertRaises(EndpointError, ep.get_stats)
@@ -425,6 +462,32 @@ class TestPublisher(PyonTestCase):
         self._pub.publish(sentinel.msg, to_name=sentinel.to_name)
         self.assertEquals(self._ch.send.call_count, 2)
 
+    def test_publish_batch(self):
+        self._pub.publish_batch(["pub1", "pub2"], headers={'custom': 'val'}, routing_keys=['k1', 'k2'])
+
+        self._node.channel.assert_called_once_with(self._pub.channel_type, transport=None)
+        self.assertEquals(self._ch.send.call_count, 0)
+        self.assertEquals(self._ch.send_batch.call_count, 1)
+
+        batch = self._ch.send_batch.call_args[0][0]
+        self.assertEquals([msg for msg, _ in batch], ["pub1", "pub2"])
+        self.assertTrue(all(headers['custom'] == 'val' for _, headers in batch))
+        self.assertEquals(self._ch.send_batch.call_args[1], {'routing_keys': ['k1', 'k2']})
+
+        # empty batch does nothing
+        self._pub.publish_batch([])
+        self.assertEquals(self._ch.send_batch.call_count, 1)
+
+    def test_publish_confirms(self):
+        pub = Publisher(node=self._node, to_name="testpub", publisher_confirms=True, max_in_flight=10)
+        pub.publish("pub")
+        self._ch.enable_confirms.assert_called_once_with(10)
+
+        pub.wait_for_confirms(timeout=5)
+        self._ch.wait_for_confirms.assert_called_once_with(timeout=5)
+
+        self.assertRaises(EndpointError, self._pub.wait_for_confirms)
+
     def test_close(self):
         self._pub.publish(sentinel.msg)
         self._pub._pub_ep.close = Mock()
@@ -533,6 +596,118 @@ class TestRequestResponse(PyonTestCase, RecvMockMixin):
         # Err, not defined at the moment.
         pass
 
+    def test_endpoint_send_shared_reply(self):
+        rd = Mock(spec=RPCReplyDispatcher)
+        rd.reply_to = "xp,amq.gen-shared"
+        rd.wait.return_value = ("bidirmsg", {'conv-id':sentinel.conv_id}, sentinel.delivery_tag)
+
+        e = RequestEndpointUnit(interceptors={}, reply_dispatcher=rd)
+        ch = self._setup_mock_channel()
+        e.attach_channel(ch)
+
+        headers = {'ts':'1', 'conv-id':sentinel.conv_id}
+        retval, heads = e._send("msg", headers)
+        self.assertEquals(retval, "bidirmsg")
+        self.assertEquals(headers['reply-to'], "xp,amq.gen-shared")
+
+        # no per-request queue, response came via the dispatcher
+        self.assertEquals(ch.setup_listener.call_count, 0)
+        self.assertEquals(ch.start_consume.call_count, 0)
+        rd.register.assert_called_once_with(sentinel.conv_id)
+        rd.wait.assert_called_once_with(sentinel.conv_id, timeout=ANY)
+        rd.unregister.assert_called_once_with(sentinel.conv_id)
+
+    def test_endpoint_send_shared_reply_timeout(self):
+        rd = Mock(spec=RPCReplyDispatcher)
+        rd.reply_to = "xp,amq.gen-shared"
+        rd.wait.side_effect = Timeout
+
+        e = RequestEndpointUnit(interceptors={}, reply_dispatcher=rd)
+        e.attach_channel(self._setup_mock_channel())
+
+        self.assertRaises(exception.Timeout, e._send, "msg", {'ts':'1', 'conv-id':sentinel.conv_id}, timeout=1)
+        rd.unregister.assert_called_once_with(sentinel.conv_id)
+
+    def test_rr_client_shared_reply(self):
+        rr = RequestResponseClient(node=self._node, to_name="rr", shared_reply_queue=True)
+        rr.node.channel.return_value = self._setup_mock_channel()
+        rr.node.interceptors = {}
+
+        with patch('pyon.net.endpoint.get_reply_dispatcher') as grdmock:
+            self.assertEquals(rr._get_reply_dispatcher(), grdmock.return_value)
+            grdmock.assert_called_once_with(self._node, rr._send_name.exchange)
+
+
+@attr('UNIT')
+class TestRPCReplyDispatcher(PyonTestCase):
+    def setUp(self):
+        self._node = Mock(spec=NodeB)
+        self._node.reply_dispatchers = {}
+        self._node._lock = MagicMock()
+
+        self._ch = MagicMock(spec=SharedReplyChannel())
+        self._ch._recv_name = NameTrio('xp', 'amq.gen-shared')
+        self._node.channel.return_value = self._ch
+
+    def _set_replies(self, *replies):
+        vals = list(replies)
+        def _ret(*args, **kwargs):
+            if len(vals):
+                return vals.pop(0)
+            raise ChannelClosedError()
+        self._ch.recv.side_effect = _ret
+
+    def test_get_reply_dispatcher(self):
+        self._set_replies()
+        rd = get_reply_dispatcher(self._node, 'xp')
+
+        self.assertEquals(self._node.reply_dispatchers, {'xp': rd})
+        self.assertEquals(rd.reply_to, "xp,amq.gen-shared")
+        self._node.channel.assert_called_once_with(SharedReplyChannel)
+        self._ch.setup_listener.assert_called_once_with(ANY)
+        self._ch.start_consume.assert_called_once_with()
+
+        # cached per node and exchange
+        self.assertEquals(get_reply_dispatcher(self._node, 'xp'), rd)
+        self.assertEquals(self._node.channel.call_count, 1)
+
+    def test_routes_by_conv_id(self):
+        self._set_replies(("other", {'conv-id':'old-conv'}, sentinel.dtag1),
+                          ("mine", {'conv-id':'conv-1'}, sentinel.dtag2))
+
+        rd = get_reply_dispatcher(self._node, 'xp')
+        rd.register('conv-1')
+
+        body, headers, dtag = rd.wait('conv-1', timeout=1)
+        self.assertEquals(body, "mine")
+        self.assertEquals(dtag, sentinel.dtag2)
+
+        # both replies acked, the unknown one discarded
+        rd._gl_consume.join(timeout=1)
+        self.assertEquals(self._ch.ack.call_args_list, [call(sentinel.dtag1), call(sentinel.dtag2)])
+
+        # channel closed, a new dispatcher will be made next time
+        self.assertEquals(self._node.reply_dispatchers, {})
+
+    def test_close_aborts_waiters(self):
+        self._set_replies()
+        rd = RPCReplyDispatcher(self._node, 'xp')
+        rd.start()
+        rd.register('conv-1')
+        rd.close()
+
+        self.assertRaises(ChannelClosedError, rd.wait, 'conv-1', timeout=1)
+
+    def test_channel_closed_aborts_waiters(self):
+        self._set_replies(("other", {'conv-id':'old-conv'}, sentinel.dtag1))
+        rd = get_reply_dispatcher(self._node, 'xp')
+        rd.register('conv-1')
+
+        # the reply channel closes before the response arrives
+        self.assertRaises(ChannelClosedError, rd.wait, 'conv-1', timeout=1)
+        self.assertEquals(self._node.reply_dispatchers, {})
+        self.assertRaises(ChannelClosedError, rd.register, 'conv-2')
+
 
 class ISimpleInterface(Interface):
     """
@@ -606,6 +781,45 @@ class TestRPCClient(PyonTestCase, RecvMockMixin):
         rpcc = RPCClient(to_name="simply", iface=ISimpleInterface)
         self.assertRaises(AssertionError, rpcc.simple, "zap", "zip")
 
+    @patch('pyon.net.endpoint.IonObject')
+    def test_rpc_client_async(self, iomock):
+        rpcc = RPCClient(to_name="simply", iface=ISimpleInterface)
+        self.assertTrue(hasattr(rpcc, 'simple_async'))
+
+        with patch.object(rpcc, 'request', return_value=sentinel.ret) as reqmock:
+            ar = rpcc.simple_async(one="zap", two="zip")
+            self.assertEquals(ar.get(timeout=5), sentinel.ret)
+
+        iomock.assert_called_once_with('SimpleInterface_simple_in', one='zap', two='zip')
+        reqmock.assert_called_once_with(iomock.return_value, headers=None, op='simple', timeout=None)
+
+    def test_request_async_error(self):
+        rpcc = RPCClient(to_name="simply")
+
+        with patch.object(rpcc, 'request', side_effect=exception.NotFound("nope")):
+            ar = rpcc.request_async(sentinel.msg, op='simple')
+            self.assertRaises(exception.NotFound, ar.get, timeout=5)
+
+    def test_gather(self):
+        ars = [event.AsyncResult() for _ in xrange(3)]
+        for i, ar in enumerate(ars):
+            spawn(ar.set, i)
+
+        self.assertEquals(gather(ars, timeout=5), [0, 1, 2])
+
+    def test_gather_error(self):
+        ars = [event.AsyncResult(), event.AsyncResult()]
+        ars[0].set(sentinel.one)
+        ars[1].set_exception(exception.BadRequest("bad"))
+
+        self.assertRaises(exception.BadRequest, gather, ars, timeout=5)
+
+    def test_gather_timeout(self):
+        ars = [event.AsyncResult(), event.AsyncResult()]
+        ars[0].set(sentinel.one)
+
+        self.assertRaises(exception.Timeout, gather, ars, timeout=0.1)
+
 @attr('UNIT')
 class TestRPCResponseEndpoint(PyonTestCase, RecvMockMixin):
 
@@ -5,6 +5,7 @@ __author__ = 'Dave Foster <dfoster@asascience.com>'
 
 from pyon.net.messaging import NodeB, ioloop, make_node, PyonSelectConnection
 from pyon.net.channel import BaseChannel, BidirClientChannel, RecvChannel
+from pyon.core.interceptor.interceptor import Invocation, InterceptorChain, process_interceptors
 from pyon.util.unit_test import PyonTestCase
 from mock import Mock, sentinel, patch
 from nose.plugins.attrib import attr
@@ -244,6 +245,28 @@ class TestNodeB(PyonTestCase):
         self.assertRaises(StandardError, self._node._new_transport)
         containermock.fail_fast.assert_called_once_with("AMQCHAN IS NONE, messaging has failed", True)
 
+    def test_setup_interceptors(self):
+        cfg = DotDict({'interceptors': {'encode': {'class': 'pyon.core.interceptor.encode.EncodeInterceptor'},
+                                        'validate': {'class': 'pyon.core.interceptor.validate.ValidateInterceptor',
+                                                     'config': {'enabled': False}}},
+                       'stack': {'message_incoming': ['encode', 'validate'],
+                                 'message_outgoing': ['validate', 'encode']}})
+        self._node.setup_interceptors(cfg)
+
+        self.assertEquals(sorted(self._node.interceptors), ['message_incoming', 'message_outgoing'])
+        incoming = self._node.interceptors['message_incoming']
+        outgoing = self._node.interceptors['message_outgoing']
+        self.assertIsInstance(incoming, InterceptorChain)
+        self.assertEquals(incoming.names, ['encode', 'validate'])
+        self.assertEquals(outgoing.names, ['validate', 'encode'])
+        self.assertEquals([type(i).__name__ for i in incoming], ['EncodeInterceptor', 'ValidateInterceptor'])
+        # Interceptors are shared across stacks
+        self.assertIs(incoming[0], outgoing[1])
+
+        invoke = process_interceptors(outgoing, Invocation(path=Invocation.PATH_OUT, message={'a': 1}))
+        invoke = process_interceptors(incoming, Invocation(path=Invocation.PATH_IN, message=invoke.message, headers=invoke.headers))
+        self.assertEquals(invoke.message, {'a': 1})
+
 @attr('UNIT')
 class TestMessaging(PyonTestCase):
     def test_ioloop(self):
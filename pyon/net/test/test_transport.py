@@ -7,11 +7,16 @@ from pyon.util.unit_test import PyonTestCase
 from pyon.util.int_test import IonIntegrationTestCase
 from pyon.net.transport import NameTrio, BaseTransport, AMQPTransport, TransportError, TopicTrie, LocalRouter, ComposableTransport, LocalTransport
 from pyon.core.bootstrap import get_sys_name
-from pika import BasicProperties
+from pyon.util.log import log
+from pika import BasicProperties, spec
+from pika.callback import CallbackManager
+from pika.channel import Channel
+from pika.frame import Method
 
 from nose.plugins.attrib import attr
 from mock import Mock, MagicMock, sentinel, patch, call, ANY
 from gevent.event import Event
+from gevent import spawn
 import time
 
 @attr('UNIT')
@@ -64,7 +69,10 @@ class TestComposableTransport(PyonTestCase):
                                         'stop_consume_impl'    : right.stop_consume_impl,
                                         'get_stats_impl'       : right.get_stats_impl,
                                         'qos_impl'             : right.qos_impl,
-                                        'publish_impl'         : right.publish_impl, })
+                                        'publish_impl'         : right.publish_impl,
+                                        'publish_batch_impl'   : right.publish_batch_impl,
+                                        'enable_confirms_impl' : right.enable_confirms_impl,
+                                        'wait_for_confirms_impl': right.wait_for_confirms_impl, })
 
     def test_overlay(self):
         left = Mock()
@@ -121,7 +129,7 @@ class TestComposableTransport(PyonTestCase):
         left.purge_impl.assert_called_once_with(sentinel.queue)
         left.setup_listener.assert_called_once_with(sentinel.binding, sentinel.callback)
 
-        right.ack_impl.assert_called_once_with(sentinel.dtag)
+        right.ack_impl.assert_called_once_with(sentinel.dtag, multiple=False)
         right.reject_impl.assert_called_once_with(sentinel.dtag, requeue=False)
         right.start_consume_impl.assert_called_once_with(sentinel.callback, sentinel.queue, no_ack=False, exclusive=False)
         right.stop_consume_impl.assert_called_once_with(sentinel.ctag)
@@ -433,7 +441,7 @@ class TestAMQPTransportCommonMethods(PyonTestCase):
     def test_ack_impl(self):
         self.tp.ack_impl(sentinel.dtag)
 
-        self.tp._client.basic_ack.assert_called_once_with(sentinel.dtag)
+        self.tp._client.basic_ack.assert_called_once_with(sentinel.dtag, multiple=False)
 
     def test_reject_impl(self):
         self.tp.reject_impl(sentinel.dtag)
@@ -527,6 +535,123 @@ class TestAMQPTransportCommonMethods(PyonTestCase):
                                                               immediate=False,
                                                               mandatory=False)
 
+    @patch('pyon.net.transport.BasicProperties')
+    def test_publish_batch_impl(self, bpmock):
+        self.tp.publish_batch_impl(sentinel.exchange, [(sentinel.rkey1, sentinel.body1, sentinel.props1),
+                                                       (sentinel.rkey2, sentinel.body2, sentinel.props2)])
+
+        self.assertEquals(self.tp._client.basic_publish.call_args_list,
+                          [call(exchange=sentinel.exchange, routing_key=sentinel.rkey1, body=sentinel.body1,
+                                properties=bpmock.return_value, immediate=False, mandatory=False),
+                           call(exchange=sentinel.exchange, routing_key=sentinel.rkey2, body=sentinel.body2,
+                                properties=bpmock.return_value, immediate=False, mandatory=False)])
+
+    def _confirm(self, dtag, multiple=False, nack=False):
+        frame = Mock()
+        frame.method.delivery_tag = dtag
+        frame.method.multiple = multiple
+        frame.method.NAME = 'Basic.Nack' if nack else 'Basic.Ack'
+        self.tp._on_confirm(frame)
+
+    @patch('pyon.net.transport.BasicProperties', Mock())
+    def test_publish_impl_confirms(self):
+        self.tp._client.closing = None
+        self.tp.enable_confirms_impl(max_in_flight=2)
+        self.tp._sync_call.assert_called_once_with(self.tp._confirm_select, 'callback')
+
+        self.tp.publish_impl(sentinel.exchange, sentinel.routing_key, sentinel.body, sentinel.properties)
+        self.tp.publish_impl(sentinel.exchange, sentinel.routing_key, sentinel.body, sentinel.properties)
+        self.assertEquals(self.tp._unconfirmed, {1, 2})
+
+        # window full: third publish blocks until the broker confirms
+        gl = spawn(self.tp.publish_impl, sentinel.exchange, sentinel.routing_key, sentinel.body, sentinel.properties)
+        gl.join(timeout=0.1)
+        self.assertFalse(gl.ready())
+        self.assertEquals(self.tp._client.basic_publish.call_count, 2)
+
+        self._confirm(1)
+        gl.join(timeout=1)
+        self.assertTrue(gl.successful())
+        self.assertEquals(self.tp._unconfirmed, {2, 3})
+
+        self._confirm(3, multiple=True)
+        self.tp.wait_for_confirms_impl(timeout=1)
+
+    @patch('pyon.net.transport.BasicProperties', Mock())
+    def test_wait_for_confirms_impl_nack(self):
+        self.tp._client.closing = None
+        self.tp.enable_confirms_impl()
+
+        self.tp.publish_impl(sentinel.exchange, sentinel.routing_key, sentinel.body, sentinel.properties)
+        self.assertRaises(TransportError, self.tp.wait_for_confirms_impl, timeout=0.1)
+
+        self._confirm(1, nack=True)
+        self.assertRaises(TransportError, self.tp.wait_for_confirms_impl, timeout=1)
+
+        # reported once
+        self.tp.wait_for_confirms_impl(timeout=1)
+
+    def test_wait_for_confirms_impl_not_enabled(self):
+        self.assertRaises(TransportError, self.tp.wait_for_confirms_impl)
+
+@attr('UNIT')
+class TestAMQPTransportConfirms(PyonTestCase):
+    """
+    Publisher confirms against the pika channel state machine, with only the connection mocked.
+    """
+    def setUp(self):
+        self.conn = Mock()
+        self.conn.callbacks = CallbackManager()
+        self.ch = Channel(self.conn, 1)
+        self.ch.transport.closed = False
+        self.conn._send_method.reset_mock()     # Channel.Open
+        self.tp = AMQPTransport(self.ch)
+
+    def _deliver(self, method):
+        # what pika's Connection does with incoming method frames
+        self.conn.callbacks.process(1, method, self.conn, Method(1, method))
+
+    def _sent_methods(self):
+        return [c[0][1].NAME for c in self.conn._send_method.call_args_list]
+
+    def test_enable_confirms_impl(self):
+        gl = spawn(self.tp.enable_confirms_impl, max_in_flight=10)
+        gl.join(timeout=0.1)
+        self.assertFalse(gl.ready())
+        self.assertEquals(self._sent_methods(), ['Confirm.Select'])
+        self.assertFalse(self.conn._send_method.call_args[0][1].nowait)
+        self.assertEquals(self.ch.transport.blocking, 'Confirm.Select')
+
+        self._deliver(spec.Confirm.SelectOk())
+        gl.join(timeout=1)
+        self.assertTrue(gl.successful())
+        self.assertIsNone(self.ch.transport.blocking)
+
+        # the channel is not blocked: synchronous methods are sent right away
+        self.ch.exchange_declare(callback=lambda frame: None, exchange='ex')
+        self.assertEquals(self._sent_methods(), ['Confirm.Select', 'Exchange.Declare'])
+        self._deliver(spec.Exchange.DeclareOk())
+        self.assertIsNone(self.ch.transport.blocking)
+
+        self.tp.publish_impl('ex', 'rkey', 'body1', {})
+        self.tp.publish_impl('ex', 'rkey', 'body2', {})
+        self.tp.publish_impl('ex', 'rkey', 'body3', {})
+        self.assertEquals(self.tp._unconfirmed, {1, 2, 3})
+
+        self._deliver(spec.Basic.Nack(delivery_tag=1))
+        self._deliver(spec.Basic.Ack(delivery_tag=3, multiple=True))
+        self.assertEquals(self.tp._unconfirmed, set())
+        self.assertRaises(TransportError, self.tp.wait_for_confirms_impl, timeout=1)
+        self.tp.wait_for_confirms_impl(timeout=1)
+
+    def test_enable_confirms_impl_channel_closed(self):
+        gl = spawn(self.tp.enable_confirms_impl)
+        gl.join(timeout=0.1)
+        self._deliver(spec.Channel.Close(reply_code=406, reply_text='PRECONDITION_FAILED'))
+        gl.join(timeout=1)
+        self.assertIsInstance(gl.exception, TransportError)
+        self.assertIsNone(self.tp._confirm_max_in_flight)
+
 @attr('UNIT')
 class TestNameTrio(PyonTestCase):
     def test_init(self):
@@ -600,6 +725,74 @@ class TestTopicTrie(PyonTestCase):
         self.assertEquals({sentinel.wild},
                           set(self.tt.get_all_matches('a.b.b.b.b.b.b')))
 
+    def test_match_cache(self):
+        self.tt.add_topic_tree('a.*', sentinel.p1)
+        self.assertEquals({sentinel.p1}, self.tt.get_all_matches('a.b'))
+        self.assertIn('a.b', self.tt._cache)
+
+        # bind invalidates
+        self.tt.add_topic_tree('a.b', sentinel.p2)
+        self.assertNotIn('a.b', self.tt._cache)
+        self.assertEquals({sentinel.p1, sentinel.p2}, self.tt.get_all_matches('a.b'))
+
+        # unbind invalidates
+        self.tt.remove_topic_tree('a.*', sentinel.p1)
+        self.assertEquals({sentinel.p2}, self.tt.get_all_matches('a.b'))
+
+    def test_match_cache_lru(self):
+        tt = TopicTrie(cache_size=2)
+        tt.add_topic_tree('#', sentinel.p1)
+
+        tt.get_all_matches('a')
+        tt.get_all_matches('b')
+        tt.get_all_matches('a')
+        tt.get_all_matches('c')
+
+        self.assertEquals(['a', 'c'], tt._cache.keys())
+
+    def test_remove_topic_tree_prunes(self):
+        self.tt.add_topic_tree('a.b.c', sentinel.p1)
+        self.tt.add_topic_tree('a.b', sentinel.p2)
+
+        self.tt.remove_topic_tree('a.b.c', sentinel.p1)
+        self.assertEquals(self.tt.root.children['a'].children['b'].children, {})
+
+        self.tt.remove_topic_tree('a.b', sentinel.p2)
+        self.assertEquals(self.tt.root.children, {})
+
+    def test_remove_topic_tree_unknown(self):
+        self.tt.add_topic_tree('a.b', sentinel.p1)
+
+        self.tt.remove_topic_tree('a.c', sentinel.p1)
+        self.tt.remove_topic_tree('a.b', sentinel.p2)
+
+        self.assertNotIn('c', self.tt.root.children['a'].children)
+        self.assertEquals({sentinel.p1}, self.tt.get_all_matches('a.b'))
+
+    def test_perf_many_bindings(self):
+        # event-like bindings: origin specific, type wildcards and catch-alls
+        num_bindings = 5000
+        for i in xrange(num_bindings):
+            self.tt.add_topic_tree('ResourceEvent.Type%s.*.res%s' % (i % 50, i), 'q%s' % i)
+            self.tt.add_topic_tree('ResourceEvent.#.res%s' % i, 'qa%s' % i)
+        self.tt.add_topic_tree('#', 'qall')
+
+        rkeys = ['ResourceEvent.Type%s.sub.res%s' % (i % 50, i) for i in xrange(0, num_bindings, 50)]
+
+        t1 = time.time()
+        for rkey in rkeys:
+            self.tt._cache.clear()
+            self.assertEquals(3, len(self.tt.get_all_matches(rkey)))
+        t_match = time.time() - t1
+
+        t1 = time.time()
+        for i in xrange(10):
+            for rkey in rkeys:
+                self.assertEquals(3, len(self.tt.get_all_matches(rkey)))
+        t_cached = (time.time() - t1) / 10
+
+        log.info("TopicTrie %s bindings, %s rkeys: uncached %.4fs, cached %.4fs", num_bindings * 2 + 1, len(rkeys), t_match, t_cached)
+
 @attr('UNIT')
 class TestLocalRouter(PyonTestCase):
 
@@ -849,16 +1042,60 @@ class TestLocalRouter(PyonTestCase):
 
         self.assertEquals(cb.call_count, 1)
         self.assertEquals(cb.call_args[0][0], self.lr)
-        self.assertEquals(dict(cb.call_args[0][1]), {'consumer_tag': sentinel.ctag,
-                                                     'delivery_tag': sentinel.dtag,
-                                                     'redelivered': False,
-                                                     'exchange': sentinel.exchange,
-                                                     'routing_key': sentinel.routing_key})
-        self.assertEquals(dict(cb.call_args[0][2]), {'headers':sentinel.props})
+        method_frame = cb.call_args[0][1]
+        self.assertEquals(method_frame.consumer_tag, sentinel.ctag)
+        self.assertEquals(method_frame.delivery_tag, sentinel.dtag)
+        self.assertEquals(method_frame.redelivered, False)
+        self.assertEquals(method_frame.exchange, sentinel.exchange)
+        self.assertEquals(method_frame.routing_key, sentinel.routing_key)
+        self.assertEquals(cb.call_args[0][2].headers, sentinel.props)
         self.assertEquals(cb.call_args[0][3], sentinel.body)
 
         self.assertIn((sentinel.ctag, sentinel.queue, m), self.lr._unacked.itervalues())
 
+    def test_bind_and_delete_queue(self):
+        self.lr.declare_exchange('known')
+        self.lr.declare_queue('q1')
+        tt = self.lr._exchanges['known']
+
+        self.lr.bind('known', 'q1', 'a.b')
+        self.assertIs(self.lr._exchanges['known'], tt)
+        self.assertEquals(tt.get_all_matches('a.b'), {'q1'})
+
+        self.lr.delete_queue('q1')
+        self.assertEquals(tt.get_all_matches('a.b'), set())
+        self.assertEquals(tt.root.children, {})
+        self.assertNotIn('q1', self.lr._queues)
+
+    def test_perf_bind(self):
+        self.lr.declare_exchange('events')
+        num_bindings = 5000
+        t1 = time.time()
+        for i in xrange(num_bindings):
+            self.lr.declare_queue('q%s' % i)
+            self.lr.bind('events', 'q%s' % i, 'ResourceEvent.#.res%s' % i)
+        elapsed = time.time() - t1
+
+        self.assertEquals(self.lr._exchanges['events'].get_all_matches('ResourceEvent.UPDATE.res7'), {'q7'})
+        log.info("LocalRouter %s binds: %.4fs", num_bindings, elapsed)
+
+    def test_perf_route(self):
+        self.lr.declare_exchange('events')
+        for i in xrange(100):
+            self.lr.declare_queue('q%s' % i)
+            self.lr.bind('events', 'q%s' % i, 'ResourceEvent.*.res%s' % i)
+        self.lr.declare_queue('qall')
+        self.lr.bind('events', 'qall', '#')
+
+        num_msgs = 100000
+        t1 = time.time()
+        for i in xrange(num_msgs):
+            self.lr._oldroute('events', 'ResourceEvent.UPDATE.res%s' % (i % 100), 'body', {})
+        elapsed = time.time() - t1
+
+        self.assertEquals(self.lr._queues['qall'].qsize(), num_msgs)
+        log.info("LocalRouter routed %s messages in %.3fs: %.0f msg/s", num_msgs, elapsed, num_msgs / elapsed)
+
     def test__generate_ctag(self):
         self.lr._ctag_pool = Mock()
         self.lr._ctag_pool.get_id.return_value = sentinel.ctagid
@@ -893,6 +1130,14 @@ class TestLocalRouter(PyonTestCase):
         self.lr.ack(sentinel.dtag)
         self.assertEquals(len(self.lr._unacked), 0)
 
+    def test_ack_multiple(self):
+        for cnt in xrange(3):
+            self.lr._unacked[self.lr._generate_dtag("ctag1", cnt)] = ("ctag1", None, None)
+        self.lr._unacked[self.lr._generate_dtag("ctag2", 0)] = ("ctag2", None, None)
+
+        self.lr.ack(self.lr._generate_dtag("ctag1", 1), multiple=True)
+        self.assertEquals(sorted(self.lr._unacked), [self.lr._generate_dtag("ctag1", 2), self.lr._generate_dtag("ctag2", 0)])
+
     def test_reject(self):
         self.lr._unacked[sentinel.dtag] = (None, None, None)
 
@@ -968,7 +1213,7 @@ class TestLocalTransport(PyonTestCase):
         self.broker.publish.assert_called_once_with(sentinel.exchange, sentinel.routing_key, sentinel.body, sentinel.properties, immediate=False, mandatory=False)
         self.broker.start_consume.assert_called_once_with(sentinel.callback, sentinel.queue, no_ack=False, exclusive=False)
         self.broker.stop_consume.assert_called_once_with(sentinel.consumer_tag)
-        self.broker.ack.assert_called_once_with(sentinel.delivery_tag)
+        self.broker.ack.assert_called_once_with(sentinel.delivery_tag, multiple=False)
         self.broker.reject.assert_called_once_with(sentinel.delivery_tag, requeue=False)
         self.broker.get_stats(sentinel.queue)
         self.broker.purge(sentinel.queue)
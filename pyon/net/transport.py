@@ -11,7 +11,6 @@ __author__ = 'Dave Foster <dfoster@asascience.com>'
 
 
 from pyon.util.log import log
-from pyon.util.containers import DotDict
 from gevent.event import AsyncResult, Event
 from gevent.queue import Queue
 from gevent import coros, sleep
@@ -19,11 +18,11 @@ from gevent.timeout import Timeout
 from gevent.pool import Pool
 from contextlib import contextmanager
 import os
-from pika import BasicProperties
+from pika import BasicProperties, spec
 from pyon.util.async import spawn
 from pyon.util.pool import IDPool
 from uuid import uuid4
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 
 class TransportError(StandardError):
@@ -49,7 +48,7 @@ class BaseTransport(object):
     def unbind_impl(self, exchange, queue, binding):
         raise NotImplementedError()
 
-    def ack_impl(self, delivery_tag):
+    def ack_impl(self, delivery_tag, multiple=False):
         raise NotImplementedError()
 
     def reject_impl(self, delivery_tag, requeue=False):
@@ -76,6 +75,21 @@ class BaseTransport(object):
     def publish_impl(self, exchange, routing_key, body, properties, immediate=False, mandatory=False, durable_msg=False):
         raise NotImplementedError()
 
+    def publish_batch_impl(self, exchange, messages, immediate=False, mandatory=False, durable_msg=False):
+        """
+        Publishes several messages on an exchange.
+
+        @param  messages    A list of (routing_key, body, properties) tuples.
+        """
+        for routing_key, body, properties in messages:
+            self.publish_impl(exchange, routing_key, body, properties, immediate=immediate, mandatory=mandatory, durable_msg=durable_msg)
+
+    def enable_confirms_impl(self, max_in_flight=1000):
+        raise NotImplementedError()
+
+    def wait_for_confirms_impl(self, timeout=None):
+        raise NotImplementedError()
+
     def close(self):
         raise NotImplementedError()
 
@@ -104,6 +118,7 @@ class ComposableTransport(BaseTransport):
         - qos_impl
         - get_stats_impl
         - publish_impl      (solely for publish rates, not needed for identity in protocol)
+        - publish_batch_impl, enable_confirms_impl, wait_for_confirms_impl (go with publish_impl)
     """
     common_methods = ['ack_impl',
                       'reject_impl',
@@ -111,7 +126,10 @@ class ComposableTransport(BaseTransport):
                       'stop_consume_impl',
                       'qos_impl',
                       'get_stats_impl',
-                      'publish_impl']
+                      'publish_impl',
+                      'publish_batch_impl',
+                      'enable_confirms_impl',
+                      'wait_for_confirms_impl']
 
     def __init__(self, left, right, *methods):
         self._transports = [left]
@@ -132,7 +150,10 @@ class ComposableTransport(BaseTransport):
                           'get_stats_impl'       : left.get_stats_impl,
                           'purge_impl'           : left.purge_impl,
                           'qos_impl'             : left.qos_impl,
-                          'publish_impl'         : left.publish_impl, }
+                          'publish_impl'         : left.publish_impl,
+                          'publish_batch_impl'   : left.publish_batch_impl,
+                          'enable_confirms_impl' : left.enable_confirms_impl,
+                          'wait_for_confirms_impl': left.wait_for_confirms_impl, }
 
         if right is not None:
             self.overlay(right, *methods)
@@ -170,9 +191,9 @@ class ComposableTransport(BaseTransport):
         m = self._methods['unbind_impl']
         return m(exchange, queue, binding)
 
-    def ack_impl(self, delivery_tag):
+    def ack_impl(self, delivery_tag, multiple=False):
         m = self._methods['ack_impl']
-        return m(delivery_tag)
+        return m(delivery_tag, multiple=multiple)
 
     def reject_impl(self, delivery_tag, requeue=False):
         m = self._methods['reject_impl']
@@ -206,6 +227,18 @@ class ComposableTransport(BaseTransport):
         m = self._methods['publish_impl']
         return m(exchange, routing_key, body, properties, immediate=immediate, mandatory=mandatory, durable_msg=durable_msg)
 
+    def publish_batch_impl(self, exchange, messages, immediate=False, mandatory=False, durable_msg=False):
+        m = self._methods['publish_batch_impl']
+        return m(exchange, messages, immediate=immediate, mandatory=mandatory, durable_msg=durable_msg)
+
+    def enable_confirms_impl(self, max_in_flight=1000):
+        m = self._methods['enable_confirms_impl']
+        return m(max_in_flight=max_in_flight)
+
+    def wait_for_confirms_impl(self, timeout=None):
+        m = self._methods['wait_for_confirms_impl']
+        return m(timeout=timeout)
+
     def close(self):
         for t in self._transports:
             t.close()
@@ -241,6 +274,13 @@ class AMQPTransport(BaseTransport):
         self._close_callbacks = []
         self.lock = False
 
+        # Publisher confirm state, see enable_confirms_impl
+        self._confirm_max_in_flight = None      # None means confirms not enabled
+        self._confirm_seq = 0                   # delivery tag of last published message
+        self._unconfirmed = set()               # delivery tags of published but unconfirmed messages
+        self._nacked = 0                        # number of messages nacked by the broker, not yet reported
+        self._confirm_event = Event()
+
     def _on_underlying_close(self, code, text):
         if not (code == 0 or code == 200):
             log.error("AMQPTransport.underlying closed:\n\tchannel number: %s\n\tcode: %d\n\ttext: %s", self.channel_number, code, text)
@@ -255,6 +295,9 @@ class AMQPTransport(BaseTransport):
         self._client.callbacks.remove(self._client.channel_number, 'Channel.Close')
         self._client.callbacks.remove(self._client.channel_number, '_on_basic_deliver')
         self._client.callbacks.remove(self._client.channel_number, '_on_basic_get')
+        if self._confirm_max_in_flight is not None:
+            self._client.callbacks.remove(self._client.channel_number, 'Basic.Ack')
+            self._client.callbacks.remove(self._client.channel_number, 'Basic.Nack')
 
         # uncomment these lines to see the full callback list that Pika maintains
         #stro = pprint.pformat(callbacks._callbacks)
@@ -263,6 +306,9 @@ class AMQPTransport(BaseTransport):
         for cb in self._close_callbacks:
             cb(self, code, text)
 
+        # wake up publishers waiting for confirms, they will notice the channel is gone
+        self._confirm_event.set()
+
     @property
     def active(self):
         if self._client is not None:
@@ -384,12 +430,12 @@ class AMQPTransport(BaseTransport):
                                                      exchange=exchange,
                                                      routing_key=binding)
 
-    def ack_impl(self, delivery_tag):
+    def ack_impl(self, delivery_tag, multiple=False):
         """
-        Acks a message.
+        Acks a message, or with multiple, all unacked messages up to and including delivery_tag.
         """
         #log.debug("AMQPTransport.ack(%s): %s", self._client.channel_number, delivery_tag)
-        self._client.basic_ack(delivery_tag)
+        self._client.basic_ack(delivery_tag, multiple=multiple)
 
     def reject_impl(self, delivery_tag, requeue=False):
         """
@@ -481,6 +527,11 @@ class AMQPTransport(BaseTransport):
         props = BasicProperties(headers=properties,
                                 delivery_mode=delivery_mode)
 
+        if self._confirm_max_in_flight is not None:
+            self._wait_confirms(self._confirm_max_in_flight - 1)
+            self._confirm_seq += 1
+            self._unconfirmed.add(self._confirm_seq)
+
         self._client.basic_publish(exchange=exchange,       # todo
                                    routing_key=routing_key, # todo
                                    body=body,
@@ -488,6 +539,83 @@ class AMQPTransport(BaseTransport):
                                    immediate=immediate,     # todo
                                    mandatory=mandatory)     # todo
 
+    def enable_confirms_impl(self, max_in_flight=1000):
+        """
+        Puts the channel into publisher confirm mode.
+
+        At most max_in_flight published messages may be unconfirmed by the broker at any time; publish_impl
+        blocks until the broker catches up. Messages the broker rejects (nacks) raise a TransportError
+        on a subsequent publish_impl or wait_for_confirms_impl.
+        """
+        if self._confirm_max_in_flight is not None:
+            self._confirm_max_in_flight = max_in_flight
+            return
+
+        log.debug("AMQPTransport.enable_confirms_impl(%s): max in flight %s", self._client.channel_number, max_in_flight)
+        self._sync_call(self._confirm_select, 'callback')
+        self._confirm_max_in_flight = max_in_flight
+
+    def _confirm_select(self, callback):
+        """
+        Sends Confirm.Select and calls callback when the broker replies with Confirm.SelectOk.
+
+        PIKA BUG: v0.9.5 blocks the channel after a synchronous method until its reply arrives, even with
+        nowait (then no reply comes and all later RPCs on the channel queue up forever), and confirm_delivery
+        only registers the callback for Basic.Ack. We wait for SelectOk and register Basic.Nack ourselves.
+        """
+        self._client.callbacks.add(self._client.channel_number, spec.Confirm.SelectOk, callback)
+        self._client.callbacks.add(self._client.channel_number, spec.Basic.Nack, self._on_confirm, False)
+        self._client.confirm_delivery(callback=self._on_confirm)
+
+    def wait_for_confirms_impl(self, timeout=None):
+        """
+        Blocks until the broker confirmed all messages published so far.
+
+        @raises TransportError  If the broker nacked messages, the channel closed or the timeout hit.
+        """
+        if self._confirm_max_in_flight is None:
+            raise TransportError("Publisher confirms are not enabled on this channel")
+
+        self._wait_confirms(0, timeout=timeout)
+
+    def _on_confirm(self, frame):
+        """
+        Callback for Basic.Ack and Basic.Nack frames of publisher confirms.
+        """
+        method = frame.method
+        if method.multiple:
+            confirmed = set(dtag for dtag in self._unconfirmed if dtag <= method.delivery_tag)
+        else:
+            confirmed = self._unconfirmed & {method.delivery_tag}
+
+        self._unconfirmed -= confirmed
+        if method.NAME == 'Basic.Nack':
+            self._nacked += len(confirmed)
+
+        self._confirm_event.set()
+
+    def _wait_confirms(self, max_unconfirmed, timeout=None):
+        """
+        Waits until at most max_unconfirmed published messages are unconfirmed.
+        """
+        timer = Timeout(timeout)
+        try:
+            with timer:
+                while len(self._unconfirmed) > max_unconfirmed:
+                    if not self.active:
+                        raise TransportError("Channel closed with %d messages unconfirmed" % len(self._unconfirmed))
+
+                    self._confirm_event.clear()
+                    self._confirm_event.wait()
+        except Timeout as t:
+            if t is not timer:
+                raise
+            raise TransportError("Timed out waiting for publisher confirms (%d messages unconfirmed)" % len(self._unconfirmed))
+
+        if self._nacked:
+            nacked, self._nacked = self._nacked, 0
+            raise TransportError("Broker rejected (nack) %d published messages" % nacked)
+
 
 class NameTrio(object):
     """
@@ -537,12 +665,17 @@ class TopicTrie(object):
     Used for events/pubsub in our system with the local transport. Efficiently stores all registered
     subscription topic trees in a trie structure, handling wildcards * and #.
 
+    Match results are memoized per routing key in a small LRU cache, as routing keys (e.g. event topics)
+    repeat heavily. Any add or remove of a topic tree invalidates the cache.
+
     See:
         http://www.zeromq.org/whitepapers:message-matching      (doesn't handle # so scrapped)
         http://www.rabbitmq.com/blog/2010/09/14/very-fast-and-scalable-topic-routing-part-1/
         http://www.rabbitmq.com/blog/2011/03/28/very-fast-and-scalable-topic-routing-part-2/
     """
 
+    DEFAULT_CACHE_SIZE = 1024
+
     class Node(object):
         """
         Internal node of a trie.
@@ -569,49 +702,62 @@ class TopicTrie(object):
 
             return new_node
 
-        def get_all_matches(self, topics):
+        def is_empty(self):
+            return not self.patterns and not self.children
+
+        def get_all_matches(self, topics, start=0):
             """
-            Given a list of topic tokens, returns all patterns stored in child nodes/self that match the topic tokens.
+            Given a list of topic tokens, returns a set of all patterns stored in child nodes/self that match
+            the topic tokens from position start on.
 
             This is a depth-first search pruned by token, with special handling for both wildcard types.
+            It walks an explicit stack of (node, token index) pairs, so no token sublists or intermediate
+            result lists are created.
             """
-            results = []
-
-            if len(topics) == 0:
-                # terminal point, return any pattern we have here
-                return self.patterns
-
-            cur_token = topics[0]
-            rem_tokens = topics[1:]     # will always be a list, even if empty or 1-len
-            #log.debug('get_all_matches(%s): cur_token %s, rem_tokens %s', self.token, cur_token, rem_tokens)
-
-            # child node direct matching
-            if cur_token in self.children:
-                results.extend(self.children[cur_token].get_all_matches(rem_tokens))
-
-            # now '*' wildcard
-            if '*' in self.children:
-                results.extend(self.children['*'].get_all_matches(rem_tokens))
-
-            # '#' means any number of tokens - naive method of descent, we'll feed it nothing to start. Then chop the full
-            # topics all the way down, put the results in a set to remove duplicates, and also any patterns on self.
-            if '#' in self.children:
-                # keep popping off and descend, make a set out of results
-                all_wild_childs = set()
-                for i in xrange(len(topics)):
-                    res = self.children['#'].get_all_matches(topics[i:])
-                    map(all_wild_childs.add, res)
-
-                results.extend(all_wild_childs)
-                results.extend(self.children['#'].patterns)     # any patterns defined in # are legal too
+            results = set()
+            num_topics = len(topics)
+            stack = [(self, start)]
+            pop, push = stack.pop, stack.append
+
+            while stack:
+                node, idx = pop()
+
+                if idx == num_topics:
+                    # terminal point, take any pattern we have here
+                    if node.patterns:
+                        results.update(node.patterns)
+                    continue
+
+                children = node.children
+
+                # child node direct matching
+                child = children.get(topics[idx])
+                if child is not None:
+                    push((child, idx + 1))
+
+                # now '*' wildcard
+                child = children.get('*')
+                if child is not None:
+                    push((child, idx + 1))
+
+                # '#' means any number of tokens - descend once for every remaining suffix (including the empty
+                # one, which yields any patterns defined on # itself)
+                child = children.get('#')
+                if child is not None:
+                    for i in xrange(idx, num_topics + 1):
+                        push((child, i))
 
             return results
 
-    def __init__(self):
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
         """
         Creates a dummy root node that all topic trees hang off of.
+
+        @param  cache_size  Max number of routing keys to memoize match results for. 0 disables the cache.
         """
         self.root = self.Node(None)
+        self._cache_size = cache_size
+        self._cache = OrderedDict()         # topic tree -> frozenset of patterns, in LRU order
 
     def add_topic_tree(self, topic_tree, pattern):
         """
@@ -628,32 +774,57 @@ class TopicTrie(object):
 
         if not pattern in curnode.patterns:
             curnode.patterns.append(pattern)
+            self._cache.clear()
 
     def remove_topic_tree(self, topic_tree, pattern):
         """
         Splits a string topic_tree into tokens (by .) and removes the pattern from the terminal node.
 
-        @TODO should remove empty nodes
+        Nodes left without patterns or children are pruned from the trie.
         """
         topics = topic_tree.split(".")
 
+        path = [self.root]
         curnode = self.root
 
         for topic in topics:
-            curnode = curnode.get_or_create_child(topic)
+            curnode = curnode.children.get(topic)
+            if curnode is None:
+                return
+            path.append(curnode)
+
+        if pattern not in curnode.patterns:
+            return
+
+        curnode.patterns.remove(pattern)
+        self._cache.clear()
 
-        if pattern in curnode.patterns:
-            curnode.patterns.remove(pattern)
+        # prune empty nodes bottom up, never the root
+        for i in xrange(len(path) - 1, 0, -1):
+            node = path[i]
+            if not node.is_empty():
+                break
+            del path[i - 1].children[node.token]
 
     def get_all_matches(self, topic_tree):
         """
-        Returns a list of all matches for a given topic tree string.
+        Returns a set of all matches for a given topic tree string.
 
-        Creates a set out of the matching patterns, so multiple binds matching on the same pattern only
-        return once.
+        Multiple binds matching on the same pattern only return once. The result is a frozenset shared
+        with the routing cache, so it must not be modified by the caller.
         """
-        topics = topic_tree.split(".")
-        return set(self.root.get_all_matches(topics))
+        cache = self._cache
+        matches = cache.pop(topic_tree, None)
+        if matches is None:
+            matches = frozenset(self.root.get_all_matches(topic_tree.split(".")))
+            if not self._cache_size:
+                return matches
+            if len(cache) >= self._cache_size:
+                cache.popitem(last=False)
+
+        # (re)insert as most recently used
+        cache[topic_tree] = matches
+        return matches
 
 class LocalRouter(object):
     """
@@ -669,15 +840,39 @@ class LocalRouter(object):
         """
         pass
 
+    class MethodFrame(object):
+        """
+        Lightweight stand-in for a pika Basic.Deliver method frame.
+        """
+        __slots__ = ('consumer_tag', 'delivery_tag', 'redelivered', 'exchange', 'routing_key')
+
+        def __init__(self, consumer_tag, delivery_tag, redelivered, exchange, routing_key):
+            self.consumer_tag = consumer_tag
+            self.delivery_tag = delivery_tag
+            self.redelivered = redelivered
+            self.exchange = exchange
+            self.routing_key = routing_key
+
+    class HeaderFrame(object):
+        """
+        Lightweight stand-in for a pika header frame.
+        """
+        __slots__ = ('headers',)
+
+        def __init__(self, headers):
+            self.headers = headers
+
     def __init__(self, sysname):
         self._sysname = sysname
         self.ready = Event()
 
         # exchange/queues/bindings
-        self._exchanges = {}                            # names -> { subscriber, topictrie(queue name) }
+        # Changes to the routing table (_exchanges and _queues) never yield to other greenlets, so routing
+        # always sees a consistent table and needs no lock. Writers are serialized by _lock_declarables.
+        self._exchanges = {}                            # names -> topictrie(queue name)
         self._queues = {}                               # names -> gevent queue
         self._bindings_by_queue = defaultdict(list)     # queue name -> [(ex, binding)]
-        self._lock_declarables = coros.RLock()          # exchanges, queues, bindings, routing method
+        self._lock_declarables = coros.RLock()          # serializes writers of exchanges, queues, bindings
 
         # consumers
         self._consumers = defaultdict(list)             # queue name -> [ctag, channel._on_deliver]
@@ -720,8 +915,7 @@ class LocalRouter(object):
         while True:
             ex, rkey, body, props = self._queue_incoming.get()
             try:
-                with self._lock_declarables:
-                    self._route(ex, rkey, body, props)
+                self._route(ex, rkey, body, props)
             except Exception as e:
                 self.errors.append(e)
                 log.exception("Routing message")
@@ -730,18 +924,18 @@ class LocalRouter(object):
         """
         Delivers incoming messages into queues based on known routes.
 
-        This entire method runs in a lock (likely pretty slow).
+        Does not yield until all matched queues have the message, so no lock is needed.
         """
-        assert exchange in self._exchanges, "Unknown exchange %s" % exchange
+        exchanges, queues = self._exchanges, self._queues
+        assert exchange in exchanges, "Unknown exchange %s" % exchange
 
-        queues = self._exchanges[exchange].get_all_matches(routing_key)
-        log.debug("route: ex %s, rkey %s,  matched %s routes", exchange, routing_key, len(queues))
+        matches = exchanges[exchange].get_all_matches(routing_key)
+        #log.debug("route: ex %s, rkey %s,  matched %s routes", exchange, routing_key, len(matches))
 
         # deliver to each queue
-        for q in queues:
-            assert q in self._queues
-            log.debug("deliver -> %s", q)
-            self._queues[q].put((exchange, routing_key, body, props))
+        msg = (exchange, routing_key, body, props)
+        for q in matches:
+            queues[q].put(msg)
 
     def _child_failed(self, gproc):
         """
@@ -795,13 +989,13 @@ class LocalRouter(object):
     def delete_queue(self, queue, **kwargs):
         with self._lock_declarables:
             if queue in self._queues:
-                del self._queues[queue]
-
                 # kill bindings
                 for ex, binding in self._bindings_by_queue[queue]:
                     if ex in self._exchanges:
                         self._exchanges[ex].remove_topic_tree(binding, queue)
 
+                del self._queues[queue]
+
                 self._bindings_by_queue.pop(queue)
 
     def bind(self, exchange, queue, binding):
@@ -810,9 +1004,7 @@ class LocalRouter(object):
             assert exchange in self._exchanges, "Missing exchange %s in list of exchanges" % str(exchange)
             assert queue in self._queues
 
-            tt = self._exchanges[exchange]
-
-            tt.add_topic_tree(binding, queue)
+            self._exchanges[exchange].add_topic_tree(binding, queue)
             self._bindings_by_queue[queue].append((exchange, binding))
 
     def unbind(self, exchange, queue, binding):
@@ -873,17 +1065,6 @@ class LocalRouter(object):
                 break
             exchange, routing_key, body, props = m
 
-            # create method frame
-            method_frame = DotDict()
-            method_frame['consumer_tag']    = ctag
-            method_frame['redelivered']     = False     # @TODO
-            method_frame['exchange']        = exchange
-            method_frame['routing_key']     = routing_key
-
-            # create header frame
-            header_frame = DotDict()
-            header_frame['headers'] = props.copy()
-
             # make delivery tag for ack/reject later
             dtag = self._generate_dtag(ctag, cnt)
             cnt += 1
@@ -891,7 +1072,9 @@ class LocalRouter(object):
             with self._lock_unacked:
                 self._unacked[dtag] = (ctag, queue_name, m)
 
-            method_frame['delivery_tag'] = dtag
+            # create method and header frames
+            method_frame = self.MethodFrame(ctag, dtag, False, exchange, routing_key)     # @TODO redelivered
+            header_frame = self.HeaderFrame(props.copy())
 
             # deliver to callback
             try:
@@ -913,11 +1096,18 @@ class LocalRouter(object):
         """
         return "%s-%s" % (ctag, cnt)
 
-    def ack(self, delivery_tag):
+    def ack(self, delivery_tag, multiple=False):
         assert delivery_tag in self._unacked
 
         with self._lock_unacked:
-            del self._unacked[delivery_tag]
+            if multiple:
+                # all unacked messages of the same consumer up to delivery_tag, see _generate_dtag
+                ctag, cnt = delivery_tag.rsplit("-", 1)
+                cnt = int(cnt)
+                for dtag in [dt for dt, (uctag, _, _) in self._unacked.iteritems() if uctag == ctag and int(dt.rsplit("-", 1)[1]) <= cnt]:
+                    del self._unacked[dtag]
+            else:
+                del self._unacked[delivery_tag]
 
     def reject(self, delivery_tag, requeue=False):
         assert delivery_tag in self._unacked
@@ -989,14 +1179,23 @@ class LocalTransport(BaseTransport):
     def publish_impl(self, exchange, routing_key, body, properties, immediate=False, mandatory=False, durable_msg=False):
         self._broker.publish(exchange, routing_key, body, properties, immediate=immediate, mandatory=mandatory)
 
+    def enable_confirms_impl(self, max_in_flight=1000):
+        """
+        The in process broker does not drop published messages, so there is nothing to confirm.
+        """
+        pass
+
+    def wait_for_confirms_impl(self, timeout=None):
+        pass
+
     def start_consume_impl(self, callback, queue, no_ack=False, exclusive=False):
         return self._broker.start_consume(callback, queue, no_ack=no_ack, exclusive=exclusive)
 
     def stop_consume_impl(self, consumer_tag):
         self._broker.stop_consume(consumer_tag)
 
-    def ack_impl(self, delivery_tag):
-        self._broker.ack(delivery_tag)
+    def ack_impl(self, delivery_tag, multiple=False):
+        self._broker.ack(delivery_tag, multiple=multiple)
 
     def reject_impl(self, delivery_tag, requeue=False):
         self._broker.reject(delivery_tag, requeue=requeue)
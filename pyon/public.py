@@ -27,8 +27,8 @@ __all__ += ['DataStore']
 from pyon.datastore.datastore_query import DatastoreQueryBuilder, DQ
 __all__ += ['DatastoreQueryBuilder', 'DQ']
 
-from pyon.ion.process import IonProcessThreadManager, SimpleProcess, StandaloneProcess, ImmediateProcess, get_ion_actor_id
-__all__ += ['IonProcessThreadManager', 'SimpleProcess', 'StandaloneProcess', 'ImmediateProcess', 'get_ion_actor_id']
+from pyon.ion.process import IonProcessThreadManager, SimpleProcess, StandaloneProcess, ImmediateProcess, get_ion_actor_id, cpu_bound
+__all__ += ['IonProcessThreadManager', 'SimpleProcess', 'StandaloneProcess', 'ImmediateProcess', 'get_ion_actor_id', 'cpu_bound']
 
 from pyon.ion.endpoint import ProcessRPCClient, ProcessRPCServer, ProcessSubscriber, ProcessPublisher
 __all__ += ['ProcessRPCClient', 'ProcessRPCServer', 'ProcessSubscriber', 'ProcessPublisher']
@@ -54,6 +54,9 @@ __all__ += ['StreamProcess']
 from pyon.net import messaging, channel, endpoint
 __all__ += ['messaging', 'channel', 'endpoint']
 
+from pyon.net.endpoint import gather
+__all__ += ['gather']
+
 from pyon.util.async import spawn, switch
 __all__ += ['spawn', 'switch']
 
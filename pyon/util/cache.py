@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""In-memory LRU cache with time-to-live expiration and hit/miss statistics"""
+
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache(object):
+    """
+    A bounded mapping that evicts the least recently used entries beyond max_size and expires entries
+    older than ttl seconds (ttl=0 means no expiration). Keeps counts of hits, misses and evictions.
+    Not thread safe, but safe to use from greenlets since no operation yields.
+    """
+
+    def __init__(self, max_size=1000, ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()       # key -> (value, expiry time)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key, None)
+        return entry is not None and not (entry[1] and entry[1] < time.time())
+
+    def get(self, key, default=None, count=True):
+        """
+        Returns the cached value for key or default if not present or expired.
+        Moves the entry to the most recently used position.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[1] and entry[1] < time.time():
+            entry = None
+        if entry is None:
+            if count:
+                self.misses += 1
+            return default
+
+        self._entries[key] = entry
+        if count:
+            self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Adds or replaces the value for key, evicting the least recently used entries beyond max_size.
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.time() + self.ttl if self.ttl else 0)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        """
+        Removes the entry for key. Returns its value or default.
+        """
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def clear(self):
+        self._entries.clear()
+
+    def keys(self):
+        return self._entries.keys()
+
+    def get_stats(self):
+        """
+        Returns a dict with the cache size and hit/miss/eviction counts.
+        """
+        lookups = self.hits + self.misses
+        return dict(size=len(self._entries), max_size=self.max_size, ttl=self.ttl,
+                    hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    hit_rate=float(self.hits) / lookups if lookups else 0.0)
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
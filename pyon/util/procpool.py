@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""Pool of worker OS processes to run CPU-bound functions without blocking the gevent hub"""
+
+import multiprocessing
+import traceback
+import msgpack
+
+from pyon.core.exception import ContainerError, IonException
+from pyon.util.async import ThreadPool
+from pyon.util.containers import named_any
+from pyon.util.log import log
+from pyon.util.threading import Queue
+
+# Set in the worker processes. Functions marked for offload run inline there instead of re-offloading.
+_in_worker = False
+
+
+def get_call_target(func):
+    """
+    Returns a serializable reference to a function that can be resolved in a worker process.
+
+    Supports module level functions and bound/unbound methods of classes importable by module and name.
+    For methods, the worker calls the function on a blank instance of the class without any state.
+    """
+    im_class = getattr(func, 'im_class', None)
+    if im_class is not None:
+        return ("m", "%s.%s" % (im_class.__module__, im_class.__name__), func.__name__)
+    return ("f", "%s.%s" % (func.__module__, func.__name__))
+
+
+def resolve_call_target(target):
+    """
+    Returns a callable for a call target reference returned by get_call_target.
+    """
+    if target[0] == "m":
+        clazz = named_any(target[1])
+        instance = clazz.__new__(clazz)
+        return getattr(instance, target[2])
+    return named_any(target[1])
+
+
+def _encode(obj):
+    from pyon.core.interceptor.encode import encode_ion_raw
+    return msgpack.packb(obj, default=encode_ion_raw)
+
+
+def _decode(data):
+    from pyon.core.interceptor.encode import decode_ion
+    return msgpack.unpackb(data, object_hook=decode_ion, use_list=1)
+
+
+def _run_worker(conn):
+    """
+    Main loop of a worker process: receives encoded calls, executes them and sends back the encoded result
+    or error. Exits on EOF or an empty message.
+    """
+    global _in_worker
+    _in_worker = True
+
+    while True:
+        try:
+            data = conn.recv_bytes()
+        except (EOFError, IOError):
+            break
+        if not data:
+            break
+
+        try:
+            target, args, kwargs = _decode(data)
+            func = resolve_call_target(target)
+            result = _encode((True, func(*args, **kwargs)))
+        except Exception as ex:
+            exc_type = "%s.%s" % (ex.__class__.__module__, ex.__class__.__name__)
+            result = _encode((False, (exc_type, str(ex), traceback.format_exc())))
+
+        conn.send_bytes(result)
+
+    conn.close()
+
+
+def _raise_worker_error(exc_type, exc_msg, exc_tb):
+    """
+    Raises the exception reported by a worker in the calling greenlet. IonExceptions and builtin exceptions are
+    re-raised with their type, anything else becomes a ContainerError.
+    """
+    log.debug("Worker process call failed:\n%s", exc_tb)
+    try:
+        exc_class = named_any(exc_type.replace("exceptions.", "__builtin__.", 1))
+    except Exception:
+        exc_class = None
+
+    exc = None
+    if isinstance(exc_class, type) and issubclass(exc_class, (IonException, StandardError)):
+        try:
+            exc = exc_class(exc_msg)
+        except Exception:
+            pass
+    raise exc or ContainerError("%s: %s" % (exc_type, exc_msg))
+
+
+class ProcessPool(object):
+    """
+    A pool of forked worker processes to run CPU-bound functions on all cores.
+
+    Calls are encoded with msgpack and the ION object hooks (IonObjects, numpy arrays), sent to an idle worker
+    and waited for in a thread of a ThreadPool, so only the calling greenlet blocks, not the gevent hub.
+    Numpy arrays arrive as read-only arrays on both sides.
+
+    Functions must be importable by module and name in the worker. Because the workers are forked when the pool
+    starts, they see the code and configuration of the container but not later state changes.
+    """
+
+    def __init__(self, poolsize=None):
+        self.poolsize = poolsize or multiprocessing.cpu_count()
+        self._idle = Queue()            # real thread queue of idle worker connections
+        self._workers = []
+        for i in xrange(self.poolsize):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_run_worker, args=(child_conn,), name="ion-worker-%s" % i)
+            worker.daemon = True
+            worker.start()
+            child_conn.close()
+            self._workers.append((worker, parent_conn))
+            self._idle.put(parent_conn)
+
+        self._thread_pool = ThreadPool(self.poolsize)
+        self.active = True
+        log.debug("ProcessPool started with %s worker processes", self.poolsize)
+
+    def _call_worker(self, data):
+        """
+        Runs in a pool thread: sends the encoded call to the next idle worker and waits for its result.
+        """
+        conn = self._idle.get()
+        try:
+            conn.send_bytes(data)
+            return conn.recv_bytes()
+        finally:
+            self._idle.put(conn)
+
+    def apply_async(self, func, *args, **kwargs):
+        """
+        Runs func with the given args in a worker process.
+        Returns an AsyncResult that is set with the encoded result.
+        """
+        assert self.active, "Process pool is closed"
+
+        data = _encode((get_call_target(func), args, kwargs))
+        return self._thread_pool.apply_async(self._call_worker, data)
+
+    def apply(self, func, *args, **kwargs):
+        """
+        Runs func with the given args in a worker process, blocking only the current greenlet until the result
+        is ready. Exceptions raised by func are raised here.
+        """
+        success, value = _decode(self.apply_async(func, *args, **kwargs).get())
+        if not success:
+            _raise_worker_error(*value)
+        return value
+
+    def close(self):
+        """
+        Stops all worker processes and pool threads.
+        """
+        if not self.active:
+            return
+        self.active = False
+
+        for worker, conn in self._workers:
+            try:
+                conn.send_bytes("")
+                conn.close()
+            except Exception:
+                pass
+        for worker, conn in self._workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+        self._thread_pool.close()
+        log.debug("ProcessPool closed")
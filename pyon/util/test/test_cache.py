@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+from pyon.util.cache import LRUTTLCache
+from pyon.util.unit_test import PyonTestCase
+from nose.plugins.attrib import attr
+from mock import patch
+
+
+@attr('UNIT')
+class TestLRUTTLCache(PyonTestCase):
+
+    def test_get_put(self):
+        cache = LRUTTLCache(max_size=10)
+        self.assertEquals(cache.get("a"), None)
+        self.assertEquals(cache.get("a", "default"), "default")
+
+        cache.put("a", 1)
+        cache.put("b", 0)
+        self.assertEquals(cache.get("a"), 1)
+        self.assertEquals(cache.get("b"), 0)
+        self.assertIn("b", cache)
+        self.assertEquals(len(cache), 2)
+
+        self.assertEquals(cache.pop("a"), 1)
+        self.assertEquals(cache.pop("a"), None)
+        self.assertNotIn("a", cache)
+
+        stats = cache.get_stats()
+        self.assertEquals(stats["hits"], 2)
+        self.assertEquals(stats["misses"], 2)
+        self.assertEquals(stats["size"], 1)
+        self.assertEquals(stats["hit_rate"], 0.5)
+
+        cache.clear()
+        self.assertEquals(len(cache), 0)
+        cache.reset_stats()
+        self.assertEquals(cache.get_stats()["hits"], 0)
+
+    def test_lru_eviction(self):
+        cache = LRUTTLCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEquals(sorted(cache.keys()), ["a", "c"])
+        self.assertEquals(cache.get_stats()["evictions"], 1)
+
+    @patch('pyon.util.cache.time')
+    def test_ttl(self, time_mock):
+        time_mock.time.return_value = 1000.0
+        cache = LRUTTLCache(max_size=10, ttl=5)
+        cache.put("a", 1)
+
+        time_mock.time.return_value = 1004.0
+        self.assertEquals(cache.get("a"), 1)
+
+        time_mock.time.return_value = 1006.0
+        self.assertNotIn("a", cache)
+        self.assertEquals(cache.get("a"), None)
+        self.assertEquals(len(cache), 0)
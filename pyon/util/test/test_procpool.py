@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+from pyon.util.procpool import ProcessPool, get_call_target, resolve_call_target
+from pyon.util.unit_test import PyonTestCase
+from pyon.core.exception import BadRequest, ContainerError
+from nose.plugins.attrib import attr
+import numpy as np
+import os
+
+
+def square_sum(values, offset=0):
+    return float(np.sum(np.square(values))) + offset
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def fail(exc_class):
+    if exc_class == 'badrequest':
+        raise BadRequest("bad arg")
+    elif exc_class == 'value':
+        raise ValueError("bad value")
+
+    class LocalError(Exception):
+        pass
+    raise LocalError("local")
+
+
+class Cruncher(object):
+    def scale(self, values, factor):
+        return values * factor
+
+
+@attr('UNIT')
+class ProcessPoolTest(PyonTestCase):
+
+    def setUp(self):
+        self.pool = ProcessPool(2)
+        self.addCleanup(self.pool.close)
+
+    def test_call_target(self):
+        self.assertEquals(resolve_call_target(get_call_target(square_sum)), square_sum)
+
+        meth = resolve_call_target(get_call_target(Cruncher().scale))
+        self.assertIsInstance(meth.im_self, Cruncher)
+        self.assertEquals(meth.__name__, 'scale')
+
+    def test_apply(self):
+        values = np.arange(1000, dtype='float64')
+        self.assertEquals(self.pool.apply(square_sum, values, offset=1), float(np.sum(values * values)) + 1)
+
+        res = self.pool.apply(Cruncher().scale, values, 2)
+        self.assertTrue((res == values * 2).all())
+
+        self.assertNotEquals(self.pool.apply(worker_pid), os.getpid())
+
+    def test_apply_errors(self):
+        self.assertRaises(BadRequest, self.pool.apply, fail, 'badrequest')
+        self.assertRaises(ValueError, self.pool.apply, fail, 'value')
+        self.assertRaises(ContainerError, self.pool.apply, fail, 'local')
+
+        # pool is still usable
+        self.assertEquals(self.pool.apply(square_sum, [1, 2]), 5.0)
+
+    def test_close(self):
+        self.pool.close()
+        self.assertFalse(self.pool.active)
+        for worker, _ in self.pool._workers:
+            self.assertFalse(worker.is_alive())
@@ -80,6 +80,14 @@ def main():
     print "generate_interfaces: Generating service interfaces from service definitions..."
     exitcode = service_object.generate(opts)
 
+    if not exitcode and not opts.dryrun:
+        print "generate_interfaces: Building registry snapshot..."
+        try:
+            from pyon.core.registry_snapshot import build_snapshot_file
+            build_snapshot_file()
+        except Exception as ex:
+            print "generate_interfaces: Registry snapshot not built (containers start without it): %s" % ex
+
     print "generate_interfaces: Completed with exit code:" , exitcode
     sys.exit(exitcode)
 